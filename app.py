@@ -1,8 +1,13 @@
+# Optional cold-start report (STARTUP_REPORT=1); starts before the other imports so they are timed
+from utils.startup import start_import_timing, log_startup_report
+start_import_timing()
+
+import hmac
 import logging
 import os
 import datetime
 import traceback
-from flask import Flask, render_template, redirect, url_for, session, request, send_from_directory
+from flask import Flask, render_template, redirect, url_for, session, request, send_from_directory, abort
 from flask_sqlalchemy import SQLAlchemy
 from config import config
 from models import db
@@ -60,6 +65,10 @@ def create_app(config_name='default'):
     # Initialize extensions
     db.init_app(app)
     
+    # Bump the analysis data version whenever patients or estimates change
+    from utils.data_version import init_data_version_tracking
+    init_data_version_tracking()
+    
     # Run database setup on Render deployments
     if is_render:
         with app.app_context():
@@ -74,7 +83,14 @@ def create_app(config_name='default'):
     # Register blueprints
     app.register_blueprint(auth)
     app.register_blueprint(main)
-    
+
+    @app.cli.command('rebuild-aggregates')
+    def rebuild_aggregates_command():
+        """Recompute the estimate aggregate table from scratch."""
+        from utils.aggregates import rebuild_aggregates
+        rows = rebuild_aggregates()
+        print(f"Rebuilt estimate aggregates ({rows} rows)")
+
     # Initialize Flask-Talisman for security headers and HTTPS
     # Define Content Security Policy
     supabase_url = os.environ.get('SUPABASE_URL', '').replace('https://', '')
@@ -125,6 +141,25 @@ def create_app(config_name='default'):
     def health_check():
         return {'status': 'healthy', 'timestamp': str(datetime.datetime.utcnow())}
     
+    @app.route('/health/ready')
+    def readiness_check():
+        """Readiness: 503 unless the database and storage probes (cached briefly) succeed."""
+        from utils.health import readiness
+        ready, report = readiness()
+        return report, 200 if ready else 503
+    
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics for this worker; disabled (404) unless METRICS_TOKEN is set."""
+        token = os.environ.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+            return {'error': 'Unauthorized'}, 401
+        from utils.metrics import collect_metrics
+        return collect_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    
     @app.route('/debug/csrf')
     def debug_csrf():
         from routes import generate_csrf_token
@@ -204,16 +239,14 @@ def create_app(config_name='default'):
         app.logger.error(traceback.format_exc())
         return f"Internal Server Error (500): {e}", 500
 
-    # Log every request to see headers (Temporary for debugging)
-    @app.before_request
-    def log_request_info():
-        # Skip logging for static files
-        if request.path.startswith('/static'):
-            return
-        app.logger.info(f"Request: {request.method} {request.url}")
-        app.logger.info(f"Scheme: {request.scheme}")
-        app.logger.info(f"Remote Addr: {request.remote_addr}")
-        app.logger.info(f"X-Forwarded-Proto: {request.headers.get('X-Forwarded-Proto')}")
+    # One structured log line per request with timing, SQL query count/time and bytes sent
+    from utils.instrumentation import init_request_instrumentation
+    init_request_instrumentation(app)
+
+    # Count connection pool waits and timeouts from the start (reported by /metrics)
+    with app.app_context():
+        from utils.metrics import instrument_pool
+        instrument_pool(db.engine.pool)
 
     return app
 
@@ -224,4 +257,5 @@ if __name__ == '__main__':
     app.run(host='0.0.0.0', port=port)  # Removed debug=True for production
 
 # Application factory for gunicorn
-app = create_app()
\ No newline at end of file
+app = create_app()
+log_startup_report()
\ No newline at end of file
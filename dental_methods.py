@@ -195,4 +195,255 @@ def calculate_alqahtani_age(stages, sex):
         return estimated_age, error_margin
     except Exception as e:
         logger.error(f"Error calculating AlQahtani age: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+# --- Batch scoring -----------------------------------------------------------
+#
+# The functions below score many patients at once with NumPy lookup arrays.
+# They return exactly what the scalar functions above return for each patient
+# (same summation order, same rounding), so results can be compared directly.
+
+DEMIRJIAN_STAGES = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+
+ALQAHATNI_STAGE_VALUES = {
+    'I': 1, 'II': 2, 'III': 3, 'IV': 4, 'V': 5,
+    'VI': 6, 'VII': 7, 'VIII': 8, 'IX': 9, 'X': 10,
+    'XI': 11, 'XII': 12, 'XIII': 13
+}
+
+# Step between entries of the Demirjian conversion tables
+DEMIRJIAN_CONVERSION_STEP = 0.05
+
+_batch_tables = {}
+
+def _get_batch_tables():
+    """
+    Build (once) the NumPy lookup arrays used by the batch functions.
+    
+    Returns:
+        dict: Score matrix, conversion arrays and stage value array.
+    """
+    if not _batch_tables:
+        import numpy as np
+        
+        # Row per tooth, column per stage; the extra last column (missing or
+        # unknown stage) scores 0 like the scalar function
+        scores = np.zeros((len(DEMIRJIAN_TEETH), len(DEMIRJIAN_STAGES) + 1))
+        for i, tooth in enumerate(DEMIRJIAN_TEETH):
+            for j, stage in enumerate(DEMIRJIAN_STAGES):
+                scores[i, j] = DEMIRJIAN_SCORES[tooth][stage]
+        
+        # Conversion tables indexed by round(score / 0.05)
+        male = np.array([DEMIRJIAN_MALE_CONVERSION[k] for k in sorted(DEMIRJIAN_MALE_CONVERSION)])
+        female = np.array([DEMIRJIAN_FEMALE_CONVERSION[k] for k in sorted(DEMIRJIAN_FEMALE_CONVERSION)])
+        
+        # Index 0 marks a missing or unknown stage
+        stage_values = np.zeros(len(ALQAHATNI_STAGE_VALUES) + 1)
+        for stage, value in ALQAHATNI_STAGE_VALUES.items():
+            stage_values[value] = value
+        
+        _batch_tables.update(
+            demirjian_scores=scores,
+            male_conversion=male,
+            female_conversion=female,
+            alqahtani_values=stage_values
+        )
+    return _batch_tables
+
+def _stage_index_matrix(stages, teeth, stage_index, missing):
+    """
+    Convert stage codes for many patients into an integer index matrix.
+    
+    Args:
+        stages: A sequence of dicts (tooth code -> stage, as taken by the
+            scalar functions), a 2-D array-like of stage codes with one
+            column per tooth in the order of teeth, or a packed uint8
+            matrix from packed_stage_matrix.
+        teeth (list): Tooth codes of the method, in column order.
+        stage_index (dict): Stage code -> index in the lookup array.
+        missing (int): Index used for missing or unknown stages.
+        
+    Returns:
+        numpy.ndarray: Integer array of shape (patients, len(teeth)).
+    """
+    import numpy as np
+    
+    if len(stages) == 0:
+        return np.full((0, len(teeth)), missing, dtype=np.intp)
+    
+    if isinstance(stages, np.ndarray) and stages.dtype == np.uint8:
+        # Packed matrix (packed_stage_matrix): value n is the n-th stage code,
+        # which is also the order of stage_index for both methods
+        if stages.ndim != 2 or stages.shape[1] != len(teeth):
+            raise ValueError(f"Expected one column per tooth ({len(teeth)}), got shape {stages.shape}")
+        lookup = np.full(256, missing, dtype=np.intp)
+        lookup[1:len(stage_index) + 1] = list(stage_index.values())
+        return lookup[stages]
+    
+    if isinstance(stages[0], dict):
+        stages = [[s.get(tooth) for tooth in teeth] for s in stages]
+    codes = np.asarray(stages, dtype=object)
+    if codes.ndim != 2 or codes.shape[1] != len(teeth):
+        raise ValueError(f"Expected one column per tooth ({len(teeth)}), got shape {codes.shape}")
+    
+    # Look up each distinct code once, then broadcast back to the matrix
+    keys = np.array([code if isinstance(code, str) else '' for code in codes.ravel()])
+    unique_codes, inverse = np.unique(keys, return_inverse=True)
+    lookup = np.array([stage_index.get(code, missing) for code in unique_codes], dtype=np.intp)
+    return lookup[inverse].reshape(codes.shape)
+
+def calculate_demirjian_scores(stages, sexes):
+    """
+    Calculate Demirjian maturity scores and estimated ages for many patients.
+    
+    Equivalent to calling calculate_demirjian_score for each patient, but the
+    per-tooth scores come from a lookup matrix and the age from a direct
+    index into the 0.05-step conversion table.
+    
+    Args:
+        stages: Sequence of stage dicts, a 2-D array of stage codes with
+            one column per tooth in DEMIRJIAN_TEETH order, or a packed
+            matrix from packed_stage_matrix.
+        sexes: Sequence of sexes ('male' selects the male table, anything
+            else the female table, as in the scalar function).
+        
+    Returns:
+        tuple: (total_scores, estimated_ages, error_margins) as NumPy arrays.
+    """
+    import numpy as np
+    
+    tables = _get_batch_tables()
+    missing = len(DEMIRJIAN_STAGES)
+    index = _stage_index_matrix(stages, DEMIRJIAN_TEETH, {s: i for i, s in enumerate(DEMIRJIAN_STAGES)}, missing)
+    if len(sexes) != index.shape[0]:
+        raise ValueError("stages and sexes must have the same length")
+    
+    # Add tooth by tooth to keep the scalar function's summation order
+    per_tooth = tables['demirjian_scores'][np.arange(len(DEMIRJIAN_TEETH)), index]
+    total_scores = np.zeros(index.shape[0])
+    for column in range(per_tooth.shape[1]):
+        total_scores += per_tooth[:, column]
+    
+    # Round to nearest 0.05; the rounded score is then an exact table key,
+    # and scores beyond the table map to its last entry
+    steps = np.rint(total_scores * 20)
+    male_table = tables['male_conversion']
+    table_index = np.clip(steps, 0, len(male_table) - 1).astype(np.intp)
+    
+    is_male = np.array([(sex or '').lower() == 'male' for sex in sexes], dtype=bool)
+    estimated_ages = np.where(is_male, male_table[table_index], tables['female_conversion'][table_index])
+    
+    # Error margin is typically ±0.5 years for this method
+    error_margins = np.full(index.shape[0], 0.5)
+    
+    logger.info(f"Demirjian batch calculation - {index.shape[0]} patients")
+    
+    return total_scores, estimated_ages, error_margins
+
+def calculate_alqahtani_ages(stages, sexes=None):
+    """
+    Calculate AlQahtani dental age estimates for many patients.
+    
+    Equivalent to calling calculate_alqahtani_age for each patient. Patients
+    without any valid stage (where the scalar function raises ValueError)
+    get NaN.
+    
+    Args:
+        stages: Sequence of stage dicts, a 2-D array of stage codes with
+            one column per tooth in ALQAHATNI_TEETH order, or a packed
+            matrix from packed_stage_matrix.
+        sexes: Unused; accepted for symmetry with calculate_demirjian_scores.
+        
+    Returns:
+        tuple: (estimated_ages, error_margins) as NumPy arrays.
+    """
+    import numpy as np
+    
+    tables = _get_batch_tables()
+    index = _stage_index_matrix(stages, ALQAHATNI_TEETH, ALQAHATNI_STAGE_VALUES, 0)
+    
+    values = tables['alqahtani_values'][index]
+    counts = np.count_nonzero(index, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_stage_values = values.sum(axis=1) / counts
+    
+    # Convert average stage to approximate age (simplified, as in the scalar function)
+    estimated_ages = np.where(counts > 0, 4 + (avg_stage_values * 0.8), np.nan)
+    
+    # Error margin is typically ±1.0 years for this method
+    error_margins = np.full(index.shape[0], 1.0)
+    
+    logger.info(f"AlQahtani batch calculation - {index.shape[0]} patients")
+    
+    return estimated_ages, error_margins
+
+# --- Packed stage storage ----------------------------------------------------
+#
+# Stored stages use one byte per tooth, in the method's tooth order: 0 for a
+# missing or unknown stage, otherwise the stage's 1-based position in
+# PACKED_STAGE_CODES (I..XIII -> 1..13 for AlQahtani, A..H -> 1..8 for
+# Demirjian). A packed stage matrix can be passed straight to the batch
+# functions above.
+
+PACKED_STAGE_TEETH = {
+    'alqahtani': ALQAHATNI_TEETH,
+    'demirjian': DEMIRJIAN_TEETH
+}
+
+PACKED_STAGE_CODES = {
+    'alqahtani': list(ALQAHATNI_STAGE_VALUES),
+    'demirjian': DEMIRJIAN_STAGES
+}
+
+def pack_stages(stages, method):
+    """
+    Encode a patient's stages as bytes for storage.
+    
+    Args:
+        stages (dict): Dictionary mapping tooth codes to developmental stages.
+        method (str): 'alqahtani' or 'demirjian'.
+        
+    Returns:
+        bytes: One byte per tooth of the method.
+    """
+    codes = {code: i + 1 for i, code in enumerate(PACKED_STAGE_CODES[method])}
+    return bytes(codes.get(stages.get(tooth), 0) for tooth in PACKED_STAGE_TEETH[method])
+
+def unpack_stages(packed, method):
+    """
+    Decode stored stages back into the dictionary taken by the scalar functions.
+    
+    Args:
+        packed (bytes): Value produced by pack_stages (None gives no stages).
+        method (str): 'alqahtani' or 'demirjian'.
+        
+    Returns:
+        dict: Tooth code -> stage, for the teeth with a known stage.
+    """
+    codes = PACKED_STAGE_CODES[method]
+    return {
+        tooth: codes[value - 1]
+        for tooth, value in zip(PACKED_STAGE_TEETH[method], packed or b'')
+        if 0 < value <= len(codes)
+    }
+
+def packed_stage_matrix(packed_values, method):
+    """
+    Stack stored stages of many patients into a matrix for batch scoring.
+    
+    Args:
+        packed_values: Sequence of values produced by pack_stages; None or
+            empty values count as all stages missing.
+        method (str): 'alqahtani' or 'demirjian'.
+        
+    Returns:
+        numpy.ndarray: uint8 array of shape (patients, teeth of the method).
+    """
+    import numpy as np
+    
+    width = len(PACKED_STAGE_TEETH[method])
+    blank = bytes(width)
+    data = b''.join(bytes(value) if value else blank for value in packed_values)
+    if len(data) != width * len(packed_values):
+        raise ValueError(f"Packed {method} stages must be {width} bytes each")
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(packed_values), width)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Load test: drive the real Flask app with concurrent virtual users.
+
+By default everything runs locally and nothing touches Supabase:
+
+1. storage_stub.StorageStub serves the storage API in memory,
+2. the app is created against a fresh SQLite file (or --database-url, e.g. a
+   local Postgres) and seeded with --patients patients with OPG paths,
+3. the app is served by werkzeug's threaded server on a free port,
+4. --users virtual users log in (one supervisor and one PI session each) and
+   request a weighted mix of pages for --duration seconds.
+
+Per action it reports request count, errors, requests per second and
+p50/p95/p99/max latency; --json writes the same figures to a file so runs
+can be compared.
+
+The client threads share the interpreter with the server, so absolute
+throughput is lower than under gunicorn. To measure a production-like
+server, start it yourself (pointing SUPABASE_URL at `python storage_stub.py`)
+and pass --base-url with --codes-from (the database the server uses, for
+the codes the PI users estimate).
+
+Examples:
+    python load_test.py --users 8 --duration 30
+    python load_test.py --database-url postgresql://localhost/dental_load --patients 5000
+    python load_test.py --mix patients=1,estimate=1 --storage-latency 40
+    python load_test.py --base-url http://127.0.0.1:5001 --codes-from postgresql://localhost/dental_load
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+import requests
+
+# action -> relative weight in the request mix
+DEFAULT_MIX = {
+    'patients': 30,        # GET /patients (some pages, some searches)
+    'estimate_page': 15,   # GET /estimate_age
+    'estimate': 30,        # POST /estimate_age
+    'analysis': 10,        # GET /analysis plus the charts' /api/analysis
+    'export': 1,           # GET /export_patients (full Excel export)
+}
+
+# Statuses counted as success per action (the estimate POST redirects back)
+EXPECTED_STATUS = {'estimate': (302,), 'login': (302,)}
+
+# Actions made before the timed run; reported, but left out of the totals
+SETUP_ACTIONS = ('login_page', 'login')
+
+_CSRF_RE = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Results:
+    """Latency samples and error counts per action, shared by all users."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, action, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(action, []).append(seconds)
+            if not ok:
+                self.errors[action] = self.errors.get(action, 0) + 1
+
+    def summary(self, elapsed):
+        rows = {}
+        everything = []
+        with self.lock:
+            for action, samples in sorted(self.samples.items()):
+                if action not in SETUP_ACTIONS:
+                    everything.extend(samples)
+                rows[action] = self._row(sorted(samples), self.errors.get(action, 0), elapsed)
+            errors = sum(count for action, count in self.errors.items() if action not in SETUP_ACTIONS)
+            rows['total'] = self._row(sorted(everything), errors, elapsed)
+        return rows
+
+    @staticmethod
+    def _row(samples, errors, elapsed):
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 1),
+            'max_ms': round((samples[-1] if samples else 0.0) * 1000, 1),
+        }
+
+
+class VirtualUser(threading.Thread):
+    """Holds a supervisor and a PI session and requests random actions until the deadline."""
+
+    def __init__(self, number, base_url, mix, codes, results, seed):
+        super().__init__(name=f'user-{number}', daemon=True)
+        self.base_url = base_url
+        self.actions, self.weights = zip(*mix.items())
+        self.codes = codes
+        self.results = results
+        self.deadline = None  # set when all users have logged in
+        self.random = random.Random(seed + number)
+        self.sessions = {}
+        self.tokens = {}
+
+    def _request(self, action, role, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.sessions[role].request(method, self.base_url + path, allow_redirects=False, timeout=120, **kwargs)
+            response.content  # include the full download in the timing
+            # A redirect to /login means the session was rejected
+            ok = (response.status_code in EXPECTED_STATUS.get(action, (200,))
+                  and not response.headers.get('Location', '').endswith('/login'))
+        except requests.RequestException:
+            response, ok = None, False
+        self.results.record(action, time.perf_counter() - started, ok)
+        return response
+
+    def login(self, role):
+        self.sessions[role] = requests.Session()
+        page = self._request('login_page', role, 'GET', '/login')
+        match = _CSRF_RE.search(page.text) if page is not None else None
+        if not match:
+            raise RuntimeError(f"No CSRF token on the login page (status {page.status_code if page is not None else 'n/a'})")
+        self.tokens[role] = match.group(1)
+        # The built-in supervisor/pi accounts are created on first login
+        self._request('login', role, 'POST', '/login', data={
+            'username': role, 'password': role, 'csrf_token': self.tokens[role],
+        })
+
+    def patients(self):
+        if self.random.random() < 0.25:
+            params = {'search': self.random.choice(self.codes)[0][:4]}
+        else:
+            params = {'page': self.random.randint(1, 5)}
+        self._request('patients', 'supervisor', 'GET', '/patients', params=params)
+
+    def estimate_page(self):
+        self._request('estimate_page', 'pi', 'GET', '/estimate_age')
+
+    def estimate(self):
+        code, method = self.random.choice(self.codes)
+        self._request('estimate', 'pi', 'POST', '/estimate_age', data={
+            'csrf_token': self.tokens['pi'],
+            'code': code,
+            'method': method,
+            'estimated_age': round(self.random.uniform(5, 18), 2),
+        })
+
+    def analysis(self):
+        self._request('analysis', 'supervisor', 'GET', '/analysis')
+        self._request('analysis_api', 'supervisor', 'GET', '/api/analysis')
+
+    def export(self):
+        self._request('export', 'supervisor', 'GET', '/export_patients')
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            action = self.random.choices(self.actions, self.weights)[0]
+            getattr(self, action)()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown action '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def configure_environment(database_url, storage_url):
+    """Point the app at the local database and storage stub before it is imported."""
+    # Set every variable config.py and utils/storage.py read, so a .env file
+    # (loaded by the app without overriding) cannot point the run at production
+    os.environ['SUPABASE_DB_URL'] = database_url
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['SUPABASE_URL'] = storage_url
+    os.environ['SUPABASE_KEY'] = 'load-test'
+    os.environ['SUPABASE_SERVICE_KEY'] = 'load-test'
+    os.environ['FLASK_ENV'] = 'production'
+    for name in ('RENDER', 'VERCEL'):
+        os.environ.pop(name, None)
+
+
+def seed_patients(app, count, seed):
+    """Create the tables and, if empty, add count coded patients with OPG paths."""
+    from models import db, Patient
+
+    with app.app_context():
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            db.create_all()
+        else:
+            # Same tables, migrations and indexes as a deployment
+            from setup_db import init_db
+            init_db(app)
+
+        if Patient.query.count() == 0:
+            rng = random.Random(seed)
+            for start in range(1, count + 1, 1000):
+                db.session.add_all([
+                    Patient(
+                        patient_id=str(i),
+                        name=f'Load Test {i}',
+                        actual_age=round(rng.uniform(5, 18), 2),
+                        sex=rng.choice(('male', 'female')),
+                        code_a=f'LA{i:06d}',
+                        code_b=f'LD{i:06d}',
+                        opg_link=f'load-test/opg_{i}.jpg',
+                    )
+                    for i in range(start, min(start + 1000, count + 1))
+                ])
+                db.session.commit()
+        return [(code, method) for patient_code_a, patient_code_b in
+                db.session.query(Patient.code_a, Patient.code_b).filter(Patient.code_a.isnot(None)).all()
+                for code, method in ((patient_code_a, 'alqahtani'), (patient_code_b, 'demirjian'))
+                if code]
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='app-server', daemon=True).start()
+    return server
+
+
+def print_report(summary, elapsed, users):
+    print(f"\n{users} users, {elapsed:.1f}s")
+    print(f"{'action':<14}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for action, row in summary.items():
+        print(f"{action:<14}{row['requests']:>9}{row['errors']:>8}{row['rps']:>9.2f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dental age estimation app')
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run after login')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='action weights, e.g. patients=30,estimate=30,analysis=10,export=1')
+    parser.add_argument('--patients', type=int, default=2000, help='patients to seed into an empty database')
+    parser.add_argument('--database-url', help='database to use (default: a new SQLite file)')
+    parser.add_argument('--storage-latency', type=float, default=0.0, help='milliseconds added to each storage call')
+    parser.add_argument('--base-url', help='test an already running server instead of starting one')
+    parser.add_argument('--codes-from', help='with --base-url: database URL to read patient codes from')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for data and request order')
+    parser.add_argument('--json', help='also write the summary to this file')
+    args = parser.parse_args()
+
+    stub = None
+    if args.base_url:
+        base_url = args.base_url.rstrip('/')
+        if not args.codes_from:
+            parser.error('--base-url needs --codes-from so the PI users have codes to estimate')
+        from sqlalchemy import create_engine, text
+        with create_engine(args.codes_from).connect() as conn:
+            rows = conn.execute(text('SELECT code_a, code_b FROM patient WHERE code_a IS NOT NULL')).all()
+        codes = [(code, method) for row in rows for code, method in zip(row, ('alqahtani', 'demirjian')) if code]
+    else:
+        from storage_stub import StorageStub
+        stub = StorageStub(latency=args.storage_latency / 1000).start()
+        database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='load_test_')}/load_test.db"
+        configure_environment(database_url, stub.url)
+
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import logging
+        from app import create_app
+        app = create_app('production')
+        # Keep per-request logging out of the report
+        for name in (None, 'request', 'werkzeug', app.logger.name):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+        codes = seed_patients(app, args.patients, args.seed)
+        server = start_server(app)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        print(f"App on {base_url}, storage stub on {stub.url}, database {database_url.split('@')[-1]}")
+
+    if not codes:
+        sys.exit('No patient codes to estimate; seed the database first')
+
+    results = Results()
+    users = [VirtualUser(n, base_url, args.mix, codes, results, args.seed) for n in range(args.users)]
+    # Log in one user at a time: the first login creates the accounts
+    for user in users:
+        user.login('supervisor')
+        user.login('pi')
+    deadline = time.monotonic() + args.duration
+    started = time.monotonic()
+    for user in users:
+        user.deadline = deadline
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - started
+
+    summary = results.summary(elapsed)
+    print_report(summary, elapsed, args.users)
+    if stub:
+        print(f"Storage stub served {stub.requests} requests")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'users': args.users, 'duration': elapsed, 'mix': args.mix, 'actions': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -52,48 +52,133 @@ class Patient(db.Model):
         return f'<Patient {self.patient_id}>'
 
 class EstimationEntry(db.Model):
+    __table_args__ = (
+        db.Index('idx_estimation_entry_patient_slot', 'patient_pk', 'code_slot'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(50), nullable=False)  # Either code_a or code_b
     estimated_age = db.Column(db.Float, nullable=False)
     method_used = db.Column(db.String(20), nullable=False)  # 'alqahtani' or 'demirjian'
     
-    # Tooth development stages
-    # AlQahtani method teeth (permanent and primary)
-    tooth_21_stage = db.Column(db.String(10), nullable=True)
-    tooth_22_stage = db.Column(db.String(10), nullable=True)
-    tooth_23_stage = db.Column(db.String(10), nullable=True)
-    tooth_24_stage = db.Column(db.String(10), nullable=True)
-    tooth_25_stage = db.Column(db.String(10), nullable=True)
-    tooth_26_stage = db.Column(db.String(10), nullable=True)
-    tooth_27_stage = db.Column(db.String(10), nullable=True)
-    tooth_31_stage = db.Column(db.String(10), nullable=True)
-    tooth_32_stage = db.Column(db.String(10), nullable=True)
-    tooth_33_stage = db.Column(db.String(10), nullable=True)
-    tooth_34_stage = db.Column(db.String(10), nullable=True)
-    tooth_35_stage = db.Column(db.String(10), nullable=True)
-    tooth_36_stage = db.Column(db.String(10), nullable=True)
-    tooth_37_stage = db.Column(db.String(10), nullable=True)
-    tooth_61_stage = db.Column(db.String(10), nullable=True)
-    tooth_62_stage = db.Column(db.String(10), nullable=True)
-    tooth_63_stage = db.Column(db.String(10), nullable=True)
-    tooth_64_stage = db.Column(db.String(10), nullable=True)
-    tooth_65_stage = db.Column(db.String(10), nullable=True)
-    tooth_71_stage = db.Column(db.String(10), nullable=True)
-    tooth_72_stage = db.Column(db.String(10), nullable=True)
-    tooth_73_stage = db.Column(db.String(10), nullable=True)
-    tooth_74_stage = db.Column(db.String(10), nullable=True)
-    tooth_75_stage = db.Column(db.String(10), nullable=True)
-    
-    # Demirjian method teeth (permanent mandibular)
-    tooth_31_demirjian = db.Column(db.String(5), nullable=True)
-    tooth_32_demirjian = db.Column(db.String(5), nullable=True)
-    tooth_33_demirjian = db.Column(db.String(5), nullable=True)
-    tooth_34_demirjian = db.Column(db.String(5), nullable=True)
-    tooth_35_demirjian = db.Column(db.String(5), nullable=True)
-    tooth_36_demirjian = db.Column(db.String(5), nullable=True)
-    tooth_37_demirjian = db.Column(db.String(5), nullable=True)
+    # Patient the blinded code belongs to, resolved on the server when the entry is created
+    # (patient.id, not the participant label patient.patient_id); NULL if no patient has the code
+    patient_pk = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'), nullable=True)
+    
+    # Which of the patient's codes was estimated: 'a' (code_a, AlQahtani) or 'b' (code_b, Demirjian)
+    code_slot = db.Column(db.String(1), nullable=True)
+    
+    patient = db.relationship('Patient')
+    
+    # Tooth development stages, one byte per tooth (see dental_methods.pack_stages)
+    # AlQahtani: ALQAHATNI_TEETH order (permanent and primary); Demirjian: DEMIRJIAN_TEETH order
+    alqahtani_stages = db.Column(db.LargeBinary(24), nullable=True)
+    demirjian_stages = db.Column(db.LargeBinary(7), nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    def get_stages(self, method):
+        """Stages for 'alqahtani' or 'demirjian' as a tooth code -> stage dict"""
+        from dental_methods import unpack_stages
+        return unpack_stages(getattr(self, f'{method}_stages'), method)
+    
+    def set_stages(self, method, stages):
+        """Store a tooth code -> stage dict for 'alqahtani' or 'demirjian'"""
+        from dental_methods import pack_stages
+        setattr(self, f'{method}_stages', pack_stages(stages, method) if stages else None)
+    
+    @classmethod
+    def stage_matrix(cls, method, query=None):
+        """
+        Load stored stages of many entries for batch scoring.
+        
+        Only the id and packed stage columns are read.
+        
+        Args:
+            method (str): 'alqahtani' or 'demirjian'.
+            query: Optional query of EstimationEntry rows to restrict to.
+            
+        Returns:
+            tuple: (ids, matrix) where matrix is a dental_methods.packed_stage_matrix.
+        """
+        from dental_methods import packed_stage_matrix
+        column = getattr(cls, f'{method}_stages')
+        query = cls.query if query is None else query
+        rows = query.with_entities(cls.id, column).filter(column.isnot(None)).order_by(cls.id).all()
+        return [row[0] for row in rows], packed_stage_matrix([row[1] for row in rows], method)
+    
+    def __repr__(self):
+        return f'<EstimationEntry {self.code}>'
+
+class OpgThumbnail(db.Model):
+    # Derivative store for OPG thumbnails (see utils/thumbnails.py)
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Storage object path of the original OPG (or the full URL for external links)
+    object_path = db.Column(db.String(500), unique=True, nullable=False, index=True)
+    
+    # SHA-256 of the original image bytes; part of the thumbnail key
+    content_hash = db.Column(db.String(64), nullable=False)
+    
+    # Storage object path of the JPEG thumbnail
+    thumb_path = db.Column(db.String(500), nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OpgThumbnail {self.object_path}>'
+
+class ExportJob(db.Model):
+    # Background Excel export job (see utils/export_jobs.py)
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'complete' or 'failed'
+    requested_by = db.Column(db.Integer, nullable=True)
+    
+    # Progress counters reported by the status endpoint
+    rows_total = db.Column(db.Integer, default=0)
+    rows_done = db.Column(db.Integer, default=0)
+    images_done = db.Column(db.Integer, default=0)
+    
+    # Location of the finished workbook on disk
+    file_path = db.Column(db.String(500), nullable=True)
+    file_size = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.status}>'
+
+class DataVersion(db.Model):
+    # Change counter for a group of tables (see utils/data_version.py)
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+class CacheEntry(db.Model):
+    # Shared cache for computed results such as analysis charts (see utils/cache.py)
+    key = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.Text, nullable=False)  # JSON-encoded
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def __repr__(self):
+        return f'<CacheEntry {self.key}>'
+
+class EstimateAggregate(db.Model):
+    # Running totals of estimates per method and actual-age band (see utils/aggregates.py)
+    method = db.Column(db.String(20), primary_key=True)  # 'alqahtani' or 'demirjian'
+    age_band = db.Column(db.Integer, primary_key=True)  # Whole years of actual age; -1 when no patient matches
+    
+    count = db.Column(db.Integer, nullable=False, default=0)
+    error_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of absolute errors
+    error_sq_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of squared errors
+    
     def __repr__(self):
-        return f'<EstimationEntry {self.code}>'
\ No newline at end of file
+        return f'<EstimateAggregate {self.method} {self.age_band}: {self.count}>'
@@ -1,8 +1,9 @@
-from flask import Blueprint, request, render_template, redirect, url_for, flash, session, Response, current_app, send_from_directory, send_file, abort
-from models import db, Patient, EstimationEntry
+from flask import Blueprint, request, render_template, redirect, url_for, flash, session, Response, current_app, send_from_directory, send_file, abort, g, make_response
+from models import db, Patient, EstimationEntry, ExportJob
 from dental_methods import calculate_demirjian_score, calculate_alqahtani_age, get_alqahtani_teeth, get_demirjian_teeth
 from functools import wraps
-from sqlalchemy import cast
+from contextlib import contextmanager
+from sqlalchemy import cast, text, func
 import random
 import string
 import csv
@@ -10,20 +11,7 @@ from io import StringIO, BytesIO
 import os
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-import concurrent.futures
-# Add openpyxl imports for Excel generation and reading
-from openpyxl import Workbook, load_workbook
-import openpyxl
-from openpyxl.drawing.image import Image as ExcelImage
-from openpyxl.utils import get_column_letter
-from PIL import Image as PILImage
-# Add matplotlib for chart generation
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import base64
 from io import BytesIO
-import numpy as np
 import logging
 import datetime
 
@@ -36,9 +24,8 @@ except:
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
-# Simple in-memory cache for charts (in production, use Redis or similar)
-chart_cache = {}
-
+# Analysis chart data lives in the shared cache (utils/cache.py), keyed by the
+# analysis data version, so every worker reuses it until patients or estimates change.
 # Cache timeout in seconds (e.g., 1 hour)
 CHART_CACHE_TIMEOUT = 3600
 
@@ -81,6 +68,23 @@ def inject_csrf_token():
     """Inject CSRF token into all templates"""
     return dict(csrf_token=generate_csrf_token())
 
+def prefetch_opg_urls(opg_links):
+    """Sign the OPGs shown on a page with one storage call; templates read them via opg_url()"""
+    from utils.storage import opg_display_urls
+    links = [link for link in opg_links if link and link not in g.get('opg_urls', {})]
+    if links:
+        g.opg_urls = {**g.get('opg_urls', {}), **opg_display_urls(links)}
+
+@main.context_processor
+def inject_opg_url():
+    """Expose opg_url() so templates can turn Patient.opg_link into a browser URL"""
+    def opg_url(opg_link):
+        if not opg_link:
+            return opg_link
+        prefetch_opg_urls([opg_link])
+        return g.opg_urls.get(opg_link, opg_link)
+    return dict(opg_url=opg_url)
+
 def validate_csrf_token():
     """Validate CSRF token for POST requests"""
     token = session.get('csrf_token')
@@ -134,42 +138,76 @@ def dashboard():
     else:
         # Calculate counts for PI dashboard
         data_rows_count = Patient.query.count()
-        estimation_count = EstimationEntry.query.count()
+        from utils.aggregates import method_stats
+        estimation_count = sum(stats['count'] for stats in method_stats().values())
         return render_template('pi_dashboard.html', 
                              data_rows_count=data_rows_count, 
                              estimation_count=estimation_count)
 
+# Park rows whose sequential number changes under a temporary ID, then assign the
+# final one. patient_id is UNIQUE and checked row by row, so assigning the final
+# values directly could collide with a row that has not been moved yet.
+# Rows whose ID is already correct are never touched.
+RENUMBER_PARK_SQL = text("""
+    UPDATE patient SET patient_id = 'TEMP_' || CAST(patient.id AS VARCHAR(50))
+    FROM (SELECT id, CAST(ROW_NUMBER() OVER (ORDER BY id) AS VARCHAR(50)) AS new_id FROM patient) AS numbered
+    WHERE patient.id = numbered.id AND patient.patient_id <> numbered.new_id
+""")
+RENUMBER_ASSIGN_SQL = text("""
+    UPDATE patient SET patient_id = numbered.new_id
+    FROM (SELECT id, CAST(ROW_NUMBER() OVER (ORDER BY id) AS VARCHAR(50)) AS new_id FROM patient) AS numbered
+    WHERE patient.id = numbered.id AND patient.patient_id <> numbered.new_id
+""")
+
 def renumber_patient_ids():
-    """Renumber patient IDs sequentially starting from 1"""
-    patients = Patient.query.order_by(Patient.id).all()
-    
-    # First, assign temporary IDs to avoid unique constraint violations
-    for i, patient in enumerate(patients, 1):
-        # Assign a temporary ID that won't conflict
-        patient.patient_id = f"TEMP_{patient.id}"
-    db.session.flush()  # Flush to database but don't commit yet
-    
-    # Then assign the final sequential IDs
-    for i, patient in enumerate(patients, 1):
-        # Check if patient_id is in format "T<number>" or just a number
-        if patient.patient_id.startswith('T') and not patient.patient_id.startswith('TEMP_'):
-            # Update T-prefixed IDs to be sequential
-            patient.patient_id = f"T{i}"
-        elif patient.patient_id.startswith('TEMP_'):
-            # This is a patient that had a numeric ID before
-            # Update numeric IDs to be sequential
-            patient.patient_id = str(i)
-        else:
-            # Check if it's a pure number
-            try:
-                # Try to convert to int to check if it's a pure number
-                int(patient.patient_id)
-                patient.patient_id = str(i)
-            except ValueError:
-                # If it's not a pure number, keep as is but log
-                pass
+    """Renumber patient IDs sequentially (in creation order) starting from 1"""
+    # Inside deferred_renumbering() just remember that a renumber is due
+    if g.get('renumber_defer_depth', 0) > 0:
+        g.renumber_pending = True
+        return
+    
+    result = db.session.execute(RENUMBER_PARK_SQL)
+    if result.rowcount:
+        db.session.execute(RENUMBER_ASSIGN_SQL)
+        logger.info(f"Renumbered {result.rowcount} patient IDs")
+        # Raw SQL is invisible to the session events that bump the data version
+        from utils.data_version import mark_data_changed
+        mark_data_changed()
     
     db.session.commit()
+    # Objects loaded before the raw UPDATE may hold stale patient_ids
+    db.session.expire_all()
+
+@contextmanager
+def deferred_renumbering():
+    """Skip renumber_patient_ids() calls inside the block and run it once on a normal exit (also usable as a view decorator)"""
+    g.renumber_defer_depth = g.get('renumber_defer_depth', 0) + 1
+    try:
+        yield
+    except BaseException:
+        # Leave the failed transaction to the caller's rollback; renumbering
+        # here would commit half-finished work or mask the original error
+        g.renumber_defer_depth -= 1
+        if g.renumber_defer_depth == 0:
+            g.pop('renumber_pending', None)
+        raise
+    else:
+        g.renumber_defer_depth -= 1
+        if g.renumber_defer_depth == 0 and g.pop('renumber_pending', False):
+            renumber_patient_ids()
+
+def paginate_patients(patients_query, page, per_page, count_key):
+    """Keyset-paginate a patient query on id, following the request's after/before cursor"""
+    from utils.pagination import keyset_paginate
+    return keyset_paginate(
+        patients_query,
+        Patient.id,
+        page=page,
+        per_page=per_page,
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        count_key=count_key
+    )
 
 @main.route('/generate_upload_url', methods=['GET'])
 @role_required('supervisor')
@@ -188,6 +226,7 @@ def get_upload_url():
 
 @main.route('/patients', methods=['GET', 'POST'])
 @role_required('supervisor')
+@deferred_renumbering()
 def manage_patients():
     if request.method == 'POST':
         # Handle file upload from Supabase or standard Form Upload
@@ -226,67 +265,12 @@ def manage_patients():
                 unique_prefix = uuid.uuid4().hex
                 
                 if filename.endswith(('.csv',)):
-                    # Process CSV upload
-                    stream = StringIO(file.stream.read().decode("UTF8"), newline=None)
-                    csv_input = csv.reader(stream)
-                    
-                    # Skip header row
-                    next(csv_input, None)
-                    
-                    added_count = 0
-                    skipped_count = 0
-                    
-                    for row in csv_input:
-                        # Handle different CSV formats:
-                        # Format 1 (Simple): ID, Name, Actual Age, Sex (4 columns)
-                        # Format 2 (Full): ID, Name, Age, Sex, OPG, A code, D code, A Age, D Age, Actual age (10+ columns)
-                        
-                        patient_id = ''
-                        name = ''
-                        actual_age = ''
-                        sex = ''
-                        opg_link = ''
-                        code_a = ''
-                        code_b = ''
-                        
-                        if len(row) >= 4:  # Simple format
-                            patient_id = row[0]
-                            name = row[1]
-                            actual_age = row[2]
-                            sex = row[3]
-                            
-                            # Check if it's the full format (10+ columns)
-                            if len(row) >= 10:
-                                # Override with full format data
-                                patient_id = row[0]
-                                name = row[1]
-                                actual_age = row[9]
-                                sex = row[3]
-                                opg_link = row[4]
-                                code_a = row[5]
-                                code_b = row[6]
-                            
-                            # Check if patient already exists
-                            patient = Patient.query.filter_by(patient_id=patient_id).first()
-                            if not patient:
-                                patient = Patient(
-                                    patient_id=patient_id,
-                                    name=name,
-                                    actual_age=float(actual_age) if actual_age else 0,
-                                    sex=sex,
-                                    opg_link=opg_link if opg_link else None,
-                                    code_a=code_a if code_a else None,
-                                    code_b=code_b if code_b else None
-                                )
-                                db.session.add(patient)
-                                added_count += 1
-                                # Commit in batches to handle large datasets
-                                if added_count % 100 == 0:
-                                    db.session.flush()
-                            else:
-                                skipped_count += 1
+                    # Process CSV upload with the bulk import engine:
+                    # streamed parsing, one existence check and one INSERT per chunk
+                    from utils.patient_import import import_patients_csv
                     
                     try:
+                        added_count, skipped_count = import_patients_csv(file.stream)
                         db.session.commit()
                         flash(f'CSV import successful! Added: {added_count}, Skipped (already exist): {skipped_count}')
                     except Exception as e:
@@ -300,20 +284,11 @@ def manage_patients():
                         temp_file_path = os.path.join('/tmp', f"{unique_prefix}_{filename}")
                         file.save(temp_file_path)
                         
-                        # Load FORMULA version (keeps HYPERLINK formulas readable)
-                        workbook = openpyxl.load_workbook(temp_file_path, data_only=False)
-                        worksheet = workbook.active
-                        
-                        # Load DATA version (for computed numeric values: age etc.)
-                        workbook_data = openpyxl.load_workbook(temp_file_path, data_only=True)
-                        worksheet_data = workbook_data.active
-                        data_rows = {i: row for i, row in enumerate(worksheet_data.iter_rows(min_row=1, values_only=True), 1)}
-                        
-                        # Extract embedded images
-                        row_image_map = {}
-                        for img in getattr(worksheet, '_images', []):
-                            if hasattr(img, 'anchor') and hasattr(img.anchor, '_from'):
-                                row_image_map[img.anchor._from.row + 1] = img
+                        # Parse the sheet once: cached values (age etc.), HYPERLINK
+                        # formula text and embedded image anchors in a single pass
+                        from utils.xlsx_reader import XlsxSheetReader
+                        reader = XlsxSheetReader(temp_file_path)
+                        row_image_map = reader.images
 
                         def _norm_sex(raw):
                             s = str(raw).strip().lower() if raw else ''
@@ -342,133 +317,114 @@ def manage_patients():
                                 return s
                             return None
 
-                        first_row = True
-                        row_count = 0
                         added_count = 0
                         skipped_count = 0
                         opg_fail_count = 0
 
-                        for formula_row in worksheet.iter_rows(values_only=True):
-                            row_count += 1
-                            if first_row:
-                                first_row = False
-                                continue
-
-                            # Use computed values for data (age, name, id, sex)
-                            data_row = data_rows.get(row_count, formula_row)
-
-                            if not data_row or len(data_row) < 4:
-                                continue
-
-                            patient_id = str(data_row[0]).strip() if data_row[0] is not None else ''
-                            name       = str(data_row[1]).strip() if data_row[1] is not None else ''
-                            actual_age = _safe_age(data_row[2])
-                            sex        = _norm_sex(data_row[3])
-                            code_a = ''
-                            code_b = ''
-
-                            # OPG: read formula cell for hyperlink; fallback to data cell string
-                            opg_formula_val = formula_row[4] if len(formula_row) > 4 else None
-                            opg_data_val    = data_row[4]   if len(data_row)    > 4 else None
-
-                            # Full format (10+ cols): override age and codes
-                            if len(data_row) >= 10:
-                                actual_age = _safe_age(data_row[9])
-                                code_a = str(data_row[5]).strip() if data_row[5] else ''
-                                code_b = str(data_row[6]).strip() if data_row[6] else ''
-
-                            if not patient_id or patient_id.lower() in ('none', 'nan'):
-                                continue
-
-                            existing = Patient.query.filter_by(patient_id=patient_id).first()
-                            if existing:
-                                skipped_count += 1
-                                continue
-
-                            # --- OPG upload priority ---
-                            uploaded_opg_url = None
-
-                            # Priority 1: Embedded image
-                            if row_count in row_image_map:
-                                try:
-                                    from utils.storage import upload_image
-                                    import io, datetime as dt
-                                    img_obj  = row_image_map[row_count]
-                                    img_data = img_obj._data()
-                                    fmt      = (getattr(img_obj, 'format', None) or 'jpeg').lower()
-                                    if fmt == 'jpg': fmt = 'jpeg'
-                                    ts  = int(dt.datetime.now().timestamp())
-                                    fname = f"{patient_id}_opg_{ts}.{fmt}"
-
-                                    class _EmbedFile(io.BytesIO):
-                                        def __init__(self, data, name, ctype):
-                                            super().__init__(data)
-                                            self.filename = name
-                                            self.content_type = ctype
-
-                                    uploaded_opg_url = upload_image(_EmbedFile(img_data, fname, f"image/{fmt}"), secure_filename(fname))
-                                except Exception as e:
-                                    current_app.logger.error(f"Embedded OPG upload failed for {patient_id}: {e}")
-                                    opg_fail_count += 1
-
-                            # Priority 2: HYPERLINK formula → local file
-                            if not uploaded_opg_url:
-                                opg_path = _parse_opg_hyperlink(opg_formula_val)
-                                if opg_path:
-                                    if opg_path.startswith('http'):
-                                        uploaded_opg_url = opg_path
-                                    else:
-                                        try:
-                                            if os.path.exists(opg_path):
-                                                from utils.storage import upload_image
-                                                import io, datetime as dt
-                                                with open(opg_path, 'rb') as fimg:
-                                                    img_data = fimg.read()
-                                                ext = os.path.splitext(opg_path)[1].lstrip('.').lower() or 'jpeg'
-                                                if ext == 'jpg': ext = 'jpeg'
-                                                ts  = int(dt.datetime.now().timestamp())
-                                                fname = f"{patient_id}_opg_{ts}.{ext}"
-
-                                                class _LocalFile(io.BytesIO):
-                                                    def __init__(self, data, name, ctype):
-                                                        super().__init__(data)
-                                                        self.filename = name
-                                                        self.content_type = ctype
-
-                                                uploaded_opg_url = upload_image(_LocalFile(img_data, fname, f"image/{ext}"), secure_filename(fname))
-                                            else:
-                                                current_app.logger.warning(f"OPG local file missing for {patient_id}: {opg_path}")
-                                                opg_fail_count += 1
-                                        except Exception as e:
-                                            current_app.logger.error(f"Local OPG upload failed for {patient_id}: {e}")
-                                            opg_fail_count += 1
-
-                            # Priority 3: opg cell is a plain http string (data_only computed value)
-                            if not uploaded_opg_url and opg_data_val:
-                                s = str(opg_data_val).strip()
-                                if s.startswith('http://') or s.startswith('https://'):
-                                    uploaded_opg_url = s
+                        def _sheet_rows():
+                            """Yield one dict per data row with a patient ID (images not read yet)."""
+                            first_row = True
+                            # data_row holds computed values (age, name, id, sex),
+                            # formula_row the formula text for HYPERLINK cells
+                            for row_count, data_row, formula_row in reader.iter_rows():
+                                if first_row:
+                                    first_row = False
+                                    continue
+
+                                if not data_row or len(data_row) < 4:
+                                    continue
+
+                                patient_id = str(data_row[0]).strip() if data_row[0] is not None else ''
+                                name       = str(data_row[1]).strip() if data_row[1] is not None else ''
+                                actual_age = _safe_age(data_row[2])
+                                sex        = _norm_sex(data_row[3])
+                                code_a = ''
+                                code_b = ''
+
+                                # OPG: read formula cell for hyperlink; fallback to data cell string
+                                opg_formula_val = formula_row[4] if len(formula_row) > 4 else None
+                                opg_data_val    = data_row[4]   if len(data_row)    > 4 else None
+
+                                # Full format (10+ cols): override age and codes
+                                if len(data_row) >= 10:
+                                    actual_age = _safe_age(data_row[9])
+                                    code_a = str(data_row[5]).strip() if data_row[5] else ''
+                                    code_b = str(data_row[6]).strip() if data_row[6] else ''
+
+                                if not patient_id or patient_id.lower() in ('none', 'nan'):
+                                    continue
+
+                                cell_link = str(opg_data_val).strip() if opg_data_val else ''
+                                yield {
+                                    'row_count': row_count,
+                                    'patient_id': patient_id,
+                                    'name': name,
+                                    'actual_age': actual_age,
+                                    'sex': sex,
+                                    'code_a': code_a,
+                                    'code_b': code_b,
+                                    'hyperlink': _parse_opg_hyperlink(opg_formula_val),
+                                    'cell_link': cell_link if cell_link.startswith(('http://', 'https://')) else None,
+                                }
+
+                        def _parse_rows():
+                            """Yield one dict per importable row; runs ahead of the uploads."""
+                            nonlocal skipped_count
+                            # One existence query per chunk of rows, not one per row
+                            from utils.patient_import import mark_existing_patients
+                            for row, duplicate in mark_existing_patients(_sheet_rows()):
+                                if duplicate:
+                                    skipped_count += 1
+                                    continue
+
+                                # Embedded images are read only for rows that will be imported
+                                image = None
+                                img_obj = row_image_map.get(row['row_count'])
+                                if img_obj is not None:
+                                    try:
+                                        image = (img_obj.data(), getattr(img_obj, 'format', None))
+                                    except Exception as e:
+                                        current_app.logger.error(f"Could not read embedded OPG for {row['patient_id']}: {e}")
+                                row['image'] = image
+                                row['image_error'] = img_obj is not None and image is None
+                                yield row
+
+                        # OPG uploads run on a bounded worker pool while the sheet
+                        # is parsed; results come back in row order
+                        from utils.patient_import import upload_row_opgs
+                        app = current_app._get_current_object()
+                        thumbnails = []
+                        for row, (uploaded_opg_url, failures) in upload_row_opgs(app, _parse_rows(), thumbnails=thumbnails):
+                            opg_fail_count += failures + (1 if row['image_error'] else 0)
 
                             patient = Patient(
-                                patient_id=patient_id,
-                                name=name,
-                                actual_age=actual_age,
-                                sex=sex,
+                                patient_id=row['patient_id'],
+                                name=row['name'],
+                                actual_age=row['actual_age'],
+                                sex=row['sex'],
                                 opg_link=uploaded_opg_url,
-                                code_a=code_a if code_a else None,
-                                code_b=code_b if code_b else None
+                                code_a=row['code_a'] if row['code_a'] else None,
+                                code_b=row['code_b'] if row['code_b'] else None
                             )
                             db.session.add(patient)
                             added_count += 1
+                            # Image bytes are no longer needed once the row is built
+                            row['image'] = None
                             if added_count % 50 == 0:
                                 db.session.flush()
 
-                        workbook.close()
-                        workbook_data.close()
+                        reader.close()
                         os.remove(temp_file_path)
 
                         try:
                             db.session.commit()
+                            # Index the uploaded OPGs' thumbnails in one transaction
+                            if thumbnails:
+                                from utils.thumbnails import record_thumbnails
+                                try:
+                                    record_thumbnails(thumbnails)
+                                except Exception as e:
+                                    current_app.logger.warning(f"Could not record {len(thumbnails)} thumbnails: {e}")
                             msg = f'Excel import successful! Added: {added_count}, Skipped (already exist): {skipped_count}'
                             if opg_fail_count:
                                 msg += f' | OPG not uploaded for {opg_fail_count} row(s) — local file not accessible on server. Use [UPLOAD] to add OPG individually.'
@@ -477,6 +433,8 @@ def manage_patients():
                             db.session.rollback()
                             flash(f'Error importing Excel: {str(e)}')
                     except Exception as e:
+                        if 'reader' in locals():
+                            reader.close()
                         if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
                             os.remove(temp_file_path)
                         flash(f'Error processing Excel file: {str(e)}')
@@ -529,28 +487,14 @@ def manage_patients():
     per_page = 20  # Show 20 entries per page
     
     # Query patients with search and pagination
-    patients_query = Patient.query
-    
-    if search_query:
-        search_f = f"%{search_query}%"
-        patients_query = patients_query.filter(
-            db.or_(
-                Patient.patient_id.ilike(search_f),
-                Patient.name.ilike(search_f),
-                Patient.code_a.ilike(search_f),
-                Patient.code_b.ilike(search_f)
-            )
-        )
+    from utils.search import search_patients
+    patients_query = search_patients(Patient.query, search_query)
     
-    # Order patients by patient_id numerically
-    patients_query = patients_query.order_by(cast(Patient.patient_id, db.Integer))
+    # Get patients with pagination, in patient_id order (renumber_patient_ids keeps it equal to id order)
+    patients = paginate_patients(patients_query, page, per_page, f"patients:{search_query}")
     
-    # Get patients with pagination
-    patients = patients_query.paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
+    # Sign every OPG on the page with one storage call
+    prefetch_opg_urls(p.opg_link for p in patients.items)
     
     # Check if it's an AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -579,10 +523,13 @@ def update_patient(patient_id):
         # Update patient details
         patient.patient_id = request.form['patient_id']
         patient.name = request.form.get('name', '')
+        old_actual_age = patient.actual_age
         patient.actual_age = float(request.form['actual_age'])
         patient.sex = request.form['sex']
         
         try:
+            from utils.aggregates import move_patient_estimates
+            move_patient_estimates(patient, old_actual_age)
             db.session.commit()
             flash('Patient updated successfully!')
             
@@ -597,6 +544,20 @@ def update_patient(patient_id):
     
     return render_template('update_patient.html', patient=patient)
 
+def delete_patient_estimates(patient):
+    """Delete a patient's estimation entries (and their aggregate totals) before the patient"""
+    from utils.aggregates import remove_patient_estimates
+    remove_patient_estimates(patient)
+    EstimationEntry.query.filter_by(patient_pk=patient.id).delete()
+    
+    # Legacy entries that were never linked to the patient still carry its codes
+    codes = [code for code in (patient.code_a, patient.code_b) if code]
+    if codes:
+        EstimationEntry.query.filter(
+            EstimationEntry.code.in_(codes),
+            EstimationEntry.patient_pk.is_(None)
+        ).delete(synchronize_session=False)
+
 @main.route('/patients/delete/<patient_id>', methods=['POST'])
 @role_required('supervisor')
 def delete_patient(patient_id):
@@ -611,46 +572,39 @@ def delete_patient(patient_id):
         current_app.logger.error(f"Invalid patient_id for delete: {patient_id}")
         return f"Invalid Patient ID: {patient_id}", 400
     
+    from utils.storage import opg_object_path, is_local_opg
+    
     # Delete OPG image from Supabase if it exists
-    if patient.opg_link and patient.opg_link.startswith('http'):
+    # (opg_link holds the object path, or a signed/public URL on older rows)
+    object_path = opg_object_path(patient.opg_link)
+    if object_path:
         try:
             from utils.storage import delete_image
-            # Extract filename from URL - works for both public URLs and signed URLs
-            # For signed URLs, we need to extract the path before the query parameters
-            if '?' in patient.opg_link:
-                # Signed URL - extract filename from path before query parameters
-                path_part = patient.opg_link.split('?')[0]
-                filename = path_part.split('/')[-1]
-            else:
-                # Regular URL - extract filename from last part of URL
-                filename = patient.opg_link.split('/')[-1]
-            delete_image(filename)
+            delete_image(object_path)
         except:
             pass  # If deletion fails, continue anyway
     
     # Delete OPG image file if it exists locally (for backward compatibility)
-    if patient.opg_link and not patient.opg_link.startswith('http'):
+    if is_local_opg(patient.opg_link):
         try:
             os.remove(os.path.join(current_app.root_path, patient.opg_link))
         except:
             pass  # If file doesn't exist or can't be deleted, continue anyway
     
+    # Delete the OPG thumbnail (bucket object, index row and cached file)
+    from utils.thumbnails import delete_thumbnail, thumbnail_source_key
+    delete_thumbnail(thumbnail_source_key(patient.opg_link))
+    
     # Delete associated estimation entries (orphans)
-    if patient.code_a:
-        EstimationEntry.query.filter_by(code=patient.code_a).delete()
-    if patient.code_b:
-        EstimationEntry.query.filter_by(code=patient.code_b).delete()
+    delete_patient_estimates(patient)
         
     # Delete the patient record
     db.session.delete(patient)
     
     try:
+        # Committing bumps the analysis data version, so cached charts are regenerated
         db.session.commit()
         
-        # Clear chart cache so charts update instantly
-        global chart_cache
-        chart_cache = {}
-        
         flash('Patient and associated data deleted successfully!')
         
         # Renumber patient IDs after deletion
@@ -663,6 +617,7 @@ def delete_patient(patient_id):
 
 @main.route('/patients/bulk_delete', methods=['POST'])
 @role_required('supervisor')
+@deferred_renumbering()
 def bulk_delete_patients():
     select_all_matching = request.form.get('select_all_matching') == 'true'
     search_query = request.form.get('search_query', '').strip()
@@ -670,21 +625,13 @@ def bulk_delete_patients():
     
     deleted_count = 0
     try:
-        from utils.storage import delete_image
+        from utils.storage import delete_image, opg_object_path, is_local_opg
+        from utils.thumbnails import delete_thumbnail, thumbnail_source_key
         
         if select_all_matching:
             # Get all patients that would match the current view's filters
-            patients_query = Patient.query
-            if search_query:
-                patients_query = patients_query.filter(
-                    db.or_(
-                        Patient.patient_id.contains(search_query),
-                        Patient.name.contains(search_query),
-                        Patient.code_a.contains(search_query),
-                        Patient.code_b.contains(search_query)
-                    )
-                )
-            target_patients = patients_query.all()
+            from utils.search import search_patients
+            target_patients = search_patients(Patient.query, search_query).all()
         else:
             if not patient_ids:
                 flash('No patients selected for deletion.')
@@ -693,40 +640,33 @@ def bulk_delete_patients():
         
         for patient in target_patients:
             # Delete OPG image from Supabase if it exists
-            if patient.opg_link and patient.opg_link.startswith('http'):
+            object_path = opg_object_path(patient.opg_link)
+            if object_path:
                 try:
-                    if '?' in patient.opg_link:
-                        path_part = patient.opg_link.split('?')[0]
-                        filename = path_part.split('/')[-1]
-                    else:
-                        filename = patient.opg_link.split('/')[-1]
-                    delete_image(filename)
+                    delete_image(object_path)
                 except:
                     pass
             
             # Delete OPG image file if it exists locally
-            if patient.opg_link and not patient.opg_link.startswith('http'):
+            if is_local_opg(patient.opg_link):
                 try:
                     os.remove(os.path.join(current_app.root_path, patient.opg_link))
                 except:
                     pass
             
+            # Delete the OPG thumbnail
+            delete_thumbnail(thumbnail_source_key(patient.opg_link))
+            
             # Delete associated estimation entries
-            if patient.code_a:
-                EstimationEntry.query.filter_by(code=patient.code_a).delete()
-            if patient.code_b:
-                EstimationEntry.query.filter_by(code=patient.code_b).delete()
+            delete_patient_estimates(patient)
                 
             db.session.delete(patient)
             deleted_count += 1
         
         if deleted_count > 0:
+            # Committing bumps the analysis data version (charts are regenerated)
             db.session.commit()
             
-            # Clear chart cache
-            global chart_cache
-            chart_cache = {}
-            
             # Renumber patient IDs after deletion
             renumber_patient_ids()
             
@@ -802,22 +742,20 @@ def upload_opg(patient_id):
             
             try:
                 # Import Supabase storage utility
-                from utils.storage import upload_image, delete_image
+                from utils.storage import upload_image, delete_image, opg_object_path
+                from utils.thumbnails import delete_thumbnail, thumbnail_source_key
                 current_app.logger.info("Imported Supabase storage utilities")
                 
+                # Drop the old image's thumbnail before the new one is recorded
+                # (committed now: upload_image records the new one on its own connection)
+                if delete_thumbnail(thumbnail_source_key(patient.opg_link)):
+                    db.session.commit()
+                
                 # If patient already has an OPG image, delete it from Supabase first
-                if patient.opg_link and patient.opg_link.startswith('http'):
+                old_filename = opg_object_path(patient.opg_link)
+                if old_filename:
                     try:
                         current_app.logger.info(f"Patient has existing OPG link: {patient.opg_link[:50]}...")
-                        # Extract filename from URL - works for both public URLs and signed URLs
-                        # For signed URLs, we need to extract the path before the query parameters
-                        if '?' in patient.opg_link:
-                            # Signed URL - extract filename from path before query parameters
-                            path_part = patient.opg_link.split('?')[0]
-                            old_filename = path_part.split('/')[-1]
-                        else:
-                            # Regular URL - extract filename from last part of URL
-                            old_filename = patient.opg_link.split('/')[-1]
                         current_app.logger.info(f"Attempting to delete old image: {old_filename}")
                         delete_image(old_filename)
                         current_app.logger.info("Old image deleted successfully")
@@ -828,11 +766,11 @@ def upload_opg(patient_id):
                 
                 # Upload to Supabase (no local storage needed on Vercel)
                 current_app.logger.info(f"Starting upload to Supabase for file: {filename}")
-                file_url = upload_image(file, filename)
-                current_app.logger.info(f"Upload successful! File URL: {file_url[:100]}...")
+                object_path = upload_image(file, filename)
+                current_app.logger.info(f"Upload successful! Object path: {object_path}")
                 
-                # Store URL in database
-                patient.opg_link = file_url
+                # Store the object path; URLs are signed when pages are rendered
+                patient.opg_link = object_path
                 db.session.commit()
                 current_app.logger.info(f"Database updated with new OPG link for patient {patient_id}")
                 
@@ -869,6 +807,34 @@ def uploaded_file(filename):
         flash('File not found')
         return redirect(url_for('main.manage_patients'))
 
+@main.route('/opg_thumbnail/<code>')
+@login_required
+def opg_thumbnail(code):
+    """Serve the cached OPG thumbnail for a blinded code"""
+    patient = Patient.query.filter(
+        (Patient.code_a == code) | (Patient.code_b == code)
+    ).first()
+    from utils.storage import is_local_opg
+    if not patient or not patient.opg_link or is_local_opg(patient.opg_link):
+        abort(404)
+    
+    from utils.thumbnails import get_thumbnail
+    data, content_hash, content_type = get_thumbnail(patient.opg_link)
+    if not data:
+        abort(404)
+    
+    response = send_file(
+        BytesIO(data),
+        mimetype=content_type,
+        etag=content_hash or False,
+        max_age=86400,
+        conditional=True
+    )
+    # Patient imagery must only be cached by the user's own browser
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @main.route('/blinded_data')
 @role_required('supervisor')
 def blinded_data():
@@ -885,21 +851,12 @@ def blinded_data():
         )
     )
     
-    if search_query:
-        search_f = f"%{search_query}%"
-        patients_query = patients_query.filter(
-            db.or_(
-                Patient.code_a.ilike(search_f),
-                Patient.code_b.ilike(search_f)
-            )
-        )
+    # Blinded view: search the codes only
+    from utils.search import search_patients, CODE_SEARCH_COLUMNS
+    patients_query = search_patients(patients_query, search_query, CODE_SEARCH_COLUMNS)
     
     # Get patients with pagination
-    patients = patients_query.paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
+    patients = paginate_patients(patients_query, page, per_page, f"blinded:{search_query}")
     
     blinded_entries = []
     for patient in patients.items:
@@ -925,26 +882,33 @@ def blinded_data():
     
     # Shuffle the data
     random.shuffle(blinded_entries)
+    prefetch_opg_urls(p.opg_link for p in patients.items)
     
     # Create a dummy pagination object since the template expects one
     class DummyPagination:
-        def __init__(self, items, page, pages, has_prev, has_next, prev_num, next_num):
+        def __init__(self, items, page, pages, total, has_prev, has_next, prev_num, next_num, prev_args, next_args):
             self.items = items
             self.page = page
             self.pages = pages
+            self.total = total
             self.has_prev = has_prev
             self.has_next = has_next
             self.prev_num = prev_num
             self.next_num = next_num
+            self.prev_args = prev_args
+            self.next_args = next_args
 
     dummy_pagination = DummyPagination(
         items=blinded_entries,
         page=patients.page,
         pages=patients.pages,
+        total=patients.total,
         has_prev=patients.has_prev,
         has_next=patients.has_next,
         prev_num=patients.prev_num,
-        next_num=patients.next_num
+        next_num=patients.next_num,
+        prev_args=patients.prev_args,
+        next_args=patients.next_args
     )
     
     # Check if it's an AJAX request
@@ -954,6 +918,26 @@ def blinded_data():
     
     return render_template('blinded_data.html', entries=dummy_pagination, search_query=search_query, patients=patients)
 
+def pending_estimate_conditions():
+    """SQL conditions for a patient's AlQahtani and Demirjian codes still awaiting an estimate"""
+    # Correlated NOT EXISTS probes: linked entries use the (patient_pk, code_slot)
+    # index, legacy entries never linked to a patient (patient_pk IS NULL) the code index
+    def not_estimated(code_slot, code_column):
+        linked = db.session.query(EstimationEntry.id).filter(
+            EstimationEntry.patient_pk == Patient.id,
+            EstimationEntry.code_slot == code_slot
+        ).exists()
+        unlinked = db.session.query(EstimationEntry.id).filter(
+            EstimationEntry.patient_pk.is_(None),
+            EstimationEntry.code == code_column
+        ).exists()
+        return db.and_(~linked, ~unlinked)
+    
+    return (
+        db.and_(Patient.alqahtani_estimated_age.is_(None), not_estimated('a', Patient.code_a)),
+        db.and_(Patient.demirjian_estimated_age.is_(None), not_estimated('b', Patient.code_b))
+    )
+
 @main.route('/estimate_age', methods=['GET', 'POST'])
 @role_required('pi')
 def estimate_age():
@@ -967,30 +951,35 @@ def estimate_age():
         estimated_age = float(request.form['estimated_age'])
         method = request.form['method']
         
-        # Create estimation entry
+        # Resolve the blinded code to its patient on the server (the PI only ever sees the code)
+        patient = Patient.query.filter(
+            (Patient.code_a == code) | (Patient.code_b == code)
+        ).first()
+        
+        # Create estimation entry, linked to the patient and the code slot it estimates
         estimation = EstimationEntry(
             code=code,
             estimated_age=estimated_age,
-            method_used=method
+            method_used=method,
+            patient_pk=patient.id if patient else None,
+            code_slot=('a' if code == patient.code_a else 'b') if patient else None
         )
         
         # Note: We're no longer collecting individual tooth stage data
         # The PI only provides the final estimated age
         
         db.session.add(estimation)
-        db.session.commit()
         
         # Update patient record with estimated age
-        patient = Patient.query.filter(
-            (Patient.code_a == code) | (Patient.code_b == code)
-        ).first()
-        
         if patient:
             if code == patient.code_a:
                 patient.alqahtani_estimated_age = estimated_age
             elif code == patient.code_b:
                 patient.demirjian_estimated_age = estimated_age
         
+        # The entry, the patient's estimate and the aggregate totals commit together
+        from utils.aggregates import record_estimate
+        record_estimate(method, estimated_age, patient.actual_age if patient else None)
         db.session.commit()
         
         flash('Estimation submitted successfully')
@@ -1003,33 +992,27 @@ def estimate_age():
     
     # Show blinded data for the PI to work with
     # Get all patients that have codes assigned but not yet fully estimated
+    alqahtani_pending, demirjian_pending = pending_estimate_conditions()
     patients_query = Patient.query.filter(
         Patient.code_a.isnot(None), 
         Patient.code_b.isnot(None),
-        db.or_(
-            Patient.alqahtani_estimated_age.is_(None),
-            Patient.demirjian_estimated_age.is_(None)
-        )
+        db.or_(alqahtani_pending, demirjian_pending)
     )
     
-    if search_query:
-        patients_query = patients_query.filter(
-            db.or_(
-                Patient.code_a.contains(search_query),
-                Patient.code_b.contains(search_query)
-            )
-        )
+    # Blinded view: search the codes only
+    from utils.search import search_patients, CODE_SEARCH_COLUMNS
+    patients_query = search_patients(patients_query, search_query, CODE_SEARCH_COLUMNS)
     
-    # Apply pagination
-    patients = patients_query.paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
+    # Keyset pagination on id; the total is cached per data version
+    patients = paginate_patients(patients_query, page, per_page, f"estimate_queue:{search_query}")
     
-    # Find which codes have already been estimated
-    existing_estimations = EstimationEntry.query.with_entities(EstimationEntry.code).all()
-    estimated_codes = [e.code for e in existing_estimations]
+    # Find which codes on this page have already been estimated (at most 2 per patient)
+    page_codes = [code for p in patients.items for code in (p.code_a, p.code_b)]
+    estimated_codes = {
+        code for (code,) in db.session.query(EstimationEntry.code).filter(
+            EstimationEntry.code.in_(page_codes)
+        ).distinct()
+    } if page_codes else set()
     
     # Prepare blinded entries that haven't been estimated yet
     blinded_entries = []
@@ -1056,37 +1039,19 @@ def estimate_age():
     
     # Shuffle the data
     random.shuffle(blinded_entries)
+    prefetch_opg_urls(p.opg_link for p in patients.items)
     
-    # Get completed assessments for the PI to see results (all completed)
-    completed_patients = Patient.query.filter(
-        Patient.alqahtani_estimated_age.isnot(None),
-        Patient.demirjian_estimated_age.isnot(None)
-    ).order_by(Patient.created_at.desc()).all()
-
-    # Pre-calculate differences for completed patients
-    for p in completed_patients:
-        # AlQahtani Diff
-        p.alq_diff = round(p.alqahtani_estimated_age - p.actual_age, 2)
-        # Demirjian Diff
-        p.dem_diff = round(p.demirjian_estimated_age - p.actual_age, 2)
-    
-    # Remove the artificial limit that was causing issues
-    # The pagination will handle the appropriate number of entries to display
+    # Completed assessments are loaded page by page from completed_assessments
     
-    # Calculate totals for counts
-    total_pending_patients = Patient.query.filter(
+    # Calculate totals for counts (one aggregate query, one queue item per pending code)
+    total_queue_count = db.session.query(
+        func.coalesce(func.sum(
+            db.case((alqahtani_pending, 1), else_=0) + db.case((demirjian_pending, 1), else_=0)
+        ), 0)
+    ).filter(
         Patient.code_a.isnot(None), 
-        Patient.code_b.isnot(None),
-        db.or_(
-            Patient.alqahtani_estimated_age.is_(None),
-            Patient.demirjian_estimated_age.is_(None)
-        )
-    ).all()
-    
-    total_queue_count = 0
-    for p in total_pending_patients:
-        if p.alqahtani_estimated_age is None: total_queue_count += 1
-        if p.demirjian_estimated_age is None: total_queue_count += 1
+        Patient.code_b.isnot(None)
+    ).scalar()
 
     total_completed_count = Patient.query.filter(
         Patient.alqahtani_estimated_age.isnot(None), 
@@ -1098,7 +1063,6 @@ def estimate_age():
         # Return only the content part for AJAX requests
         return render_template('estimate_age_content.html', 
                              entries=blinded_entries, 
-                             completed_patients=completed_patients,
                              search_query=search_query, 
                              patients=patients,
                              total_queue_count=total_queue_count,
@@ -1106,12 +1070,79 @@ def estimate_age():
     
     return render_template('estimate_age.html', 
                          entries=blinded_entries, 
-                         completed_patients=completed_patients,
                          search_query=search_query, 
                          patients=patients,
                          total_queue_count=total_queue_count,
                          total_completed_count=total_completed_count)
 
+# Completed assessments shown per request of the completed list
+COMPLETED_PAGE_SIZE = 25
+
+def _completed_cursor(created_at, patient_id):
+    """Encode the (created_at, id) position of the last row sent"""
+    return f"{created_at.isoformat() if created_at else ''}~{patient_id}"
+
+def completed_assessments_page(cursor=None, limit=COMPLETED_PAGE_SIZE):
+    """One keyset page of fully estimated patients, newest first, with differences computed in SQL"""
+    def rounded_diff(estimate):
+        return func.round(cast(estimate - Patient.actual_age, db.Numeric), 2)
+    
+    query = db.session.query(
+        Patient.id,
+        Patient.created_at,
+        Patient.code_a,
+        Patient.code_b,
+        Patient.actual_age,
+        Patient.alqahtani_estimated_age,
+        Patient.demirjian_estimated_age,
+        rounded_diff(Patient.alqahtani_estimated_age).label('alq_diff'),
+        rounded_diff(Patient.demirjian_estimated_age).label('dem_diff')
+    ).filter(
+        Patient.alqahtani_estimated_age.isnot(None),
+        Patient.demirjian_estimated_age.isnot(None)
+    )
+    
+    if cursor:
+        # Continue strictly after the last row sent: (created_at, id) descending, NULL created_at last
+        created_part, _, id_part = cursor.rpartition('~')
+        last_id = int(id_part)
+        if created_part:
+            last_created = datetime.datetime.fromisoformat(created_part)
+            query = query.filter(db.or_(
+                Patient.created_at < last_created,
+                db.and_(Patient.created_at == last_created, Patient.id < last_id),
+                Patient.created_at.is_(None)
+            ))
+        else:
+            query = query.filter(Patient.created_at.is_(None), Patient.id < last_id)
+    
+    rows = query.order_by(
+        Patient.created_at.desc().nulls_last(), Patient.id.desc()
+    ).limit(limit + 1).all()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _completed_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    
+    completed_patients = [
+        {**row._asdict(), 'alq_diff': float(row.alq_diff), 'dem_diff': float(row.dem_diff)}
+        for row in rows
+    ]
+    return completed_patients, next_cursor
+
+@main.route('/estimate_age/completed')
+@role_required('pi')
+def completed_assessments():
+    """Rows of the completed assessments table, one keyset page at a time"""
+    try:
+        completed_patients, next_cursor = completed_assessments_page(request.args.get('after') or None)
+    except ValueError:
+        return 'Invalid cursor', 400
+    
+    response = make_response(render_template('estimate_age_completed.html', completed_patients=completed_patients))
+    response.headers['X-Next-Cursor'] = next_cursor or ''
+    return response
+
 @main.route('/perform_estimation')
 @role_required('pi')
 def perform_estimation():
@@ -1133,171 +1164,32 @@ def perform_estimation():
                           sex=sex, 
                           teeth=teeth)
 
-def generate_chart_data():
-    """Generate chart data with caching"""
-    cache_key = "analysis_charts"
-    
-    # Check if we have cached data
-    if cache_key in chart_cache:
-        cached_data, timestamp = chart_cache[cache_key]
-        # Cache for 5 minutes
-        if (datetime.datetime.utcnow() - timestamp).total_seconds() < 300:
-            logger.info("Returning cached chart data")
-            return cached_data
-    
-    # Generate new chart data
-    logger.info("Generating new chart data")
-    
-    # Get all estimation entries
-    entries = EstimationEntry.query.all()
-    
-    if not entries:
-        return None, None, None, None
-    
-    # Prepare data for charts
-    alq_ages = [e.estimated_age for e in entries if e.method_used.lower() == 'alqahtani']
-    dem_ages = [e.estimated_age for e in entries if e.method_used.lower() == 'demirjian']
-    
-    # Actual ages from patients
-    # Actual ages from patients
-    actual_ages = []
-    
-    # Optimization: Fetch all patients at once to avoid N+1 query problem
-    # This replaces hundreds/thousands of DB queries with a single one
-    all_patients = Patient.query.filter(
-        db.or_(Patient.code_a.isnot(None), Patient.code_b.isnot(None))
-    ).all()
-    
-    # Create a map of code -> actual_age for O(1) lookup
-    code_to_age = {}
-    for p in all_patients:
-        if p.code_a:
-            code_to_age[p.code_a] = p.actual_age
-        if p.code_b:
-            code_to_age[p.code_b] = p.actual_age
-            
-    for e in entries:
-        if e.code in code_to_age:
-            actual_ages.append(code_to_age[e.code])
-    
-    # Generate charts
-    # 1. Age Distribution Chart
-    plt.clf()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    if alq_ages or dem_ages:
-        if alq_ages:
-            ax.hist(alq_ages, bins=20, alpha=0.7, label='AlQahtani', color='#2563eb')
-        if dem_ages:
-            ax.hist(dem_ages, bins=20, alpha=0.7, label='Demirjian', color='#818cf8')
-        ax.set_xlabel('Estimated Age (years)')
-        ax.set_ylabel('Frequency')
-        ax.set_title('Distribution of Estimated Ages')
-        ax.legend()
-    
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    age_dist_chart = base64.b64encode(buf.getvalue()).decode('utf-8')
-    buf.close()
-    
-    # 2. Actual vs Estimated Chart
-    plt.clf()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    if actual_ages and (alq_ages or dem_ages):
-        if alq_ages and len(actual_ages) == len(alq_ages):
-            ax.scatter(actual_ages[:len(alq_ages)], alq_ages, alpha=0.7, label='AlQahtani', color='#2563eb')
-        if dem_ages and len(actual_ages) == len(dem_ages):
-            ax.scatter(actual_ages[:len(dem_ages)], dem_ages, alpha=0.7, label='Demirjian', color='#818cf8')
-        
-        # Perfect prediction line
-        if actual_ages:
-            min_age = min(actual_ages)
-            max_age = max(actual_ages)
-            ax.plot([min_age, max_age], [min_age, max_age], 'r--', label='Perfect Prediction')
-        
-        ax.set_xlabel('Actual Age (years)')
-        ax.set_ylabel('Estimated Age (years)')
-        ax.set_title('Actual vs Estimated Ages')
-        ax.legend()
-    
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    actual_vs_estimated_chart = base64.b64encode(buf.getvalue()).decode('utf-8')
-    buf.close()
-    
-    # 3. Error Distribution Chart
-    plt.clf()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    alq_errors = []
-    dem_errors = []
-    
-    for i, e in enumerate(entries):
-        patient = Patient.query.filter(
-            (Patient.code_a == e.code) | (Patient.code_b == e.code)
-        ).first()
-        if patient:
-            error = abs(e.estimated_age - patient.actual_age)
-            if e.method_used.lower() == 'alqahtani':
-                alq_errors.append(error)
-            elif e.method_used.lower() == 'demirjian':
-                dem_errors.append(error)
-    
-    if alq_errors or dem_errors:
-        if alq_errors:
-            ax.hist(alq_errors, bins=20, alpha=0.7, label='AlQahtani', color='#2563eb')
-        if dem_errors:
-            ax.hist(dem_errors, bins=20, alpha=0.7, label='Demirjian', color='#818cf8')
-        ax.set_xlabel('Absolute Error (years)')
-        ax.set_ylabel('Frequency')
-        ax.set_title('Distribution of Estimation Errors')
-        ax.legend()
-    
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    error_dist_chart = base64.b64encode(buf.getvalue()).decode('utf-8')
-    buf.close()
-    
-    # 4. Method Comparison Chart
-    plt.clf()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    alq_mean_error = np.mean(alq_errors) if alq_errors else 0
-    dem_mean_error = np.mean(dem_errors) if dem_errors else 0
-    
-    methods = ['AlQahtani', 'Demirjian']
-    mean_errors = [alq_mean_error, dem_mean_error]
-    colors = ['#2563eb', '#818cf8']
-    
-    bars = ax.bar(methods, mean_errors, color=colors)
-    ax.set_ylabel('Mean Absolute Error (years)')
-    ax.set_title('Comparison of Methods')
-    
-    # Add value labels on bars
-    for bar, error in zip(bars, mean_errors):
-        height = bar.get_height()
-        ax.annotate(f'{error:.2f}',
-                    xy=(bar.get_x() + bar.get_width() / 2, height),
-                    xytext=(0, 3),
-                    textcoords="offset points",
-                    ha='center', va='bottom')
-    
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    method_comparison_chart = base64.b64encode(buf.getvalue()).decode('utf-8')
-    buf.close()
-    
-    chart_data = (age_dist_chart, actual_vs_estimated_chart, error_dist_chart, method_comparison_chart)
-    
-    # Cache the data
-    chart_cache[cache_key] = (chart_data, datetime.datetime.utcnow())
-    
-    return chart_data
+@main.route('/api/analysis')
+@role_required('supervisor')
+def analysis_api():
+    """Chart data for the analysis page as JSON; the charts are drawn in the browser"""
+    from utils.cache import get_cache
+    from utils.data_version import get_data_version
+    
+    # The key changes whenever patients or estimations change, in any worker
+    version = get_data_version()
+    cache_key = f"analysis_payload:v{version}" if version is not None else None
+    
+    payload = get_cache().get(cache_key) if cache_key else None
+    if payload is None:
+        from utils.analysis import load_estimation_arrays, build_analysis_payload, summary_from_aggregates
+        from utils.aggregates import method_stats
+        # Per-point charts need the estimates themselves; the summary comes from the aggregates
+        payload = build_analysis_payload(load_estimation_arrays(), summary_from_aggregates(method_stats()))
+        payload['version'] = version
+        if cache_key:
+            get_cache().set(cache_key, payload, timeout=CHART_CACHE_TIMEOUT)
+    
+    response = make_response(payload)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if version is not None:
+        response.set_etag(f"analysis-{version}")
+    return response.make_conditional(request)
 
 @main.route('/analysis')
 @role_required('supervisor')
@@ -1308,83 +1200,43 @@ def analysis():
     per_page = 20  # Show 20 entries per page
     
     # Query patients with search and pagination
-    patients_query = Patient.query
-    
-    if search_query:
-        search_f = f"%{search_query}%"
-        patients_query = patients_query.filter(
-            db.or_(
-                Patient.patient_id.ilike(search_f),
-                Patient.name.ilike(search_f),
-                Patient.code_a.ilike(search_f),
-                Patient.code_b.ilike(search_f)
-            )
-        )
+    from utils.search import search_patients
+    patients_query = search_patients(Patient.query, search_query)
     
-    # Order patients by patient_id numerically
-    patients_query = patients_query.order_by(cast(Patient.patient_id, db.Integer))
-    
-    # Get patients with pagination
-    patients = patients_query.paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
+    # Get patients with pagination, in patient_id order (renumber_patient_ids keeps it equal to id order)
+    patients = paginate_patients(patients_query, page, per_page, f"patients:{search_query}")
     
     # Prepare results for the template
     results = patients.items
+    prefetch_opg_urls(p.opg_link for p in results)
     
-    # Generate or retrieve cached chart data
-    chart_data = generate_chart_data()
-    
-    if chart_data[0] is None:
-        flash('No data available for analysis yet.')
-        # Check if it's an AJAX request
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            # Return only the content part for AJAX requests
-            return render_template('analysis_content.html',
-                                 accuracy_chart=None,
-                                 comparison_chart=None,
-                                 patients=patients,
-                                 results=results,
-                                 search_query=search_query)
-        
-        return render_template('analysis.html', 
-                             accuracy_chart=None,
-                             comparison_chart=None,
-                             patients=patients,
-                             results=results,
-                             search_query=search_query)
-    
-    age_dist_chart, actual_vs_estimated_chart, error_dist_chart, method_comparison_chart = chart_data
-    
-    # Map the generated charts to the expected template variables
-    accuracy_chart = age_dist_chart  # Using age distribution as the accuracy chart
-    comparison_chart = method_comparison_chart  # Using method comparison as the comparison chart
-    
+    # Charts are drawn in the browser from /api/analysis
     # Check if it's an AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # Return only the content part for AJAX requests
         return render_template('analysis_content.html',
-                             accuracy_chart=accuracy_chart,
-                             comparison_chart=comparison_chart,
                              patients=patients,
                              results=results,
                              search_query=search_query)
     
     return render_template('analysis.html',
-                         accuracy_chart=accuracy_chart,
-                         comparison_chart=comparison_chart,
                          patients=patients,
                          results=results,
                          search_query=search_query)
 
+@main.route('/api/request_stats')
+@role_required('supervisor')
+def request_stats():
+    """Per-endpoint latency histograms, SQL totals and bytes sent for this worker process"""
+    from utils.instrumentation import endpoint_stats
+    return endpoint_stats()
+
 @main.route('/clear_chart_cache')
 @role_required('supervisor')
 def clear_chart_cache():
     """Clear the chart cache"""
-    global chart_cache
-    chart_cache = {}
+    from utils.cache import get_cache
+    get_cache().clear()
     flash('Chart cache cleared successfully.')
     return redirect(url_for('main.analysis'))
 
@@ -1394,190 +1246,84 @@ def export_patients():
     # DEBUG: Log export attempt
     logger.info(f"EXPORT PATIENTS - User: {session.get('username')}, Role: {session.get('role')}")
     
-    # Export all patients as Excel file with embedded images
-    # Process in batches to handle large datasets
+    # Export all patients as Excel file with embedded images.
+    # The workbook is written in write-only mode to a temporary file and
+    # streamed back in chunks so memory stays flat for large exports.
+    import tempfile
+    from utils.export import write_patient_export, iter_file_chunks, EXPORT_MIMETYPE
     
-    # Create a workbook and select the active worksheet
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Patient Data"
+    fd, export_path = tempfile.mkstemp(prefix='patients_export_', suffix='.xlsx')
+    os.close(fd)
     
-    # Write header
-    headers = ['ID', 'Name', 'Age', 'Sex', 'OPG Image', 'A code', 'D code', 'A Age', 'D Age', 'Actual age']
-    ws.append(headers)
+    try:
+        write_patient_export(export_path, current_app.root_path)
+    except Exception:
+        os.remove(export_path)
+        raise
     
-    # Set column widths
-    for col in range(1, len(headers) + 1):
-        ws.column_dimensions[get_column_letter(col)].width = 15
+    from datetime import datetime
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    download_name = f"patients_export_{timestamp}.xlsx"
     
-    # Increase width for Image column (5th column -> E)
-    ws.column_dimensions['E'].width = 25
+    return Response(
+        iter_file_chunks(export_path),
+        mimetype=EXPORT_MIMETYPE,
+        headers={
+            'Content-Disposition': f'attachment; filename={download_name}',
+            'Content-Length': str(os.path.getsize(export_path))
+        }
+    )
 
-    # Make header row bold
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.font = cell.font.copy(bold=True)
-    
-    # Process patients in batches to handle large datasets
-    offset = 0
-    batch_size = 100
-    has_more = True
+@main.route('/export_jobs', methods=['POST'])
+@role_required('supervisor')
+def start_export_job():
+    """Start a background export, or return the one already running"""
+    from utils.export_jobs import get_or_start_export_job, export_job_to_dict, background_exports_supported
     
-    # Retry logic for database operations
-    max_retries = 3
-    retry_delay = 1  # seconds
+    if not background_exports_supported():
+        # Serverless: a worker thread would not survive the response
+        return {'status': 'synchronous', 'download_url': url_for('main.export_patients')}
     
-    while has_more:
-        # Order patients by patient_id numerically to ensure sequential order in export
-        patients = None
-        for attempt in range(max_retries):
-            try:
-                patients = Patient.query.order_by(cast(Patient.patient_id, db.Integer)).offset(offset).limit(batch_size).all()
-                break  # Success, exit retry loop
-            except Exception as e:
-                if "SSL error" in str(e) and attempt < max_retries - 1:
-                    # SSL error, wait and retry
-                    import time
-                    time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
-                    continue
-                else:
-                    # Re-raise the exception if it's not an SSL error or we've exhausted retries
-                    raise
-        
-        if not patients:
-            has_more = False
-            continue
-            
-        # Helper function to download and process image
-        def process_patient_image(patient_data):
-            p_id, url = patient_data
-            if not url or not url.startswith('http'):
-                return p_id, None
-                
-            try:
-                import urllib.request
-                import ssl
-                
-                # Create unverified SSL context
-                ctx = ssl.create_default_context()
-                ctx.check_hostname = False
-                ctx.verify_mode = ssl.CERT_NONE
-                
-                # Reduced timeout
-                with urllib.request.urlopen(url, context=ctx, timeout=5) as response:
-                    raw_data = BytesIO(response.read())
-                    
-                    try:
-                        with PILImage.open(raw_data) as pil_img:
-                            if pil_img.mode in ('RGBA', 'P'):
-                                pil_img = pil_img.convert('RGB')
-                            pil_img.thumbnail((300, 300))
-                            
-                            image_data = BytesIO()
-                            pil_img.save(image_data, format='JPEG', quality=85)
-                            image_data.seek(0)
-                            return p_id, image_data
-                    except Exception:
-                        # Return original if resize fails
-                        raw_data.seek(0)
-                        return p_id, raw_data
-            except Exception as e:
-                logger.error(f"Failed to download image for {p_id}: {e}")
-                return p_id, None
-
-        # Prepare list for parallel download
-        download_tasks = []
-        for p in patients:
-            if p.opg_link and p.opg_link.startswith('http'):
-                download_tasks.append((p.id, p.opg_link))
-        
-        # Execute parallel downloads (max 20 workers)
-        image_map = {}
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-            # map returns results in order
-            pass 
-            # We use submit to get futures
-            future_to_pid = {executor.submit(process_patient_image, task): task[0] for task in download_tasks}
-            
-            for future in concurrent.futures.as_completed(future_to_pid):
-                p_id, img_data = future.result()
-                if img_data:
-                    image_map[p_id] = img_data
-
-        # Write data row by row
-        for row_idx, patient in enumerate(patients, start=offset+2):
-            # Set row height
-            ws.row_dimensions[row_idx].height = 80
-            
-            # Add patient data
-            ws.cell(row=row_idx, column=1, value=patient.patient_id)
-            ws.cell(row=row_idx, column=2, value=patient.name)
-            ws.cell(row=row_idx, column=3, value=patient.actual_age)
-            ws.cell(row=row_idx, column=4, value=patient.sex)
-            ws.cell(row=row_idx, column=6, value=patient.code_a)
-            ws.cell(row=row_idx, column=7, value=patient.code_b)
-            ws.cell(row=row_idx, column=8, value=patient.alqahtani_estimated_age)
-            ws.cell(row=row_idx, column=9, value=patient.demirjian_estimated_age)
-            ws.cell(row=row_idx, column=10, value=patient.actual_age)
-            
-            # Handle image embedding
-            if patient.opg_link:
-                try:
-                    img = None
-                    if patient.opg_link.startswith('http'):
-                        # Retrieve from pre-downloaded map
-                        if patient.id in image_map:
-                            img = ExcelImage(image_map[patient.id])
-                    else:
-                        # Local file fallback
-                        image_path = patient.opg_link.lstrip('/')
-                        possible_paths = [
-                            os.path.join(current_app.root_path, image_path),
-                            os.path.abspath(image_path),
-                            image_path
-                        ]
-                        for path in possible_paths:
-                            if os.path.exists(path):
-                                img = ExcelImage(path)
-                                break
-                    
-                    if img:
-                        img.height = 100
-                        img.width = 100
-                        ws.add_image(img, f'E{row_idx}')
-                    else:
-                        ws.cell(row=row_idx, column=5, value="Image Load Error" if patient.opg_link.startswith('http') else "File Not Found")
-                        
-                except Exception as e:
-                    logger.error(f"Error embedding image for {patient.patient_id}: {e}")
-                    ws.cell(row=row_idx, column=5, value="Error")
-            else:
-                ws.cell(row=row_idx, column=5, value="No Image")
-        
-        offset += len(patients)
-        if len(patients) < batch_size:
-            has_more = False
+    job, created = get_or_start_export_job(current_app._get_current_object(), session.get('user_id'))
+    data = export_job_to_dict(job)
+    data['status_url'] = url_for('main.export_job_status', job_id=job.id)
+    data['download_url'] = url_for('main.download_export_job', job_id=job.id)
+    return data, 202 if created else 200
+
+@main.route('/export_jobs/<job_id>')
+@role_required('supervisor')
+def export_job_status(job_id):
+    from utils.export_jobs import export_job_to_dict, expire_stale_job
     
-    # Save the workbook to a BytesIO buffer
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
+    job = ExportJob.query.get(job_id)
+    if not job:
+        return {'error': 'Export job not found'}, 404
+    expire_stale_job(job)
     
-    # DEBUG: Log file size and content
-    file_size = len(output.getvalue())
-    logger.info(f"Generated Excel file size: {file_size} bytes")
+    data = export_job_to_dict(job)
+    if job.status == 'complete':
+        data['download_url'] = url_for('main.download_export_job', job_id=job.id)
+    return data
+
+@main.route('/export_jobs/<job_id>/download')
+@role_required('supervisor')
+def download_export_job(job_id):
+    from utils.export import EXPORT_MIMETYPE
     
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    download_name = f"patients_export_{timestamp}.xlsx"
+    job = ExportJob.query.get(job_id)
+    if not job or job.status != 'complete':
+        return {'error': 'Export is not ready'}, 404
+    if not job.file_path or not os.path.exists(job.file_path):
+        return {'error': 'Export file has expired, please start a new export'}, 410
     
-    # Simple and reliable response
-    output.seek(0)
+    timestamp = job.created_at.strftime("%Y%m%d_%H%M%S")
+    # conditional=True enables ETag/If-Range and HTTP Range requests for resumable downloads
     return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        job.file_path,
+        mimetype=EXPORT_MIMETYPE,
         as_attachment=True,
-        download_name=download_name
+        download_name=f"patients_export_{timestamp}.xlsx",
+        conditional=True
     )
 
 @main.route('/reset-passwords', methods=['GET', 'POST'])
@@ -85,6 +85,149 @@ def update_patient_table():
         db.session.rollback()
         raise e
 
+def update_estimation_entry_table():
+    """Add the patient link columns to an existing estimation_entry table"""
+    # This function should be called within an app context
+    from sqlalchemy import text
+    
+    try:
+        # Check if patient_pk column exists
+        result = db.session.execute(text("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'estimation_entry' AND column_name = 'patient_pk'
+        """))
+        
+        if not result.fetchone():
+            db.session.execute(text(
+                "ALTER TABLE estimation_entry ADD COLUMN patient_pk INTEGER REFERENCES patient (id) ON DELETE CASCADE"
+            ))
+            db.session.execute(text("ALTER TABLE estimation_entry ADD COLUMN code_slot VARCHAR(1)"))
+        
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_estimation_entry_patient_slot ON estimation_entry (patient_pk, code_slot)"
+        ))
+        
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+def backfill_estimation_patients():
+    """Link estimation entries created before patient_pk existed to their patient and code slot"""
+    # This function should be called within an app context
+    from sqlalchemy import text
+    
+    try:
+        linked = 0
+        for slot, code_column in (('a', 'code_a'), ('b', 'code_b')):
+            result = db.session.execute(text(f"""
+                UPDATE estimation_entry SET patient_pk = patient.id, code_slot = '{slot}'
+                FROM patient
+                WHERE estimation_entry.patient_pk IS NULL AND patient.{code_column} = estimation_entry.code
+            """))
+            linked += result.rowcount
+        
+        if linked:
+            logging.info(f"Linked {linked} estimation entries to their patients")
+            
+        db.session.commit()
+        return linked
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+def build_estimate_aggregates(rebuild=False):
+    """Build the estimate aggregate table if it never was, or rebuild it (see utils/aggregates.py)"""
+    # This function should be called within an app context
+    from utils.aggregates import ensure_aggregates, rebuild_aggregates
+    
+    if rebuild:
+        # Newly linked entries move from the unmatched band to their patient's
+        rebuild_aggregates()
+        logging.info("Estimate aggregates rebuilt")
+    elif ensure_aggregates():
+        logging.info("Estimate aggregates built")
+
+def migrate_tooth_stages():
+    """Pack the per-tooth stage columns of estimation_entry into two bytea columns and drop them"""
+    # This function should be called within an app context
+    from sqlalchemy import text
+    from dental_methods import ALQAHATNI_TEETH, DEMIRJIAN_TEETH, pack_stages
+    
+    legacy_columns = {
+        'alqahtani': {tooth: f'tooth_{tooth}_stage' for tooth in ALQAHATNI_TEETH},
+        'demirjian': {tooth: f'tooth_{tooth}_demirjian' for tooth in DEMIRJIAN_TEETH}
+    }
+    
+    try:
+        result = db.session.execute(text("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'estimation_entry' AND column_name LIKE 'tooth\\_%'
+        """))
+        known = {column for columns in legacy_columns.values() for column in columns.values()}
+        existing = {row[0] for row in result} & known
+        if not existing:
+            return
+        
+        db.session.execute(text("ALTER TABLE estimation_entry ADD COLUMN IF NOT EXISTS alqahtani_stages BYTEA"))
+        db.session.execute(text("ALTER TABLE estimation_entry ADD COLUMN IF NOT EXISTS demirjian_stages BYTEA"))
+        
+        for method, columns in legacy_columns.items():
+            present = {tooth: column for tooth, column in columns.items() if column in existing}
+            if not present:
+                continue
+            
+            rows = db.session.execute(text(
+                f"SELECT id, {', '.join(present.values())} FROM estimation_entry "
+                f"WHERE {' OR '.join(f'{column} IS NOT NULL' for column in present.values())}"
+            )).fetchall()
+            
+            updates = [
+                {'pk': row[0], 'stages': pack_stages(dict(zip(present, row[1:])), method)}
+                for row in rows
+            ]
+            if updates:
+                db.session.execute(text(f"UPDATE estimation_entry SET {method}_stages = :stages WHERE id = :pk"), updates)
+                logging.info(f"Packed {method} stages of {len(updates)} estimation entries")
+        
+        # Drop the old columns only once every row has been packed (same transaction)
+        for column in sorted(existing):
+            db.session.execute(text(f"ALTER TABLE estimation_entry DROP COLUMN {column}"))
+            
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+def migrate_opg_links():
+    """Replace stored Supabase signed/public URLs with bare object paths"""
+    # This function should be called within an app context
+    # Signed URLs are now generated on demand, so only the path is kept
+    from models import Patient
+    from utils.storage import object_path_from_url
+    
+    try:
+        rows = db.session.query(Patient.id, Patient.opg_link).filter(
+            Patient.opg_link.like('%/storage/v1/object/%')
+        ).all()
+        
+        updates = []
+        for patient_pk, opg_link in rows:
+            object_path = object_path_from_url(opg_link)
+            if object_path:
+                updates.append({'pk': patient_pk, 'path': object_path})
+        
+        if updates:
+            db.session.execute(text("UPDATE patient SET opg_link = :path WHERE id = :pk"), updates)
+            logging.info(f"Converted {len(updates)} OPG links to object paths")
+            
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
 def create_indexes():
     """Create database indexes for better performance"""
     # This function should be called within an app context
@@ -102,11 +245,43 @@ def create_indexes():
         # Index on estimation entry codes
         db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_estimation_entry_code ON estimation_entry (code)"))
         
+        # Index for the newest-first keyset pagination of completed assessments. Its
+        # order must match the query's (created_at DESC NULLS LAST, id DESC) exactly;
+        # plain DESC means NULLS FIRST and the planner would sort the whole table
+        db.session.execute(text("DROP INDEX IF EXISTS idx_patient_created_at_id"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_patient_created_at_nulls_last_id ON patient (created_at DESC NULLS LAST, id DESC)"
+        ))
+        
         db.session.commit()
+        
+        # Trigram indexes so the substring search in utils/search.py avoids sequential scans
+        create_trigram_indexes()
     except Exception as e:
         db.session.rollback()
         raise e
 
+def create_trigram_indexes():
+    """Create pg_trgm GIN indexes on the searchable patient columns (PostgreSQL only)"""
+    # This function should be called within an app context
+    from sqlalchemy import text
+    from utils.search import TRIGRAM_INDEXED_COLUMNS
+    
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    
+    try:
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in TRIGRAM_INDEXED_COLUMNS:
+            db.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_patient_{column}_trgm ON patient USING gin ({column} gin_trgm_ops)"
+            ))
+        db.session.commit()
+    except Exception as e:
+        # Search still works without the indexes, only slower
+        db.session.rollback()
+        logging.warning(f"Could not create trigram indexes: {e}")
+
 def init_db(app=None):
     """Initialize the database with proper connection handling"""
     start_time = time.time()
@@ -157,6 +332,17 @@ def init_db(app=None):
                 update_patient_table()
                 logging.info("Patient table structure updated")
                 
+                # Link estimation entries to their patients
+                update_estimation_entry_table()
+                linked = backfill_estimation_patients()
+                build_estimate_aggregates(rebuild=bool(linked))
+                migrate_tooth_stages()
+                logging.info("Estimation entry table structure updated")
+                
+                # Store OPG object paths instead of long-lived signed URLs
+                migrate_opg_links()
+                logging.info("OPG links migrated")
+                
                 # Create indexes
                 create_indexes()
                 logging.info("Database indexes created")
@@ -173,6 +359,17 @@ def init_db(app=None):
             update_patient_table()
             logging.info("Patient table structure updated")
             
+            # Link estimation entries to their patients
+            update_estimation_entry_table()
+            linked = backfill_estimation_patients()
+            build_estimate_aggregates(rebuild=bool(linked))
+            migrate_tooth_stages()
+            logging.info("Estimation entry table structure updated")
+            
+            # Store OPG object paths instead of long-lived signed URLs
+            migrate_opg_links()
+            logging.info("OPG links migrated")
+            
             # Create indexes
             create_indexes()
             logging.info("Database indexes created")
@@ -0,0 +1,113 @@
+(function () {
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+    const COLORS = { alqahtani: '#333333', demirjian: '#999999' };
+    const LABELS = { alqahtani: 'AlQahtani', demirjian: 'Demirjian' };
+    const W = 600, H = 340, PAD = { left: 50, right: 20, top: 30, bottom: 45 };
+
+    function el(name, attrs, text) {
+        const node = document.createElementNS(SVG_NS, name);
+        for (const key in attrs) node.setAttribute(key, attrs[key]);
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    function frame(xLabel, yLabel) {
+        const svg = el('svg', { viewBox: `0 0 ${W} ${H}`, width: '100%', 'font-size': '12', 'font-family': 'monospace' });
+        svg.appendChild(el('line', { x1: PAD.left, y1: H - PAD.bottom, x2: W - PAD.right, y2: H - PAD.bottom, stroke: '#000' }));
+        svg.appendChild(el('line', { x1: PAD.left, y1: PAD.top, x2: PAD.left, y2: H - PAD.bottom, stroke: '#000' }));
+        svg.appendChild(el('text', { x: (W + PAD.left) / 2, y: H - 8, 'text-anchor': 'middle' }, xLabel));
+        svg.appendChild(el('text', { x: 14, y: H / 2, 'text-anchor': 'middle', transform: `rotate(-90 14 ${H / 2})` }, yLabel));
+        return svg;
+    }
+
+    function legend(svg, methods) {
+        methods.forEach((m, i) => {
+            const x = W - PAD.right - 110, y = PAD.top + i * 18;
+            svg.appendChild(el('rect', { x: x, y: y - 10, width: 12, height: 12, fill: COLORS[m] }));
+            svg.appendChild(el('text', { x: x + 18, y: y }, LABELS[m]));
+        });
+    }
+
+    // Side-by-side histogram bars on shared bin edges
+    function drawHistogram(container, hist, xLabel) {
+        const methods = Object.keys(LABELS).filter(m => (hist[m] || []).some(c => c > 0));
+        const svg = frame(xLabel, 'Frequency');
+        const edges = hist.edges, bins = edges.length - 1;
+        const maxCount = Math.max(1, ...methods.flatMap(m => hist[m]));
+        const plotW = W - PAD.left - PAD.right, plotH = H - PAD.top - PAD.bottom;
+        const binW = plotW / bins, barW = binW / Math.max(1, methods.length);
+
+        methods.forEach((m, j) => {
+            hist[m].forEach((count, i) => {
+                if (!count) return;
+                const h = plotH * count / maxCount;
+                svg.appendChild(el('rect', {
+                    x: PAD.left + i * binW + j * barW, y: H - PAD.bottom - h,
+                    width: Math.max(1, barW - 1), height: h, fill: COLORS[m]
+                }));
+            });
+        });
+        [0, Math.floor(bins / 2), bins].forEach(i => {
+            svg.appendChild(el('text', { x: PAD.left + i * binW, y: H - PAD.bottom + 16, 'text-anchor': 'middle' }, edges[i].toFixed(1)));
+        });
+        svg.appendChild(el('text', { x: PAD.left - 6, y: PAD.top + 4, 'text-anchor': 'end' }, maxCount));
+        legend(svg, methods);
+        container.replaceChildren(svg);
+    }
+
+    // Mean absolute error per method, with value labels
+    function drawComparison(container, summary) {
+        const methods = Object.keys(LABELS);
+        const svg = frame('Method', 'Mean Absolute Error (years)');
+        const maxError = Math.max(0.01, ...methods.map(m => summary[m].mean_error));
+        const plotW = W - PAD.left - PAD.right, plotH = H - PAD.top - PAD.bottom;
+        const slot = plotW / methods.length;
+
+        methods.forEach((m, i) => {
+            const value = summary[m].mean_error;
+            const h = plotH * value / maxError;
+            const x = PAD.left + i * slot + slot * 0.2;
+            svg.appendChild(el('rect', { x: x, y: H - PAD.bottom - h, width: slot * 0.6, height: h, fill: COLORS[m] }));
+            svg.appendChild(el('text', { x: x + slot * 0.3, y: H - PAD.bottom - h - 6, 'text-anchor': 'middle' }, value.toFixed(2)));
+            svg.appendChild(el('text', { x: x + slot * 0.3, y: H - PAD.bottom + 16, 'text-anchor': 'middle' }, LABELS[m]));
+        });
+        container.replaceChildren(svg);
+    }
+
+    // Draw the charts of one #analysis-charts container from its data-url
+    function drawAnalysisCharts(root) {
+        root = root || document.getElementById('analysis-charts');
+        if (!root || root.dataset.drawn) return;
+        root.dataset.drawn = 'true';
+        fetch(root.dataset.url, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) throw new Error('HTTP ' + response.status);
+                return response.json();
+            })
+            .then(data => {
+                if (!data.total) {
+                    root.innerHTML = '<p>No data available for analysis yet.</p>';
+                    return;
+                }
+                drawHistogram(root.querySelector('#accuracy-chart'), data.age_histogram, 'Estimated Age (years)');
+                drawComparison(root.querySelector('#comparison-chart'), data.summary);
+            })
+            .catch(err => {
+                root.innerHTML = '<p>Could not load charts: ' + err.message + '</p>';
+            });
+    }
+    window.drawAnalysisCharts = drawAnalysisCharts;
+
+    function start() {
+        drawAnalysisCharts();
+        // Scripts inside HTML assigned to innerHTML never run, so redraw
+        // whenever analysis_content.html is swapped in by an AJAX refresh
+        new MutationObserver(() => drawAnalysisCharts()).observe(document.body, { childList: true, subtree: true });
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', start);
+    } else {
+        start();
+    }
+})();
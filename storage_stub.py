@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Supabase storage API, for load tests and offline runs.
+
+Implements the storage endpoints used by utils/storage.py and utils/health.py
+with objects held in memory:
+
+    GET    /storage/v1/bucket/<bucket>                  bucket info (readiness probe)
+    POST   /storage/v1/object/sign/<bucket>             batch signing {"expiresIn", "paths"}
+    POST   /storage/v1/object/sign/<bucket>/<path>      single signed URL
+    POST   /storage/v1/object/upload/sign/<bucket>/<path>  signed upload URL
+    PUT    /storage/v1/object/upload/sign/<bucket>/<path>  upload through a signed URL
+    POST   /storage/v1/object/<bucket>/<path>           upload (x-upsert)
+    GET    /storage/v1/object/[sign/|public/]<bucket>/<path>  download
+    DELETE /storage/v1/object/<bucket>                  remove {"prefixes": [...]}
+
+Objects that were never uploaded are served as a placeholder JPEG, so
+patients seeded with any OPG path have an image to download. Signing does
+not check credentials or tokens.
+
+Standalone:
+    python storage_stub.py --port 54321 --latency 20
+then start the app with SUPABASE_URL=http://127.0.0.1:54321 and any SUPABASE_KEY.
+"""
+
+import io
+import json
+import time
+import argparse
+import threading
+from urllib.parse import unquote, quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIX = '/storage/v1'
+
+
+def placeholder_jpeg(width=1200, height=600):
+    """Return a grey JPEG about the size of a downscaled OPG."""
+    from PIL import Image, ImageDraw
+    image = Image.new('L', (width, height), 90)
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, 40):
+        draw.line([(x, 0), (x, height)], fill=140)
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+class StorageStub:
+    """In-memory storage server running on a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        """
+        Args:
+            host (str): Interface to listen on
+            port (int): Port, 0 for any free port
+            latency (float): Delay in seconds added to every response, to mimic the network
+        """
+        self.latency = latency
+        self.objects = {}  # (bucket, path) -> (content type, bytes)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._placeholder = None
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='storage-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_object(self, bucket, path):
+        with self.lock:
+            stored = self.objects.get((bucket, path))
+            if stored is None:
+                if self._placeholder is None:
+                    self._placeholder = placeholder_jpeg()
+                stored = ('image/jpeg', self._placeholder)
+            return stored
+
+    def put_object(self, bucket, path, content_type, content):
+        with self.lock:
+            self.objects[(bucket, path)] = (content_type, content)
+
+    def remove_objects(self, bucket, paths):
+        with self.lock:
+            return [path for path in paths if self.objects.pop((bucket, path), None) is not None]
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _send(self, status, content, content_type='application/json'):
+                if not isinstance(content, bytes):
+                    content = json.dumps(content).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _route(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    stub.requests += 1
+                path = self.path.split('?', 1)[0]
+                if not path.startswith(PREFIX + '/'):
+                    return []
+                return [unquote(part) for part in path[len(PREFIX) + 1:].split('/')]
+
+            def do_GET(self):
+                parts = self._route()
+                if parts[:1] == ['bucket'] and len(parts) == 2:
+                    return self._send(200, {'id': parts[1], 'name': parts[1], 'public': False})
+                if parts[:1] == ['object']:
+                    parts = parts[1:]
+                    if parts[:1] in (['sign'], ['public'], ['authenticated']):
+                        parts = parts[1:]
+                    if len(parts) >= 2:
+                        content_type, content = stub.get_object(parts[0], '/'.join(parts[1:]))
+                        return self._send(200, content, content_type)
+                self._send(404, {'error': 'not_found', 'message': 'Object not found'})
+
+            def do_POST(self):
+                parts = self._route()
+                body = self._body()
+                if parts[:2] == ['object', 'sign'] and len(parts) == 3:
+                    bucket = parts[2]
+                    paths = json.loads(body or b'{}').get('paths', [])
+                    return self._send(200, [
+                        {'path': path, 'signedURL': f"/object/sign/{bucket}/{quote(path)}?token=stub", 'error': None}
+                        for path in paths
+                    ])
+                if parts[:2] == ['object', 'sign'] and len(parts) > 3:
+                    path = '/'.join(parts[3:])
+                    return self._send(200, {'signedURL': f"/object/sign/{parts[2]}/{quote(path)}?token=stub"})
+                if parts[:3] == ['object', 'upload', 'sign'] and len(parts) > 4:
+                    path = '/'.join(parts[4:])
+                    return self._send(200, {'url': f"/object/upload/sign/{parts[3]}/{quote(path)}?token=stub", 'token': 'stub'})
+                if parts[:1] == ['object'] and len(parts) > 2:
+                    return self._upload(parts[1], '/'.join(parts[2:]), body)
+                self._send(404, {'error': 'not_found', 'message': 'Unknown endpoint'})
+
+            def do_PUT(self):
+                parts = self._route()
+                body = self._body()
+                if parts[:3] == ['object', 'upload', 'sign'] and len(parts) > 4:
+                    return self._upload(parts[3], '/'.join(parts[4:]), body)
+                if parts[:1] == ['object'] and len(parts) > 2:
+                    return self._upload(parts[1], '/'.join(parts[2:]), body)
+                self._send(404, {'error': 'not_found', 'message': 'Unknown endpoint'})
+
+            def do_DELETE(self):
+                parts = self._route()
+                body = self._body()
+                if parts[:1] == ['object'] and len(parts) == 2:
+                    removed = stub.remove_objects(parts[1], json.loads(body or b'{}').get('prefixes', []))
+                    return self._send(200, [{'name': path, 'bucket_id': parts[1]} for path in removed])
+                self._send(404, {'error': 'not_found', 'message': 'Unknown endpoint'})
+
+            def _upload(self, bucket, path, body):
+                stub.put_object(bucket, path, self.headers.get('Content-Type', 'application/octet-stream'), body)
+                self._send(200, {'Key': f"{bucket}/{path}"})
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Supabase storage stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency', type=float, default=0.0, help='milliseconds added to every response')
+    args = parser.parse_args()
+
+    stub = StorageStub(args.host, args.port, args.latency / 1000)
+    print(f"Storage stub listening on {stub.url}/storage/v1 (Ctrl+C to stop)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+# Tests import the app modules (models, routes, utils.*) from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py reads the environment at import time, so point everything at a
+# scratch directory before the app is imported
+_SCRATCH = tempfile.mkdtemp(prefix='dental_tests_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_SCRATCH, 'test.db')}"
+os.environ['FLASK_ENV'] = 'production'
+os.environ['CACHE_DIR'] = os.path.join(_SCRATCH, 'cache')
+os.environ['THUMBNAIL_CACHE_DIR'] = os.path.join(_SCRATCH, 'thumbnails')
+for name in ('VERCEL', 'RENDER', 'CACHE_BACKEND', 'SUPABASE_DB_URL'):
+    os.environ.pop(name, None)
+
+CSRF_TOKEN = 'test-token'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app('production')
+    app.config['TESTING'] = True
+    yield app
+    shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+
+@pytest.fixture
+def db(app):
+    """Empty tables and an empty shared cache for each test, inside an app context."""
+    from models import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        shutil.rmtree(os.environ['CACHE_DIR'], ignore_errors=True)
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Log the test client in with a role; forms must post CSRF_TOKEN."""
+    def _login(role='supervisor'):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = role
+            session['role'] = role
+            session['csrf_token'] = CSRF_TOKEN
+    return _login
+
+
+def add_patients(db, count, start=1):
+    """Insert numbered patients with codes A####/B#### and return them."""
+    from models import Patient
+    patients = [
+        Patient(patient_id=str(i), name=f'Patient {i}', actual_age=5 + i * 0.1,
+                sex='male' if i % 2 else 'female', code_a=f'A{i:04d}', code_b=f'B{i:04d}')
+        for i in range(start, start + count)
+    ]
+    db.session.add_all(patients)
+    db.session.commit()
+    return patients
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import Patient
+from utils.data_version import get_data_version
+
+from conftest import add_patients
+
+
+@contextmanager
+def _statements(db):
+    """Collect the SQL sent to the database inside the block."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def _version_writes(statements):
+    return [s for s in statements if 'data_version' in s and not s.lstrip().upper().startswith('SELECT')]
+
+
+def test_one_bump_per_transaction(db):
+    add_patients(db, 3)
+    before = get_data_version()
+
+    with _statements(db) as seen:
+        patients = Patient.query.order_by(Patient.id).all()
+        for i, patient in enumerate(patients):
+            patient.name = f'Renamed {i}'
+            # The last change is left for commit to flush
+            if i < len(patients) - 1:
+                db.session.flush()
+        db.session.commit()
+
+    assert len(_version_writes(seen)) == 1
+    # The bump comes after the changes it covers, right before COMMIT
+    assert 'data_version' in [s for s in seen if 'UPDATE patient' in s or 'data_version' in s][-1]
+    assert get_data_version() == before + 1
+
+
+def test_untracked_commit_does_not_bump(db):
+    add_patients(db, 1)
+    before = get_data_version()
+
+    with _statements(db) as seen:
+        patient = Patient.query.first()
+        patient.name = patient.name
+        db.session.commit()
+
+    assert _version_writes(seen) == []
+    assert get_data_version() == before
+
+
+def test_rollback_discards_the_flag(db):
+    add_patients(db, 1)
+    before = get_data_version()
+
+    Patient.query.first().name = 'Discarded'
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+
+    assert get_data_version() == before
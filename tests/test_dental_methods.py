@@ -0,0 +1,101 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import dental_methods as dm
+
+DEMIRJIAN_CHOICES = dm.DEMIRJIAN_STAGES + [None, 'Z', '']
+ALQAHTANI_CHOICES = list(dm.ALQAHATNI_STAGE_VALUES) + [None, 'XIV', 'i', '']
+
+
+def _random_stages(rng, teeth, choices, count):
+    patients = []
+    for _ in range(count):
+        stages = {}
+        for tooth in teeth:
+            stage = rng.choice(choices)
+            if stage is not None:
+                stages[tooth] = stage
+        patients.append(stages)
+    return patients
+
+
+@pytest.fixture
+def rng():
+    return random.Random(20261017)
+
+
+def test_demirjian_batch_matches_scalar(rng):
+    patients = _random_stages(rng, dm.DEMIRJIAN_TEETH, DEMIRJIAN_CHOICES, 2000)
+    # Fully developed dentitions score past the end of the conversion tables
+    patients += [{tooth: 'H' for tooth in dm.DEMIRJIAN_TEETH}, {}]
+    sexes = [rng.choice(['male', 'female', 'Male', 'other']) for _ in patients]
+
+    scores, ages, margins = dm.calculate_demirjian_scores(patients, sexes)
+
+    for i, (stages, sex) in enumerate(zip(patients, sexes)):
+        expected = dm.calculate_demirjian_score(stages, sex)
+        assert (scores[i], ages[i], margins[i]) == expected
+
+
+def test_alqahtani_batch_matches_scalar(rng):
+    patients = _random_stages(rng, dm.ALQAHATNI_TEETH, ALQAHTANI_CHOICES, 2000)
+
+    ages, margins = dm.calculate_alqahtani_ages(patients)
+
+    for i, stages in enumerate(patients):
+        try:
+            expected = dm.calculate_alqahtani_age(stages, 'male')
+        except ValueError:
+            assert math.isnan(ages[i])
+            continue
+        assert (ages[i], margins[i]) == expected
+
+
+def test_alqahtani_without_valid_stages_is_nan():
+    ages, _ = dm.calculate_alqahtani_ages([{}, {'21': 'XIV'}, {'21': 'V'}])
+
+    assert math.isnan(ages[0]) and math.isnan(ages[1])
+    assert ages[2] == dm.calculate_alqahtani_age({'21': 'V'}, 'female')[0]
+
+
+@pytest.mark.parametrize('method, teeth, choices', [
+    ('demirjian', dm.DEMIRJIAN_TEETH, DEMIRJIAN_CHOICES),
+    ('alqahtani', dm.ALQAHATNI_TEETH, ALQAHTANI_CHOICES),
+])
+def test_array_and_packed_inputs_match_dicts(rng, method, teeth, choices):
+    patients = _random_stages(rng, teeth, choices, 300)
+    codes = [[stages.get(tooth) for tooth in teeth] for stages in patients]
+    packed = dm.packed_stage_matrix([dm.pack_stages(stages, method) for stages in patients], method)
+
+    if method == 'demirjian':
+        sexes = ['male', 'female'] * 150
+        run = lambda stages: dm.calculate_demirjian_scores(stages, sexes)
+    else:
+        run = dm.calculate_alqahtani_ages
+
+    expected = run(patients)
+    for result in (run(codes), run(packed)):
+        for got, want in zip(result, expected):
+            np.testing.assert_array_equal(got, want)
+
+
+def test_pack_round_trip_drops_unknown_stages():
+    stages = {'31': 'C', '32': 'H', '33': 'Z'}
+    packed = dm.pack_stages(stages, 'demirjian')
+
+    assert len(packed) == len(dm.DEMIRJIAN_TEETH)
+    assert dm.unpack_stages(packed, 'demirjian') == {'31': 'C', '32': 'H'}
+
+
+def test_empty_batch():
+    scores, ages, margins = dm.calculate_demirjian_scores([], [])
+
+    assert scores.shape == ages.shape == margins.shape == (0,)
+
+
+def test_mismatched_lengths_are_rejected():
+    with pytest.raises(ValueError):
+        dm.calculate_demirjian_scores([{}, {}], ['male'])
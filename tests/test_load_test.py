@@ -0,0 +1,29 @@
+import pytest
+
+from load_test import percentile
+
+
+def test_percentile_of_empty_list_is_zero():
+    assert percentile([], 0.95) == 0.0
+
+
+@pytest.mark.parametrize('fraction, expected', [
+    (0.50, 50),
+    (0.95, 95),
+    (0.99, 99),
+    (1.00, 100),
+])
+def test_nearest_rank_on_hundred_values(fraction, expected):
+    assert percentile(list(range(1, 101)), fraction) == expected
+
+
+@pytest.mark.parametrize('values, fraction, expected', [
+    ([1, 2], 0.50, 1),
+    ([1, 2, 3, 4], 0.50, 2),
+    ([1, 2, 3, 4], 0.75, 3),
+    (list(range(1, 11)), 0.95, 10),
+    (list(range(1, 21)), 0.95, 19),
+    ([7], 0.99, 7),
+])
+def test_nearest_rank_is_ceil_of_rank(values, fraction, expected):
+    assert percentile(values, fraction) == expected
@@ -0,0 +1,106 @@
+from models import Patient
+from utils.pagination import keyset_paginate, approximate_count
+
+from conftest import add_patients
+
+
+def _ids(pagination):
+    return [p.id for p in pagination.items]
+
+
+def test_first_page(db):
+    add_patients(db, 45)
+    page = keyset_paginate(Patient.query, Patient.id, per_page=20)
+
+    assert _ids(page) == list(range(1, 21))
+    assert (page.page, page.total, page.pages) == (1, 45, 3)
+    assert not page.has_prev and page.has_next
+    assert page.prev_args == {}
+    assert page.next_args == {'after': 20, 'page': 2}
+
+
+def test_after_cursor_walks_every_row_once(db):
+    add_patients(db, 45)
+    seen = []
+    page = keyset_paginate(Patient.query, Patient.id, per_page=20)
+    seen += _ids(page)
+    while page.has_next:
+        page = keyset_paginate(Patient.query, Patient.id, per_page=20, **page.next_args)
+        seen += _ids(page)
+
+    assert seen == list(range(1, 46))
+    assert page.page == 3 and page.has_prev and not page.has_next
+    assert page.next_args == {}
+
+
+def test_before_cursor_returns_previous_page_in_order(db):
+    add_patients(db, 45)
+    page = keyset_paginate(Patient.query, Patient.id, page=3, per_page=20, after=40)
+    page = keyset_paginate(Patient.query, Patient.id, per_page=20, **page.prev_args)
+
+    assert _ids(page) == list(range(21, 41))
+    assert page.page == 2 and page.has_prev and page.has_next
+
+
+def test_before_cursor_reaching_the_start_resets_to_page_one(db):
+    add_patients(db, 45)
+    page = keyset_paginate(Patient.query, Patient.id, page=2, per_page=20, before=21)
+
+    assert _ids(page) == list(range(1, 21))
+    assert page.page == 1 and not page.has_prev and page.has_next
+
+
+def test_cursor_skips_deleted_rows(db):
+    add_patients(db, 45)
+    Patient.query.filter(Patient.id.in_([21, 22])).delete()
+    db.session.commit()
+    page = keyset_paginate(Patient.query, Patient.id, page=2, per_page=20, after=20)
+
+    assert _ids(page) == list(range(23, 43))
+
+
+def test_exactly_full_last_page_has_no_next(db):
+    add_patients(db, 40)
+    page = keyset_paginate(Patient.query, Patient.id, page=2, per_page=20, after=20)
+
+    assert _ids(page) == list(range(21, 41))
+    assert not page.has_next and page.pages == 2
+
+
+def test_cursor_past_the_end_is_empty(db):
+    add_patients(db, 5)
+    page = keyset_paginate(Patient.query, Patient.id, page=2, per_page=20, after=5)
+
+    assert page.items == []
+    assert page.prev_args == {} and page.next_args == {}
+
+
+def test_page_number_without_cursor_uses_offset(db):
+    add_patients(db, 45)
+    page = keyset_paginate(Patient.query, Patient.id, page=3, per_page=20)
+
+    assert _ids(page) == list(range(41, 46))
+    assert page.has_prev and not page.has_next
+
+
+def test_filtered_query_counts_matches_only(db):
+    add_patients(db, 45)
+    query = Patient.query.filter(Patient.sex == 'male')
+    page = keyset_paginate(query, Patient.id, per_page=10, count_key='test:male')
+
+    assert page.total == 23 and page.exact_total == 23
+    assert not page.total_is_estimate
+    assert all(p.sex == 'male' for p in page.items)
+
+
+def test_approximate_count_is_exact_on_sqlite(db):
+    add_patients(db, 12)
+
+    assert approximate_count(Patient.query, 'test:all') == (12, False)
+
+
+def test_empty_table(db):
+    page = keyset_paginate(Patient.query, Patient.id, per_page=20)
+
+    assert page.items == [] and page.total == 0 and page.pages == 1
+    assert not page.has_prev and not page.has_next
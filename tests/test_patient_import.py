@@ -0,0 +1,98 @@
+import io
+
+from sqlalchemy import event
+
+from models import Patient
+from utils.patient_import import import_patients_csv, mark_existing_patients
+
+from conftest import CSRF_TOKEN, add_patients
+
+SIMPLE_HEADER = 'ID,Name,Age,Sex\n'
+FULL_HEADER = 'ID,Name,Age,Sex,OPG,A code,D code,A Age,D Age,Actual age\n'
+
+
+def _csv(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def _patient(patient_id):
+    return Patient.query.filter_by(patient_id=patient_id).one()
+
+
+def test_simple_format(db):
+    added, skipped = import_patients_csv(_csv(SIMPLE_HEADER + '1,Ann,7.5,female\n2,Ben,,male\n'))
+    db.session.commit()
+
+    assert (added, skipped) == (2, 0)
+    ann = _patient('1')
+    assert (ann.name, ann.actual_age, ann.sex, ann.code_a, ann.opg_link) == ('Ann', 7.5, 'female', None, None)
+    assert _patient('2').actual_age == 0
+
+
+def test_full_format_uses_actual_age_codes_and_opg(db):
+    import_patients_csv(_csv(FULL_HEADER + '5,Cal,9,male,opg/5.jpg,AX5,DX5,9.1,8.8,9.4\n'))
+    db.session.commit()
+
+    cal = _patient('5')
+    assert (cal.actual_age, cal.code_a, cal.code_b, cal.opg_link) == (9.4, 'AX5', 'DX5', 'opg/5.jpg')
+
+
+def test_existing_and_repeated_ids_are_skipped(db):
+    add_patients(db, 3)
+    body = SIMPLE_HEADER + '2,Dup,5,male\n10,New,6,female\n10,Again,6,female\nshort,row\n11,Last,8,male\n'
+
+    added, skipped = import_patients_csv(_csv(body))
+    db.session.commit()
+
+    assert (added, skipped) == (2, 2)
+    assert _patient('2').name == 'Patient 2'
+    assert _patient('10').name == 'New'
+    assert Patient.query.count() == 5
+
+
+def test_one_existence_query_and_insert_per_chunk(db, app):
+    add_patients(db, 5)
+    rows = ''.join(f'{i},P{i},{5 + i % 7},male\n' for i in range(1, 26))
+    statements = []
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement.lstrip().split()[0].upper())
+
+    event.listen(db.engine, 'before_cursor_execute', _record)
+    try:
+        added, skipped = import_patients_csv(_csv(SIMPLE_HEADER + rows), chunk_size=10)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _record)
+    db.session.commit()
+
+    assert (added, skipped) == (20, 5)
+    # 25 rows in chunks of 10: one existence check and one executemany INSERT per chunk
+    assert statements.count('SELECT') == 3
+    assert statements.count('INSERT') == 3
+    assert Patient.query.count() == 25
+
+
+def test_mark_existing_patients_flags_in_order(db):
+    add_patients(db, 2)
+    rows = [{'patient_id': pid} for pid in ('1', '7', '7', '2', '8')]
+
+    flags = [(row['patient_id'], duplicate) for row, duplicate in mark_existing_patients(rows, chunk_size=2)]
+
+    assert flags == [('1', True), ('7', False), ('7', True), ('2', True), ('8', False)]
+
+
+def test_csv_upload_route(client, login, db):
+    add_patients(db, 1)
+    login('supervisor')
+    body = SIMPLE_HEADER + '1,Dup,5,male\n' + ''.join(f'{i},P{i},7,female\n' for i in range(2, 6))
+
+    response = client.post('/patients', data={
+        'csrf_token': CSRF_TOKEN,
+        'csv_file': (_csv(body), 'patients.csv'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        messages = [message for _, message in session['_flashes']]
+    assert 'CSV import successful! Added: 4, Skipped (already exist): 1' in messages
+    assert Patient.query.count() == 5
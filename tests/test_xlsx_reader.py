@@ -0,0 +1,99 @@
+import io
+import zipfile
+
+import openpyxl
+
+from utils.xlsx_reader import XlsxSheetReader
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>"""
+
+SHARED_STRINGS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="4" uniqueCount="4">
+<si><t>ID</t></si><si><t>Name</t></si><si><t>OPG</t></si><si><t>P1</t></si>
+</sst>"""
+
+# E2:E4 share one HYPERLINK formula (as Excel writes a filled-down column);
+# row 5 is empty and row 6 has a plain formula
+SHEET = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<dimension ref="A1:E6"/>
+<sheetData>
+<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="E1" t="s"><v>2</v></c></row>
+<row r="2"><c r="A2" t="s"><v>3</v></c><c r="B2"><v>12.5</v></c><c r="E2" t="str"><f t="shared" ref="E2:E4" si="0">HYPERLINK("https://example.com/"&amp;A2,A2)</f><v>P1</v></c></row>
+<row r="3"><c r="A3" t="str"><v>P2</v></c><c r="B3"><v>13</v></c><c r="E3" t="str"><f t="shared" si="0"/><v>P2</v></c></row>
+<row r="4"><c r="A4" t="str"><v>P3</v></c><c r="B4"><v>14</v></c><c r="E4" t="str"><f t="shared" si="0"/><v>P3</v></c></row>
+<row r="6"><c r="A6" t="str"><v>P4</v></c><c r="E6"><f>B2+B3</f><v>25.5</v></c></row>
+</sheetData>
+</worksheet>"""
+
+
+def _workbook_bytes():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/workbook.xml', WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        archive.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        archive.writestr('xl/worksheets/sheet1.xml', SHEET)
+    return buffer.getvalue()
+
+
+def _openpyxl_rows(content, data_only):
+    ws = openpyxl.load_workbook(io.BytesIO(content), data_only=data_only).active
+    return list(ws.iter_rows(values_only=True))
+
+
+def _reader_rows(content):
+    with XlsxSheetReader(io.BytesIO(content)) as reader:
+        return list(reader.iter_rows())
+
+
+def test_shared_formulas_are_expanded():
+    rows = _reader_rows(_workbook_bytes())
+    formulas = {row_number: formula_row[4] for row_number, _, formula_row in rows}
+
+    assert formulas[2] == '=HYPERLINK("https://example.com/"&A2,A2)'
+    assert formulas[3] == '=HYPERLINK("https://example.com/"&A3,A3)'
+    assert formulas[4] == '=HYPERLINK("https://example.com/"&A4,A4)'
+    assert formulas[6] == '=B2+B3'
+
+
+def test_matches_openpyxl_values_and_formulas():
+    content = _workbook_bytes()
+    rows = _reader_rows(content)
+
+    assert [row_number for row_number, _, _ in rows] == [1, 2, 3, 4, 5, 6]
+    assert [values for _, values, _ in rows] == _openpyxl_rows(content, data_only=True)
+    assert [formulas for _, _, formulas in rows] == _openpyxl_rows(content, data_only=False)
+
+
+def test_empty_rows_are_yielded_like_openpyxl():
+    rows = _reader_rows(_workbook_bytes())
+    _, values, formulas = rows[4]
+
+    assert values == (None,) * 5
+    assert formulas == (None,) * 5
@@ -12,10 +12,11 @@ Usage:
 """
 
 import os, re, sys, uuid, glob
-import openpyxl
 from openpyxl import Workbook
 from pathlib import Path
 
+from utils.xlsx_reader import XlsxSheetReader
+
 INPUT_EXCEL  = '/Users/sittminthar/Downloads/Dental-Blinding-Process-Project-master/Blinding_TT1_mapped_links.xlsx'
 OUTPUT_EXCEL = '/Users/sittminthar/Downloads/Dental-Blinding-Process-Project-master/Blinding_TT1_supabase_urls.xlsx'
 BUCKET = 'opg-images'
@@ -124,22 +125,19 @@ def main():
     supabase_url, key = get_creds()
 
     print(f"Reading: {INPUT_EXCEL}")
-    wb_formula = openpyxl.load_workbook(INPUT_EXCEL, data_only=False)
-    wb_data    = openpyxl.load_workbook(INPUT_EXCEL, data_only=True)
-    ws_formula = wb_formula.active
-    ws_data    = wb_data.active
-    data_rows  = {i: r for i, r in enumerate(ws_data.iter_rows(min_row=1, values_only=True), 1)}
+    # One pass gives both the cached values and the HYPERLINK formula text
+    reader = XlsxSheetReader(INPUT_EXCEL)
+    rows = reader.iter_rows()
 
     wb_out = Workbook()
     ws_out = wb_out.active
 
-    headers = [c.value for c in ws_formula[1]]
-    ws_out.append(headers)
+    _, _, headers = next(rows, (None, None, ()))
+    ws_out.append(list(headers))
 
     total = uploaded = skipped = errors = 0
 
-    for row_idx, formula_row in enumerate(ws_formula.iter_rows(min_row=2, values_only=True), 2):
-        data_row = data_rows.get(row_idx, formula_row)
+    for row_idx, data_row, formula_row in rows:
         total += 1
 
         out = list(data_row) if data_row else list(formula_row)
@@ -191,8 +189,7 @@ def main():
         ws_out.append(out)
 
     wb_out.save(OUTPUT_EXCEL)
-    wb_formula.close()
-    wb_data.close()
+    reader.close()
 
     print()
     print("=" * 55)
@@ -0,0 +1,253 @@
+"""
+Precomputed estimate statistics.
+
+The estimate_aggregate table keeps, per method and per whole-year band of
+actual age, the number of estimates and the sums of absolute and squared
+errors. Rows are adjusted in the same transaction as the change that
+affects them (a new estimate, a deleted patient, a corrected actual age),
+so dashboards read a handful of rows instead of scanning the estimate and
+patient tables. rebuild_aggregates() recomputes everything from scratch.
+
+Incremental updates are only meaningful on top of a complete table, so a
+rebuild records a marker (a data_version row named AGGREGATES_BUILT) and
+ensure_aggregates() rebuilds whenever the marker is missing, e.g. on a
+database that had estimates before the table existed. An empty table is
+not a usable signal: the first estimate or delete after deploying writes a
+partial row.
+"""
+
+import math
+import logging
+from datetime import datetime
+
+from sqlalchemy import update, select, text
+
+from models import db, Patient, EstimationEntry, EstimateAggregate, DataVersion
+
+logger = logging.getLogger(__name__)
+
+# age_band used for estimates not linked to a patient
+UNMATCHED_BAND = -1
+
+# data_version row written by rebuild_aggregates (its version counts rebuilds)
+AGGREGATES_BUILT = 'estimate_aggregates_built'
+
+
+def upsert_increment(session, table, keys, increments):
+    """
+    Add to numeric columns of a row, creating it if it does not exist.
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite,
+    so concurrent writers never collide on a missing row.
+
+    Args:
+        session: Session whose transaction the change belongs to.
+        table (Table): Target table; keys must cover its primary key.
+        keys (dict): Primary key column values.
+        increments (dict): Column -> amount to add.
+    """
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in keys],
+            set_={name: table.c[name] + amount for name, amount in increments.items()}
+        )
+        session.execute(stmt)
+        return
+
+    condition = [table.c[name] == value for name, value in keys.items()]
+    result = session.execute(
+        update(table).where(*condition).values(
+            **{name: table.c[name] + amount for name, amount in increments.items()}
+        )
+    )
+    if result.rowcount == 0:
+        session.execute(table.insert().values(**keys, **increments))
+
+
+def age_band(actual_age):
+    """Return the aggregate band for an actual age."""
+    if actual_age is None:
+        return UNMATCHED_BAND
+    return int(math.floor(actual_age))
+
+
+def record_estimate(method, estimated_age, actual_age, sign=1):
+    """
+    Add (or, with sign=-1, remove) one estimate from the aggregates.
+
+    Runs in the caller's transaction; the caller commits.
+
+    Args:
+        method (str): Method name as submitted (case-insensitive).
+        estimated_age (float): Estimated age.
+        actual_age (float): Actual age of the matching patient, or None.
+        sign (int): 1 to add, -1 to remove.
+    """
+    error = abs(estimated_age - actual_age) if actual_age is not None else 0.0
+    upsert_increment(
+        db.session,
+        EstimateAggregate.__table__,
+        {'method': (method or '').lower(), 'age_band': age_band(actual_age)},
+        {'count': sign, 'error_sum': sign * error, 'error_sq_sum': sign * error * error}
+    )
+
+
+def _patient_estimates(patient):
+    return db.session.query(EstimationEntry.method_used, EstimationEntry.estimated_age).filter(
+        EstimationEntry.patient_pk == patient.id
+    ).all()
+
+
+def _unlinked_estimates(patient):
+    codes = [code for code in (patient.code_a, patient.code_b) if code]
+    if not codes:
+        return []
+    return db.session.query(EstimationEntry.method_used, EstimationEntry.estimated_age).filter(
+        EstimationEntry.code.in_(codes),
+        EstimationEntry.patient_pk.is_(None)
+    ).all()
+
+
+def remove_patient_estimates(patient):
+    """
+    Remove a patient's estimates from the aggregates before they are deleted.
+
+    Also removes legacy entries that carry one of the patient's codes but
+    were never linked (patient_pk NULL); those are counted as unmatched.
+
+    Args:
+        patient (Patient): Patient about to be deleted.
+    """
+    for method, estimated_age in _patient_estimates(patient):
+        record_estimate(method, estimated_age, patient.actual_age, sign=-1)
+    for method, estimated_age in _unlinked_estimates(patient):
+        record_estimate(method, estimated_age, None, sign=-1)
+
+
+def move_patient_estimates(patient, old_actual_age):
+    """
+    Re-band a patient's estimates after their actual age changed.
+
+    Args:
+        patient (Patient): Patient with the new actual_age set.
+        old_actual_age (float): Actual age the estimates were recorded with.
+    """
+    if old_actual_age == patient.actual_age:
+        return
+    for method, estimated_age in _patient_estimates(patient):
+        record_estimate(method, estimated_age, old_actual_age, sign=-1)
+        record_estimate(method, estimated_age, patient.actual_age)
+
+
+def rebuild_aggregates():
+    """
+    Recompute the aggregate table from the estimate and patient tables.
+
+    Returns:
+        int: Number of aggregate rows written.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Block incremental upserts until the rebuilt rows commit, so an estimate
+        # committed between the read below and the delete is not lost
+        db.session.execute(text("LOCK TABLE estimate_aggregate IN EXCLUSIVE MODE"))
+
+    rows = db.session.query(
+        EstimationEntry.method_used,
+        EstimationEntry.estimated_age,
+        Patient.actual_age
+    ).outerjoin(
+        Patient,
+        Patient.id == EstimationEntry.patient_pk
+    ).all()
+
+    totals = {}
+    for method, estimated_age, actual_age in rows:
+        key = ((method or '').lower(), age_band(actual_age))
+        error = abs(estimated_age - actual_age) if actual_age is not None else 0.0
+        count, error_sum, error_sq_sum = totals.get(key, (0, 0.0, 0.0))
+        totals[key] = (count + 1, error_sum + error, error_sq_sum + error * error)
+
+    db.session.query(EstimateAggregate).delete()
+    db.session.add_all(
+        EstimateAggregate(method=method, age_band=band, count=count,
+                          error_sum=error_sum, error_sq_sum=error_sq_sum)
+        for (method, band), (count, error_sum, error_sq_sum) in totals.items()
+    )
+    marker = db.session.get(DataVersion, AGGREGATES_BUILT)
+    if marker is None:
+        db.session.add(DataVersion(name=AGGREGATES_BUILT, version=1, updated_at=datetime.utcnow()))
+    else:
+        marker.version += 1
+        marker.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    logger.info(f"Rebuilt estimate aggregates from {len(rows)} estimates ({len(totals)} rows)")
+    return len(totals)
+
+
+def aggregates_built():
+    """Whether the aggregate table has been built by rebuild_aggregates()."""
+    return db.session.execute(
+        select(DataVersion.name).where(DataVersion.name == AGGREGATES_BUILT)
+    ).first() is not None
+
+
+def ensure_aggregates():
+    """
+    Build the aggregate table if it has never been built.
+
+    Called from setup_db.init_db and before reading the aggregates.
+
+    Returns:
+        bool: True if a rebuild ran.
+    """
+    if aggregates_built():
+        return False
+    try:
+        rebuild_aggregates()
+        return True
+    except Exception as e:
+        # Another worker is rebuilding at the same time
+        db.session.rollback()
+        logger.warning(f"Could not rebuild estimate aggregates: {e}")
+        return False
+
+
+def method_stats():
+    """
+    Per-method statistics read from the aggregate table.
+
+    Builds the table first if it has never been built.
+
+    Returns:
+        dict: method -> {'count', 'matched', 'mean_error', 'rmse',
+        'age_bands' (band -> count)}.
+    """
+    ensure_aggregates()
+    aggregates = EstimateAggregate.query.all()
+
+    stats = {}
+    for row in aggregates:
+        entry = stats.setdefault(row.method, {
+            'count': 0, 'matched': 0, 'error_sum': 0.0, 'error_sq_sum': 0.0, 'age_bands': {}
+        })
+        entry['count'] += row.count
+        if row.age_band != UNMATCHED_BAND:
+            entry['matched'] += row.count
+            entry['error_sum'] += row.error_sum
+            entry['error_sq_sum'] += row.error_sq_sum
+            if row.count:
+                entry['age_bands'][row.age_band] = row.count
+
+    for entry in stats.values():
+        matched = entry['matched']
+        entry['mean_error'] = entry.pop('error_sum') / matched if matched else 0.0
+        entry['rmse'] = math.sqrt(max(entry.pop('error_sq_sum'), 0.0) / matched) if matched else 0.0
+    return stats
@@ -0,0 +1,178 @@
+"""
+Inputs for the supervisor analysis charts.
+
+Every estimate is loaded together with the actual age of the patient it
+belongs to in a single joined query (on estimation_entry.patient_pk), and the columns are held as NumPy arrays
+so the charts and summary statistics are plain array operations. The
+browser receives pre-binned chart data (build_analysis_payload) and draws
+the charts itself.
+"""
+
+import logging
+
+import numpy as np
+
+from models import db, Patient, EstimationEntry
+
+logger = logging.getLogger(__name__)
+
+# Methods shown in the charts, as stored (lower-cased) in method_used
+ANALYSIS_METHODS = ('alqahtani', 'demirjian')
+
+# Number of bins in the histograms sent to the browser
+HISTOGRAM_BINS = 20
+
+
+def load_estimation_arrays():
+    """
+    Load every estimate with its patient's actual age in one query.
+
+    Returns:
+        dict: Arrays of equal length, one element per EstimationEntry in id order:
+            'estimated' (float) estimated age,
+            'method' (str) lower-cased method_used,
+            'actual' (float) actual age of the matching patient, NaN if none,
+            'matched' (bool) whether a patient was found,
+            'error' (float) absolute error, NaN where unmatched.
+    """
+    rows = db.session.query(
+        EstimationEntry.estimated_age,
+        EstimationEntry.method_used,
+        Patient.actual_age
+    ).outerjoin(
+        Patient,
+        Patient.id == EstimationEntry.patient_pk
+    ).order_by(EstimationEntry.id).all()
+
+    if rows:
+        estimated, methods, actual = zip(*rows)
+    else:
+        estimated, methods, actual = (), (), ()
+
+    estimated = np.array(estimated, dtype=float)
+    actual = np.array([np.nan if a is None else a for a in actual], dtype=float)
+    matched = ~np.isnan(actual)
+
+    logger.info(f"Loaded {len(rows)} estimates for analysis ({int(matched.sum())} matched)")
+
+    return {
+        'estimated': estimated,
+        'method': np.array([(m or '').lower() for m in methods], dtype=str),
+        'actual': actual,
+        'matched': matched,
+        'error': np.abs(estimated - actual),
+    }
+
+
+def method_arrays(data, method):
+    """
+    Select one method's values from load_estimation_arrays output.
+
+    Args:
+        data (dict): Output of load_estimation_arrays.
+        method (str): Lower-cased method name.
+
+    Returns:
+        dict: 'estimated' for every estimate of the method, and 'actual',
+        'paired_estimated' and 'error' for the estimates with a matched patient.
+    """
+    mask = data['method'] == method
+    paired = mask & data['matched']
+    return {
+        'estimated': data['estimated'][mask],
+        'actual': data['actual'][paired],
+        'paired_estimated': data['estimated'][paired],
+        'error': data['error'][paired],
+    }
+
+
+def summarize(data):
+    """
+    Summary statistics per method.
+
+    Args:
+        data (dict): Output of load_estimation_arrays.
+
+    Returns:
+        dict: method -> {'count', 'matched', 'mean_error'}; mean_error is 0
+        when the method has no matched estimates (as the comparison chart shows it).
+    """
+    summary = {}
+    for method in ANALYSIS_METHODS:
+        values = method_arrays(data, method)
+        summary[method] = {
+            'count': int(values['estimated'].size),
+            'matched': int(values['error'].size),
+            'mean_error': float(values['error'].mean()) if values['error'].size else 0.0,
+        }
+    return summary
+
+
+def _histogram(series):
+    """
+    Bin several series on shared edges so they can be drawn side by side.
+
+    Args:
+        series (dict): name -> 1-D array.
+
+    Returns:
+        dict: 'edges' (HISTOGRAM_BINS + 1 values) and name -> list of counts.
+    """
+    non_empty = [values for values in series.values() if values.size]
+    if not non_empty:
+        return {'edges': [], **{name: [] for name in series}}
+
+    edges = np.histogram_bin_edges(np.concatenate(non_empty), bins=HISTOGRAM_BINS)
+    binned = {name: np.histogram(values, bins=edges)[0].tolist() for name, values in series.items()}
+    return {'edges': np.round(edges, 3).tolist(), **binned}
+
+
+def summary_from_aggregates(stats):
+    """
+    The 'summary' part of the payload from utils.aggregates.method_stats().
+
+    Args:
+        stats (dict): Output of method_stats.
+
+    Returns:
+        dict: Same layout as summarize(), plus 'rmse'.
+    """
+    return {
+        method: {
+            'count': stats.get(method, {}).get('count', 0),
+            'matched': stats.get(method, {}).get('matched', 0),
+            'mean_error': stats.get(method, {}).get('mean_error', 0.0),
+            'rmse': stats.get(method, {}).get('rmse', 0.0),
+        }
+        for method in ANALYSIS_METHODS
+    }
+
+
+def build_analysis_payload(data, summary=None):
+    """
+    Pre-binned chart data and summary statistics for the analysis page.
+
+    Args:
+        data (dict): Output of load_estimation_arrays.
+        summary (dict): Precomputed summary (see summary_from_aggregates);
+            computed from data when omitted.
+
+    Returns:
+        dict: JSON-serializable payload with 'total', 'age_histogram',
+        'error_histogram', 'scatter' (method -> [[actual, estimated], ...]),
+        'age_range' ([min, max] actual age, or None) and 'summary'.
+    """
+    per_method = {method: method_arrays(data, method) for method in ANALYSIS_METHODS}
+    actual = data['actual'][data['matched']]
+
+    return {
+        'total': int(data['estimated'].size),
+        'age_histogram': _histogram({m: values['estimated'] for m, values in per_method.items()}),
+        'error_histogram': _histogram({m: values['error'] for m, values in per_method.items()}),
+        'scatter': {
+            m: np.round(np.column_stack((values['actual'], values['paired_estimated'])), 2).tolist()
+            for m, values in per_method.items()
+        },
+        'age_range': [float(actual.min()), float(actual.max())] if actual.size else None,
+        'summary': summary if summary is not None else summarize(data),
+    }
@@ -0,0 +1,179 @@
+"""
+Cache shared by every worker process.
+
+Values are JSON-encoded and stored either in the database (cache_entry
+table, shared by all gunicorn workers and serverless instances that use the
+same database) or in a directory on local disk (shared by the workers of a
+single machine, handy for local development). The backend is picked with
+CACHE_BACKEND ('database' or 'filesystem'); deployments on Vercel or Render
+default to the database.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from models import db, CacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Directory used by the filesystem backend
+CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'dental_cache')
+
+
+# (key prefix, 'hit' or 'miss') -> lookups made by this process (read by utils/metrics.py)
+_lookups = {}
+_lookups_lock = threading.Lock()
+
+
+def cache_stats():
+    """
+    Hit and miss counts of this process's cache lookups.
+
+    Returns:
+        dict: key prefix (the part before the first ':', e.g.
+        'analysis_payload' for the analysis charts) -> {'hit': n, 'miss': n}.
+    """
+    with _lookups_lock:
+        stats = {}
+        for (prefix, result), count in _lookups.items():
+            stats.setdefault(prefix, {'hit': 0, 'miss': 0})[result] = count
+        return stats
+
+
+class _CacheBackend:
+    """Counts hits and misses around the backend's _get."""
+
+    def get(self, key):
+        value = self._get(key)
+        lookup = (key.partition(':')[0], 'miss' if value is None else 'hit')
+        with _lookups_lock:
+            _lookups[lookup] = _lookups.get(lookup, 0) + 1
+        return value
+
+
+class FileSystemCache(_CacheBackend):
+    """One JSON file per key; writes go through a temp file and os.replace."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get('expires_at') and record['expires_at'] < time.time():
+            self.delete(key)
+            return None
+        return record.get('value')
+
+    def set(self, key, value, timeout=None):
+        record = {'expires_at': time.time() + timeout if timeout else None, 'value': value}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class DatabaseCache(_CacheBackend):
+    """
+    Rows in the cache_entry table.
+
+    Every operation runs in its own short engine transaction, so the cache
+    never commits or rolls back work pending in the request's session.
+    Must be used inside an application context.
+    """
+
+    def _get(self, key):
+        table = CacheEntry.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    table.select().where(table.c.key == key)
+                ).first()
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+        if row is None:
+            return None
+        if row.expires_at and row.expires_at < datetime.utcnow():
+            self.delete(key)
+            return None
+        return json.loads(row.value)
+
+    def set(self, key, value, timeout=None):
+        table = CacheEntry.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=timeout) if timeout else None
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key))
+                # Drop expired entries while we are here so the table stays small
+                conn.execute(table.delete().where(table.c.expires_at < now))
+                conn.execute(table.insert().values(key=key, value=json.dumps(value), expires_at=expires_at))
+        except Exception as e:
+            # Another worker stored the same key at the same time; either copy is fine
+            logger.warning(f"Cache write failed for {key}: {e}")
+
+    def delete(self, key):
+        table = CacheEntry.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key))
+        except Exception as e:
+            logger.warning(f"Cache delete failed for {key}: {e}")
+
+    def clear(self):
+        with db.engine.begin() as conn:
+            conn.execute(CacheEntry.__table__.delete())
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Return the process-wide shared cache.
+
+    Returns:
+        DatabaseCache or FileSystemCache: Backend chosen by CACHE_BACKEND.
+    """
+    global _cache
+    if _cache is None:
+        default = 'database' if (os.environ.get('VERCEL') or os.environ.get('RENDER')) else 'filesystem'
+        backend = os.environ.get('CACHE_BACKEND', default).lower()
+        _cache = DatabaseCache() if backend == 'database' else FileSystemCache()
+        logger.info(f"Using {type(_cache).__name__} for shared cache")
+    return _cache
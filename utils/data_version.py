@@ -0,0 +1,144 @@
+"""
+Data-version stamps for cached results.
+
+The 'analysis' version goes up in the same transaction as any change to
+the patient or estimation_entry tables, whichever process makes it. Cached
+results (see utils.cache) are keyed by the version they were computed from,
+so a new version simply misses the cache and nothing has to be cleared
+across workers.
+
+Changes are detected from SQLAlchemy session events: pending ORM objects at
+flush or commit time, and ORM bulk INSERT/UPDATE/DELETE statements (such as
+bulk_insert_patients or Query.delete()). Raw text() SQL is not seen; callers
+that modify these tables that way should call mark_data_changed().
+
+Flushes only set a flag on the session; the version row is written once
+per transaction, as its last statement before COMMIT. Its row lock is
+therefore held for the commit round trip only, so concurrent writers
+queue on it for that long rather than for their whole transaction.
+"""
+
+import logging
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Patient, EstimationEntry, DataVersion
+
+logger = logging.getLogger(__name__)
+
+# Version name covering everything the analysis views read
+ANALYSIS_DATA = 'analysis'
+
+# Models whose changes bump the analysis version
+TRACKED_MODELS = (Patient, EstimationEntry)
+
+_SESSION_FLAG = 'data_version_changed'
+
+_registered = False
+
+
+def get_data_version(name=ANALYSIS_DATA):
+    """
+    Read the current version stamp.
+
+    Args:
+        name (str): Version name.
+
+    Returns:
+        int: Current version (0 if nothing has been recorded yet), or None
+        if the version table is unavailable.
+    """
+    try:
+        version = db.session.execute(
+            select(DataVersion.version).where(DataVersion.name == name)
+        ).scalar()
+        return version or 0
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not read data version {name}: {e}")
+        return None
+
+
+def mark_data_changed(session=None):
+    """
+    Flag the current transaction so the analysis version is bumped on commit.
+
+    Args:
+        session: Session to flag (defaults to db.session).
+    """
+    session = session or db.session
+    session.info[_SESSION_FLAG] = True
+
+
+def _bump_version(session, name=ANALYSIS_DATA):
+    """Increment (or create) the version row inside the session's transaction."""
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        # A single upsert, so concurrent writers never collide on the first row
+        stmt = insert(table).values(name=name, version=1, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={'version': table.c.version + 1, 'updated_at': now}
+        )
+        session.execute(stmt)
+        return
+
+    result = session.execute(
+        update(table).where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        session.execute(table.insert().values(name=name, version=1, updated_at=now))
+
+
+def _has_tracked_changes(session):
+    """Whether pending ORM state adds, deletes or modifies a tracked row."""
+    if any(isinstance(obj, TRACKED_MODELS) for obj in chain(session.new, session.deleted)):
+        return True
+    return any(isinstance(obj, TRACKED_MODELS) and session.is_modified(obj) for obj in session.dirty)
+
+
+def _before_flush(session, flush_context, instances):
+    if _has_tracked_changes(session):
+        session.info[_SESSION_FLAG] = True
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, TRACKED_MODELS):
+        orm_execute_state.session.info[_SESSION_FLAG] = True
+
+
+def _before_commit(session):
+    # Flush pending objects first (commit would do it right after this hook),
+    # so the version row is locked for the COMMIT only, not the final flush
+    session.flush()
+    if session.info.pop(_SESSION_FLAG, False):
+        _bump_version(session)
+
+
+def _after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
+
+
+def init_data_version_tracking():
+    """Register the session listeners (safe to call more than once)."""
+    global _registered
+    if _registered:
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _registered = True
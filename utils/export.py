@@ -0,0 +1,267 @@
+"""
+Patient Excel export helpers.
+
+The export is written with an openpyxl write-only workbook so rows are
+flushed to a temporary file as they are appended instead of being kept
+in memory. OPG thumbnails come from the derivative store in
+utils.thumbnails and are spooled to a scratch directory after each batch,
+which keeps peak memory flat regardless of how many patients exist.
+"""
+
+import os
+import shutil
+import tempfile
+import logging
+import threading
+import concurrent.futures
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.drawing.image import Image as ExcelImage
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from models import db, Patient
+
+logger = logging.getLogger(__name__)
+
+EXPORT_HEADERS = ['ID', 'Name', 'Age', 'Sex', 'OPG Image', 'A code', 'D code', 'A Age', 'D Age', 'Actual age']
+EXPORT_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Number of patients fetched and written per batch
+EXPORT_BATCH_SIZE = 100
+
+# Size of each chunk sent to the client when streaming the finished file
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of parallel thumbnail downloads per batch
+EXPORT_MAX_WORKERS = 20
+
+# Exports downloading thumbnails at the same time, per process; the storage
+# connection pool is sized for this many (utils.storage.storage_pool_size)
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 2))
+
+_download_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+
+def _query_patient_batch(after_id, batch_size):
+    """
+    Fetch the batch of patients following after_id in id order, retrying SSL drops.
+
+    Keyset paging on the primary key makes every batch an index range scan
+    (OFFSET rescans all earlier rows), and rows inserted or renumbered while
+    the export runs cannot shift later batches. renumber_patient_ids keeps
+    patient_id in id order, so the sheet order is unchanged.
+    """
+    max_retries = 3
+    retry_delay = 1  # seconds
+
+    for attempt in range(max_retries):
+        try:
+            query = Patient.query
+            if after_id is not None:
+                query = query.filter(Patient.id > after_id)
+            return query.order_by(Patient.id).limit(batch_size).all()
+        except Exception as e:
+            if "SSL error" in str(e) and attempt < max_retries - 1:
+                import time
+                time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
+                continue
+            raise
+
+
+def _spool_thumbnails(patients, spool_dir):
+    """
+    Load cached thumbnails for a batch of patients in parallel and write them to disk.
+
+    Thumbnails come from the derivative store (utils.thumbnails); images that
+    have none yet are downloaded once, shrunk and recorded for next time.
+
+    Returns:
+        dict: Mapping of patient.id -> path of the spooled thumbnail file.
+    """
+    from utils.storage import is_local_opg
+    from utils.thumbnails import thumbnail_entries, fetch_thumbnail, record_thumbnails
+
+    download_tasks = [(p.id, p.opg_link) for p in patients if p.opg_link and not is_local_opg(p.opg_link)]
+
+    image_paths = {}
+    if not download_tasks:
+        return image_paths
+
+    # One index query for the whole batch; worker threads never touch the DB
+    entries = thumbnail_entries(url for _, url in download_tasks)
+    new_entries = []
+
+    # Hand the connection back to the pool for the (slow) downloads; holding
+    # it starves other requests while exports run
+    db.session.rollback()
+
+    # Further exports wait here (between batches) rather than overflow the storage pool
+    with _download_slots, concurrent.futures.ThreadPoolExecutor(max_workers=EXPORT_MAX_WORKERS) as executor:
+        future_to_pid = {
+            executor.submit(fetch_thumbnail, url, entries.get(url)): p_id
+            for p_id, url in download_tasks
+        }
+
+        for future in concurrent.futures.as_completed(future_to_pid):
+            p_id = future_to_pid[future]
+            img_data, new_entry = future.result()
+            if new_entry:
+                new_entries.append(new_entry)
+            if img_data:
+                path = os.path.join(spool_dir, f"{p_id}.img")
+                with open(path, 'wb') as f:
+                    f.write(img_data)
+                image_paths[p_id] = path
+
+    try:
+        record_thumbnails(new_entries)
+    except Exception as e:
+        logger.warning(f"Could not record {len(new_entries)} thumbnails: {e}")
+
+    return image_paths
+
+
+def _resolve_local_image(opg_link, root_path):
+    """Return the first existing path for a locally stored OPG (backward compatibility)."""
+    image_path = opg_link.lstrip('/')
+    possible_paths = [
+        os.path.join(root_path, image_path),
+        os.path.abspath(image_path),
+        image_path
+    ]
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def write_patient_export(dest_path, root_path, batch_size=EXPORT_BATCH_SIZE, progress=None):
+    """
+    Write every patient to an xlsx file at dest_path using a write-only workbook.
+
+    Must be called inside an application context.
+
+    Args:
+        dest_path (str): Where to save the finished workbook.
+        root_path (str): Application root used to resolve local OPG files.
+        batch_size (int): Number of patients fetched and written per batch.
+        progress (callable): Optional callback invoked after each batch as
+            progress(rows_done, images_done).
+
+    Returns:
+        int: Number of patient rows written.
+    """
+    from utils.storage import is_local_opg
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Patient Data")
+
+    # Column widths must be set before the first row is written
+    for col in range(1, len(EXPORT_HEADERS) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 15
+    # Increase width for Image column (5th column -> E)
+    ws.column_dimensions['E'].width = 25
+
+    # Bold header row
+    header_cells = []
+    for title in EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = Font(bold=True)
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    spool_dir = tempfile.mkdtemp(prefix='patients_export_')
+    row_idx = 1
+    last_id = None
+    images_done = 0
+
+    try:
+        while True:
+            patients = _query_patient_batch(last_id, batch_size)
+            if not patients:
+                break
+
+            # Detach the batch so the rollback in _spool_thumbnails does not expire it
+            db.session.expunge_all()
+            image_paths = _spool_thumbnails(patients, spool_dir)
+
+            for patient in patients:
+                row_idx += 1
+                ws.row_dimensions[row_idx].height = 80
+
+                opg_cell = None
+                if patient.opg_link:
+                    try:
+                        if not is_local_opg(patient.opg_link):
+                            image_path = image_paths.get(patient.id)
+                        else:
+                            image_path = _resolve_local_image(patient.opg_link, root_path)
+
+                        if image_path:
+                            # Referencing the file path keeps the bytes on disk until save
+                            img = ExcelImage(image_path)
+                            img.height = 100
+                            img.width = 100
+                            ws.add_image(img, f'E{row_idx}')
+                            images_done += 1
+                        else:
+                            opg_cell = "File Not Found" if is_local_opg(patient.opg_link) else "Image Load Error"
+                    except Exception as e:
+                        logger.error(f"Error embedding image for {patient.patient_id}: {e}")
+                        opg_cell = "Error"
+                else:
+                    opg_cell = "No Image"
+
+                ws.append([
+                    patient.patient_id,
+                    patient.name,
+                    patient.actual_age,
+                    patient.sex,
+                    opg_cell,
+                    patient.code_a,
+                    patient.code_b,
+                    patient.alqahtani_estimated_age,
+                    patient.demirjian_estimated_age,
+                    patient.actual_age
+                ])
+
+            last_id = patients[-1].id
+
+            if progress:
+                progress(row_idx - 1, images_done)
+
+            if len(patients) < batch_size:
+                break
+
+        wb.save(dest_path)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    logger.info(f"Generated Excel export with {row_idx - 1} rows: {os.path.getsize(dest_path)} bytes")
+    return row_idx - 1
+
+
+def iter_file_chunks(path, chunk_size=EXPORT_CHUNK_SIZE, remove=True):
+    """
+    Yield a file in fixed-size chunks, optionally deleting it once fully sent.
+
+    Args:
+        path (str): File to stream.
+        chunk_size (int): Bytes per chunk.
+        remove (bool): Delete the file after the last chunk (or on disconnect).
+    """
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,200 @@
+"""
+Background Excel export jobs.
+
+A job is recorded in the export_job table and runs on a daemon thread with
+its own application context, so the request that starts it returns
+immediately. Progress is written back to the row after every batch and the
+finished workbook is kept in EXPORT_DIR until it expires.
+
+This needs a long-lived worker process (gunicorn on Render). Serverless
+platforms such as Vercel freeze or discard the function once the response
+is sent, which kills the thread mid-export; there background_exports_supported()
+is False and the UI falls back to the synchronous /export_patients download.
+A job whose worker died anyway stops reporting progress and is marked
+failed after EXPORT_JOB_STALE_AFTER, both when its status is polled and
+when the next export starts.
+"""
+
+import os
+import uuid
+import tempfile
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from models import db, Patient, ExportJob
+
+logger = logging.getLogger(__name__)
+
+# Directory where finished exports are stored (point at a shared volume on multi-instance deployments)
+EXPORT_DIR = os.environ.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'patient_exports')
+
+# A running job that has not reported progress for this long is treated as dead
+EXPORT_JOB_STALE_AFTER = timedelta(minutes=15)
+
+# Finished exports are deleted after this long
+EXPORT_JOB_RETENTION = timedelta(hours=24)
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+# Set to 1/0 to force background jobs on or off (default: off on Vercel)
+EXPORT_BACKGROUND_JOBS = os.environ.get('EXPORT_BACKGROUND_JOBS')
+
+# Serializes job creation within a worker so repeat clicks reuse the same job
+_start_lock = threading.Lock()
+
+
+def export_job_to_dict(job):
+    """
+    Serialize an export job for the status endpoint.
+
+    Args:
+        job (ExportJob): Job to describe.
+
+    Returns:
+        dict: Status, progress counters and (when finished) download details.
+    """
+    data = {
+        'job_id': job.id,
+        'status': job.status,
+        'rows_total': job.rows_total or 0,
+        'rows_done': job.rows_done or 0,
+        'images_done': job.images_done or 0,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == 'complete':
+        data['file_size'] = job.file_size
+    if job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+def background_exports_supported():
+    """Whether worker threads outlive the request (False on serverless deployments)."""
+    if EXPORT_BACKGROUND_JOBS is not None:
+        return EXPORT_BACKGROUND_JOBS.lower() in ('1', 'true', 'yes')
+    return not os.environ.get('VERCEL')
+
+
+def expire_stale_job(job, now=None):
+    """
+    Mark an active job failed if its worker stopped reporting progress.
+
+    Args:
+        job (ExportJob): Job to check.
+        now (datetime): Current UTC time.
+
+    Returns:
+        bool: True if the job was marked failed.
+    """
+    if job.status not in ACTIVE_STATUSES:
+        return False
+    now = now or datetime.utcnow()
+    last_seen = job.updated_at or job.created_at
+    if last_seen and now - last_seen < EXPORT_JOB_STALE_AFTER:
+        return False
+
+    # The worker that owned this job went away without finishing it
+    job.status = 'failed'
+    job.error = 'Export job stopped reporting progress'
+    job.finished_at = now
+    db.session.commit()
+    logger.warning(f"Export job {job.id} marked failed after {EXPORT_JOB_STALE_AFTER} without progress")
+    return True
+
+
+def get_or_start_export_job(app, user_id=None):
+    """
+    Return the active export job, starting a new one if none is running.
+
+    Args:
+        app (Flask): Application used to push a context on the worker thread.
+        user_id (int): Id of the user requesting the export.
+
+    Returns:
+        tuple: (ExportJob, created) where created is True if a new job was started.
+    """
+    with _start_lock:
+        now = datetime.utcnow()
+        active = ExportJob.query.filter(
+            ExportJob.status.in_(ACTIVE_STATUSES)
+        ).order_by(ExportJob.created_at.desc()).first()
+
+        if active and not expire_stale_job(active, now):
+            return active, False
+
+        _purge_expired_jobs(now)
+
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            status='pending',
+            requested_by=user_id,
+            rows_total=Patient.query.count(),
+            created_at=now,
+            updated_at=now
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        worker = threading.Thread(target=_run_export_job, args=(app, job.id), daemon=True,
+                                  name=f"export-job-{job.id[:8]}")
+        worker.start()
+        logger.info(f"Started export job {job.id} for {job.rows_total} patients")
+        return job, True
+
+
+def _run_export_job(app, job_id):
+    """Build the workbook for a job on a worker thread and record the outcome."""
+    from utils.export import write_patient_export
+
+    with app.app_context():
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        dest_path = os.path.join(EXPORT_DIR, f"{job_id}.xlsx")
+        partial_path = dest_path + '.part'
+
+        def _update(**values):
+            values['updated_at'] = datetime.utcnow()
+            ExportJob.query.filter_by(id=job_id).update(values)
+            db.session.commit()
+
+        def _progress(rows_done, images_done):
+            _update(rows_done=rows_done, images_done=images_done)
+
+        try:
+            _update(status='running')
+            rows = write_patient_export(partial_path, app.root_path, progress=_progress)
+            os.replace(partial_path, dest_path)
+            _update(status='complete', rows_done=rows, file_path=dest_path,
+                    file_size=os.path.getsize(dest_path), finished_at=datetime.utcnow())
+            logger.info(f"Export job {job_id} finished: {rows} rows")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Export job {job_id} failed: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            try:
+                _update(status='failed', error=str(e)[:1000], finished_at=datetime.utcnow())
+            except Exception as update_error:
+                logger.error(f"Could not record failure for export job {job_id}: {update_error}")
+        finally:
+            db.session.remove()
+
+
+def _purge_expired_jobs(now):
+    """Delete finished jobs (and their files) older than EXPORT_JOB_RETENTION."""
+    expired = ExportJob.query.filter(
+        ExportJob.status.notin_(ACTIVE_STATUSES),
+        ExportJob.created_at < now - EXPORT_JOB_RETENTION
+    ).all()
+
+    for job in expired:
+        if job.file_path and os.path.exists(job.file_path):
+            try:
+                os.remove(job.file_path)
+            except OSError as e:
+                logger.warning(f"Could not remove expired export {job.file_path}: {e}")
+        db.session.delete(job)
+
+    if expired:
+        db.session.commit()
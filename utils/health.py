@@ -0,0 +1,92 @@
+"""
+Readiness probes for /health/ready.
+
+/health stays a liveness check that never touches a dependency (it is what
+Render's health check polls). The readiness check runs `SELECT 1` through
+the application's connection pool and asks Supabase storage for the OPG
+bucket over the shared storage session, timing each. Reading bucket
+metadata needs the service key (SUPABASE_SERVICE_KEY); with only an anon
+key the storage check reports down. Results are
+cached for READINESS_CACHE_SECONDS so that load balancer polling from
+several sources costs at most one probe per worker per interval; concurrent
+callers wait for the probe in progress instead of starting their own.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# How long (seconds) a probe result is reused
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', 10))
+
+# Timeouts (seconds) for the storage probe: connect, read
+STORAGE_PROBE_TIMEOUT = (2, 3)
+
+_cached = None  # (monotonic time of the probe, ready, report)
+_probe_lock = threading.Lock()
+
+
+def _probe(check):
+    """Run one check and return its status, latency and (on failure) error type."""
+    started = time.perf_counter()
+    try:
+        check()
+        result = {'status': 'up'}
+    except Exception as e:
+        logger.warning(f"Readiness probe {check.__name__} failed: {e}")
+        # Only the exception type is reported: the endpoint is unauthenticated
+        result = {'status': 'down', 'error': type(e).__name__}
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def check_database():
+    try:
+        db.session.execute(text('SELECT 1'))
+    finally:
+        # Return the connection to the pool straight away
+        db.session.rollback()
+
+
+def check_storage():
+    from utils.storage import probe_bucket
+
+    probe_bucket("opg-images", timeout=STORAGE_PROBE_TIMEOUT)
+
+
+def readiness():
+    """
+    Probe the database and storage, reusing a result younger than READINESS_CACHE_SECONDS.
+
+    Returns:
+        tuple: (ready, report) where report is {'status', 'checked_at',
+        'age_seconds', 'checks': {'database': {...}, 'storage': {...}}}
+    """
+    global _cached
+    cached = _cached
+    if cached is None or time.monotonic() - cached[0] >= READINESS_CACHE_SECONDS:
+        with _probe_lock:
+            cached = _cached
+            if cached is None or time.monotonic() - cached[0] >= READINESS_CACHE_SECONDS:
+                checks = {
+                    'database': _probe(check_database),
+                    'storage': _probe(check_storage),
+                }
+                ready = all(check['status'] == 'up' for check in checks.values())
+                report = {
+                    'status': 'ready' if ready else 'unavailable',
+                    'checked_at': str(datetime.utcnow()),
+                    'checks': checks,
+                }
+                cached = _cached = (time.monotonic(), ready, report)
+
+    probed_at, ready, report = cached
+    return ready, {**report, 'age_seconds': round(time.monotonic() - probed_at, 1)}
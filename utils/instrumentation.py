@@ -0,0 +1,177 @@
+"""
+Per-request timing and database query instrumentation.
+
+For every request (static files excepted) this records wall time, the
+number and total time of SQL statements run on its behalf (SQLAlchemy
+engine events), the response size and status. It writes them as one JSON
+log line on the 'request' logger and adds them to in-process per-endpoint
+histograms, read with endpoint_stats().
+
+Statistics are per process: each gunicorn worker or serverless instance
+keeps its own.
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('request')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements slower than this (seconds) are logged individually
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
+
+_registered_engine_events = False
+
+
+class LatencyHistogram:
+    """Cumulative-bucket histogram of durations (Prometheus layout)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def snapshot(self):
+        """Return {'buckets': [(upper bound, cumulative count), ...], 'sum', 'count'}; the last bound is '+Inf'."""
+        cumulative, running = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            running += count
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'sum': self.total, 'count': self.count}
+
+
+class EndpointStats:
+    """Totals for one endpoint."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.db_latency = LatencyHistogram()
+        self.db_queries = 0
+        self.bytes_sent = 0
+        self.statuses = {}
+
+    def record(self, seconds, status, db_queries, db_seconds, bytes_sent):
+        self.latency.observe(seconds)
+        self.db_latency.observe(db_seconds)
+        self.db_queries += db_queries
+        self.bytes_sent += bytes_sent
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def snapshot(self):
+        return {
+            'requests': self.latency.count,
+            'latency': self.latency.snapshot(),
+            'db_time': self.db_latency.snapshot(),
+            'db_queries': self.db_queries,
+            'bytes_sent': self.bytes_sent,
+            'statuses': dict(self.statuses),
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def endpoint_stats():
+    """
+    Snapshot of the per-endpoint statistics of this process.
+
+    Returns:
+        dict: endpoint -> {'requests', 'latency', 'db_time', 'db_queries',
+        'bytes_sent', 'statuses'}; latency and db_time are histogram snapshots.
+    """
+    with _stats_lock:
+        return {endpoint: stats.snapshot() for endpoint, stats in _stats.items()}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+
+    if has_request_context() and 'request_started' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        logger.warning(f"Slow query ({elapsed * 1000:.0f}ms): {' '.join(statement.split())[:300]}")
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not run for a failed statement
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+def _start_request():
+    if request.path.startswith('/static'):
+        return
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def _finish_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+
+    endpoint = request.endpoint or 'unmatched'
+    # Streamed responses without a Content-Length (e.g. CSV export) count as 0
+    bytes_sent = response.content_length or 0
+
+    with _stats_lock:
+        stats = _stats.get(endpoint)
+        if stats is None:
+            stats = _stats[endpoint] = EndpointStats()
+        stats.record(elapsed, response.status_code, g.db_queries, g.db_seconds, bytes_sent)
+
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 1),
+        'db_queries': g.db_queries,
+        'db_ms': round(g.db_seconds * 1000, 1),
+        'bytes': bytes_sent,
+        'remote_addr': request.remote_addr,
+        'scheme': request.scheme,
+    }))
+    return response
+
+
+def init_request_instrumentation(app):
+    """Register the request hooks on the app and the query listeners on all engines."""
+    global _registered_engine_events
+    if not _registered_engine_events:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _registered_engine_events = True
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
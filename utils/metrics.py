@@ -0,0 +1,214 @@
+"""
+Prometheus text-format metrics for the /metrics endpoint.
+
+Collected at scrape time from the in-process statistics kept elsewhere:
+
+- HTTP requests, latency, SQL queries and response bytes per endpoint
+  (utils/instrumentation.py)
+- SQLAlchemy connection pool: size, checked out, overflow, requests
+  waiting for a connection, checkout wait time and checkout timeouts
+- Supabase storage call latency and errors per operation (utils/storage.py)
+- Cache hits and misses per key prefix (utils/cache.py)
+- Export jobs by status and the duration of the jobs still retained
+
+Everything except the export job figures (read from the database) is per
+process, so each gunicorn worker reports its own; aggregate them in
+Prometheus with sum(). The format is written by hand to avoid a
+prometheus_client dependency.
+"""
+
+import time
+import threading
+
+from sqlalchemy import exc, func
+
+from models import db, ExportJob
+from utils.instrumentation import LatencyHistogram
+
+# Upper bounds (seconds) of the pool checkout wait histogram
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 20.0)
+
+# Upper bounds (seconds) of the export job duration histogram
+EXPORT_DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_pool_lock = threading.Lock()
+_pool_stats = {'waiting': 0, 'timeouts': 0, 'wait': LatencyHistogram(POOL_WAIT_BUCKETS)}
+
+
+def instrument_pool(pool):
+    """
+    Count waits and timeouts when checking connections out of a pool.
+
+    Wraps the pool instance's _do_get, which blocks while the pool is
+    exhausted. Safe to call repeatedly; engine.dispose() replaces the pool,
+    so collect_metrics() calls it again on every scrape.
+
+    Args:
+        pool: The engine's connection pool
+    """
+    if getattr(pool, '_metrics_instrumented', False):
+        return
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        with _pool_lock:
+            _pool_stats['waiting'] += 1
+        try:
+            return do_get()
+        except exc.TimeoutError:
+            with _pool_lock:
+                _pool_stats['timeouts'] += 1
+            raise
+        finally:
+            with _pool_lock:
+                _pool_stats['waiting'] -= 1
+                _pool_stats['wait'].observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+    pool._metrics_instrumented = True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class _Writer:
+    """Accumulates metric families in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.lines = []
+        self._declared = set()
+
+    def _declare(self, name, kind, help_text):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f'# HELP {name} {help_text}')
+            self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name, kind, help_text, value, **labels):
+        self._declare(name, kind, help_text)
+        self.lines.append(f'{name}{_labels(labels)} {value}')
+
+    def histogram(self, name, help_text, snapshot, **labels):
+        self._declare(name, 'histogram', help_text)
+        for bound, count in snapshot['buckets']:
+            self.lines.append(f'{name}_bucket{_labels({**labels, "le": bound})} {count}')
+        self.lines.append(f'{name}_sum{_labels(labels)} {snapshot["sum"]}')
+        self.lines.append(f'{name}_count{_labels(labels)} {snapshot["count"]}')
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def _http_metrics(out):
+    from utils.instrumentation import endpoint_stats
+    # Each family's samples must be contiguous, hence one pass per family
+    endpoints = sorted(endpoint_stats().items())
+    for endpoint, stats in endpoints:
+        for status, count in sorted(stats['statuses'].items()):
+            out.sample('http_requests_total', 'counter', 'HTTP requests handled.',
+                       count, endpoint=endpoint, status=status)
+    for endpoint, stats in endpoints:
+        out.histogram('http_request_duration_seconds', 'HTTP request wall time.',
+                      stats['latency'], endpoint=endpoint)
+    for name, help_text, value in (
+        ('http_db_queries_total', 'SQL statements run by requests.', lambda stats: stats['db_queries']),
+        ('http_db_seconds_total', 'Time spent in SQL statements by requests.', lambda stats: stats['db_time']['sum']),
+        ('http_response_bytes_total', 'Response bytes with a known length.', lambda stats: stats['bytes_sent']),
+    ):
+        for endpoint, stats in endpoints:
+            out.sample(name, 'counter', help_text, value(stats), endpoint=endpoint)
+
+
+def _pool_metrics(out):
+    pool = db.engine.pool
+    instrument_pool(pool)
+
+    # size()/checkedout()/overflow() only exist on QueuePool (not on SQLite's pools)
+    for name, method, help_text in (
+        ('db_pool_size', 'size', 'Connections the pool keeps open.'),
+        ('db_pool_checked_out', 'checkedout', 'Connections currently in use.'),
+        ('db_pool_checked_in', 'checkedin', 'Idle connections in the pool.'),
+        ('db_pool_overflow', 'overflow', 'Connections open beyond the pool size.'),
+    ):
+        if hasattr(pool, method):
+            out.sample(name, 'gauge', help_text, getattr(pool, method)())
+    if hasattr(pool, '_max_overflow'):
+        out.sample('db_pool_max_overflow', 'gauge', 'Overflow connections allowed.', pool._max_overflow)
+
+    with _pool_lock:
+        waiting = _pool_stats['waiting']
+        timeouts = _pool_stats['timeouts']
+        wait = _pool_stats['wait'].snapshot()
+    out.sample('db_pool_checkouts_in_progress', 'gauge',
+               'Requests currently getting a connection (waiting when the pool is exhausted).', waiting)
+    out.sample('db_pool_checkout_timeouts_total', 'counter',
+               'Checkouts that gave up after pool_timeout.', timeouts)
+    out.histogram('db_pool_checkout_wait_seconds', 'Time to get a new connection from the pool.', wait)
+
+
+def _storage_metrics(out):
+    from utils.storage import storage_call_stats
+    stats = storage_call_stats()
+    for operation, call in sorted(stats.items()):
+        out.histogram('storage_request_duration_seconds', 'Supabase storage call time.',
+                      call['latency'], operation=operation)
+    for operation, call in sorted(stats.items()):
+        out.sample('storage_request_errors_total', 'counter', 'Failed Supabase storage calls.',
+                   call['errors'], operation=operation)
+
+
+def _cache_metrics(out):
+    from utils.cache import cache_stats
+    stats = cache_stats()
+    for cache, counts in sorted(stats.items()):
+        for result in ('hit', 'miss'):
+            out.sample('cache_requests_total', 'counter', 'Cache lookups.',
+                       counts[result], cache=cache, result=result)
+    for cache, counts in sorted(stats.items()):
+        lookups = counts['hit'] + counts['miss']
+        out.sample('cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits.',
+                   round(counts['hit'] / lookups, 4) if lookups else 0, cache=cache)
+
+
+def _export_job_metrics(out):
+    from utils.export_jobs import EXPORT_JOB_RETENTION
+    counts = dict(db.session.query(ExportJob.status, func.count(ExportJob.id)).group_by(ExportJob.status).all())
+    for status in ('pending', 'running', 'complete', 'failed'):
+        out.sample('export_jobs', 'gauge', 'Export jobs by status.', counts.get(status, 0), status=status)
+
+    # Finished jobs are kept for EXPORT_JOB_RETENTION, so this covers roughly that window
+    durations = LatencyHistogram(EXPORT_DURATION_BUCKETS)
+    finished = db.session.query(ExportJob.created_at, ExportJob.finished_at).filter(
+        ExportJob.status == 'complete',
+        ExportJob.created_at.isnot(None),
+        ExportJob.finished_at.isnot(None),
+    ).all()
+    for created_at, finished_at in finished:
+        durations.observe((finished_at - created_at).total_seconds())
+    out.histogram('export_job_duration_seconds',
+                  f'Duration of completed export jobs from the last {EXPORT_JOB_RETENTION.total_seconds() // 3600:.0f}h.',
+                  durations.snapshot())
+
+
+def collect_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format (0.0.4).
+
+    Returns:
+        str: The metrics page
+    """
+    out = _Writer()
+    _http_metrics(out)
+    _pool_metrics(out)
+    _storage_metrics(out)
+    _cache_metrics(out)
+    _export_job_metrics(out)
+    return out.render()
@@ -0,0 +1,193 @@
+"""
+Keyset (cursor) pagination for the patient list views.
+
+Next/previous links carry the key of the last/first row shown ('after' /
+'before') instead of a page number, so every page is an index range scan
+on the key no matter how deep it is. A bare ?page=N (old bookmarks) still
+works through OFFSET. Totals come from approximate_count(); views that act
+on "all N rows" (bulk delete) read the exact, cached exact_total instead.
+"""
+
+import math
+import hashlib
+import logging
+
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Unfiltered tables at least this large are counted from planner statistics
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class KeysetPagination:
+    """
+    Page of results with the attributes the templates expect from paginate().
+
+    prev_args / next_args are the query arguments for the neighbouring pages,
+    e.g. url_for('main.manage_patients', search=search_query, **patients.next_args).
+    total may be a planner estimate (total_is_estimate); exact_total counts
+    the rows on first access.
+    """
+
+    def __init__(self, items, page, per_page, total, has_prev, has_next, key_attr,
+                 total_is_estimate=False, query=None, count_key=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+        self._query = query
+        self._count_key = count_key
+        self._exact_total = None if total_is_estimate else total
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.pages = max(1, math.ceil(total / per_page)) if total else 1
+        # The estimated total may lag behind the rows actually found
+        if has_next and self.pages <= page:
+            self.pages = page + 1
+        self.prev_num = page - 1 if has_prev else None
+        self.next_num = page + 1 if has_next else None
+        self.prev_args = {'before': getattr(items[0], key_attr), 'page': page - 1} if has_prev and items else {}
+        self.next_args = {'after': getattr(items[-1], key_attr), 'page': page + 1} if has_next and items else {}
+
+    @property
+    def exact_total(self):
+        """Exact number of matching rows (cached like other counts)."""
+        if self._exact_total is None:
+            self._exact_total = exact_count(self._query, self._count_key)
+        return self._exact_total
+
+
+def keyset_paginate(query, key_column, page=1, per_page=20, after=None, before=None, count_key=None):
+    """
+    Paginate a query on a unique, indexed, ascending key.
+
+    Args:
+        query (Query): Filtered ORM query (without ORDER BY).
+        key_column: Unique indexed column to page on, e.g. Patient.id.
+        page (int): Page number, used for display and for the OFFSET fallback.
+        per_page (int): Rows per page.
+        after: Key of the last row of the previous page (next link).
+        before: Key of the first row of the following page (previous link).
+        count_key (str): Cache key for the total; see approximate_count.
+
+    Returns:
+        KeysetPagination: The page.
+    """
+    page = max(page or 1, 1)
+
+    if after is not None:
+        rows = query.filter(key_column > after).order_by(key_column).limit(per_page + 1).all()
+        has_prev, has_next = True, len(rows) > per_page
+        rows = rows[:per_page]
+    elif before is not None:
+        rows = query.filter(key_column < before).order_by(key_column.desc()).limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = list(reversed(rows[:per_page]))
+    else:
+        rows = query.order_by(key_column).offset((page - 1) * per_page).limit(per_page + 1).all()
+        has_prev, has_next = page > 1, len(rows) > per_page
+        rows = rows[:per_page]
+
+    if not has_prev:
+        page = 1
+
+    total, total_is_estimate = approximate_count(query, count_key)
+    return KeysetPagination(
+        items=rows,
+        page=page,
+        per_page=per_page,
+        total=total,
+        has_prev=has_prev,
+        has_next=has_next,
+        key_attr=key_column.key,
+        total_is_estimate=total_is_estimate,
+        query=query,
+        count_key=count_key
+    )
+
+
+def estimated_count(query):
+    """
+    Row estimate for large unfiltered PostgreSQL tables, from pg_class.reltuples.
+
+    Args:
+        query (Query): The query being paginated.
+
+    Returns:
+        int: The estimate, or None when the query is filtered, the database
+        is not PostgreSQL or the table has fewer than ESTIMATED_COUNT_THRESHOLD rows.
+    """
+    if query.whereclause is not None or db.session.get_bind().dialect.name != 'postgresql':
+        return None
+
+    table = query.column_descriptions[0]['entity'].__table__.name
+    try:
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {'table': table}
+        ).scalar()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not read row estimate for {table}: {e}")
+        return None
+    if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+        return int(estimate)
+    return None
+
+
+def exact_count(query, cache_key=None):
+    """
+    COUNT(*) of a query, cached in the shared cache under the current
+    analysis data version so it runs once per data change rather than on
+    every page flip.
+
+    Args:
+        query (Query): The query being paginated.
+        cache_key (str): Identifies the query (e.g. view name and search
+            text); None disables caching.
+
+    Returns:
+        int: Row count.
+    """
+    if cache_key is None:
+        return query.order_by(None).count()
+
+    from utils.cache import get_cache
+    from utils.data_version import get_data_version
+
+    version = get_data_version()
+    if version is None:
+        return query.order_by(None).count()
+
+    digest = hashlib.sha1(cache_key.encode('utf-8')).hexdigest()
+    key = f"count:{digest}:v{version}"
+    cache = get_cache()
+    total = cache.get(key)
+    if total is None:
+        total = query.order_by(None).count()
+        cache.set(key, total, timeout=3600)
+    return total
+
+
+def approximate_count(query, cache_key=None):
+    """
+    Cheap row count for a pagination query.
+
+    Large unfiltered PostgreSQL tables are counted from pg_class.reltuples
+    (estimated_count); other counts are exact and cached (exact_count).
+
+    Args:
+        query (Query): The query being paginated.
+        cache_key (str): Identifies the query; None disables caching.
+
+    Returns:
+        tuple: (row count, True if the count is a planner estimate).
+    """
+    estimate = estimated_count(query)
+    if estimate is not None:
+        return estimate, True
+    return exact_count(query, cache_key), False
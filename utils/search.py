@@ -0,0 +1,62 @@
+"""
+Patient search shared by every list view.
+
+All search boxes match the same way: case-insensitive substring match of the
+trimmed search text against a fixed set of columns, with '%', '_' and '\\'
+in the text taken literally. Views that must stay blinded search the codes
+only.
+
+On PostgreSQL the columns carry pg_trgm GIN indexes (see
+setup_db.create_indexes), which serve ILIKE '%text%' without a sequential
+scan once the text is at least three characters long.
+"""
+
+from models import db, Patient
+
+# Columns searched by the supervisor views (/patients, /analysis, bulk delete)
+PATIENT_SEARCH_COLUMNS = ('patient_id', 'name', 'code_a', 'code_b')
+
+# Columns searched by views that must not reveal patient identity
+CODE_SEARCH_COLUMNS = ('code_a', 'code_b')
+
+# Columns given trigram indexes on PostgreSQL
+TRIGRAM_INDEXED_COLUMNS = PATIENT_SEARCH_COLUMNS
+
+
+def _like_pattern(search_text):
+    escaped = search_text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def patient_search_condition(search_text, columns=PATIENT_SEARCH_COLUMNS):
+    """
+    SQL condition matching patients whose columns contain the search text.
+
+    Args:
+        search_text (str): Text typed in a search box.
+        columns (tuple): Patient column names to search.
+
+    Returns:
+        ColumnElement: Condition for Query.filter, or None if the text is blank.
+    """
+    search_text = (search_text or '').strip()
+    if not search_text:
+        return None
+    pattern = _like_pattern(search_text)
+    return db.or_(*(getattr(Patient, column).ilike(pattern, escape='\\') for column in columns))
+
+
+def search_patients(query, search_text, columns=PATIENT_SEARCH_COLUMNS):
+    """
+    Restrict a patient query to the search results.
+
+    Args:
+        query (Query): Patient query to filter.
+        search_text (str): Text typed in a search box; blank leaves the query unchanged.
+        columns (tuple): Patient column names to search.
+
+    Returns:
+        Query: The filtered query.
+    """
+    condition = patient_search_condition(search_text, columns)
+    return query if condition is None else query.filter(condition)
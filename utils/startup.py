@@ -0,0 +1,80 @@
+"""
+Cold-start timing report.
+
+Set STARTUP_REPORT=1 to log, once the app has been created, how long the
+boot took and which top-level packages the time went to. Each package is
+charged only its own import time (time spent importing other packages from
+it is charged to those), so the figures add up to the total import time.
+Use it to spot a heavy dependency that slipped back into module-level
+imports.
+
+app.py calls start_import_timing() before its other imports and
+log_startup_report() after create_app(). Both do nothing unless enabled.
+"""
+
+import os
+import sys
+import time
+import builtins
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STARTUP_REPORT = os.environ.get('STARTUP_REPORT', '').lower() in ('1', 'true', 'yes')
+
+# Number of packages listed in the report
+STARTUP_REPORT_TOP = int(os.environ.get('STARTUP_REPORT_TOP', 15))
+
+_started = time.perf_counter()
+_original_import = None
+_import_seconds = {}
+# Frames of imports in progress: [package, start time, time spent in nested imports]
+_stack = []
+_thread_id = None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only first-time absolute imports on the booting thread are timed
+    if level or name in sys.modules or threading.get_ident() != _thread_id:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    frame = [name.partition('.')[0], time.perf_counter(), 0.0]
+    _stack.append(frame)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _stack.pop()
+        elapsed = time.perf_counter() - frame[1]
+        _import_seconds[frame[0]] = _import_seconds.get(frame[0], 0.0) + elapsed - frame[2]
+        if _stack:
+            _stack[-1][2] += elapsed
+
+
+def start_import_timing():
+    """Start timing imports if STARTUP_REPORT is set."""
+    global _original_import, _thread_id
+    if not STARTUP_REPORT or _original_import is not None:
+        return
+    _thread_id = threading.get_ident()
+    _original_import = builtins.__import__
+    builtins.__import__ = _timed_import
+
+
+def log_startup_report():
+    """Log the boot time and import breakdown, then stop timing imports."""
+    global _original_import
+    if _original_import is None:
+        return
+    builtins.__import__ = _original_import
+    _original_import = None
+
+    total = time.perf_counter() - _started
+    imported = sum(_import_seconds.values())
+    slowest = sorted(_import_seconds.items(), key=lambda item: item[1], reverse=True)[:STARTUP_REPORT_TOP]
+    breakdown = ', '.join(f"{package} {seconds * 1000:.0f}ms" for package, seconds in slowest)
+
+    logger.info(f"Startup took {total * 1000:.0f}ms ({imported * 1000:.0f}ms importing): {breakdown}")
+    for heavy in ('matplotlib', 'numpy', 'openpyxl', 'PIL', 'supabase'):
+        if heavy in sys.modules:
+            logger.warning(f"Startup loaded {heavy}; it should only be imported where it is used")
@@ -1,14 +1,57 @@
 import os
-from supabase import create_client, Client
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import uuid
 
-def get_supabase_client() -> Client:
+# Timeouts (seconds) for storage HTTP requests: connect, read
+STORAGE_CONNECT_TIMEOUT = float(os.environ.get("STORAGE_CONNECT_TIMEOUT", 5))
+STORAGE_READ_TIMEOUT = float(os.environ.get("STORAGE_READ_TIMEOUT", 30))
+
+# Retries for failed connections and transient (429/5xx) responses
+STORAGE_MAX_RETRIES = int(os.environ.get("STORAGE_MAX_RETRIES", 3))
+STORAGE_RETRY_BACKOFF = float(os.environ.get("STORAGE_RETRY_BACKOFF", 0.5))
+
+# Keep-alive connections held open to the storage host (0: sized by storage_pool_size)
+STORAGE_POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", 0))
+
+# Connections reserved for request-path calls (signing, single downloads, uploads)
+STORAGE_POOL_HEADROOM = 10
+
+# Lifetime of signed OPG URLs handed to browsers
+SIGNED_URL_EXPIRES_IN = int(os.environ.get("SIGNED_URL_EXPIRES_IN", 3600))
+
+# Cached signed URLs are reused until they have less than this many seconds left
+SIGNED_URL_MIN_REMAINING = 300
+
+# Maximum number of signed URLs kept in memory
+SIGNED_URL_CACHE_SIZE = int(os.environ.get("SIGNED_URL_CACHE_SIZE", 5000))
+
+# Patient.opg_link prefixes of images stored on local disk (backward compatibility)
+LOCAL_OPG_PREFIXES = ('/', 'uploads/', 'static/')
+
+_client = None
+_session = None
+_init_lock = threading.Lock()
+
+# (bucket, object path) -> (signed url, monotonic expiry time), oldest first
+_signed_urls = OrderedDict()
+_signed_urls_lock = threading.Lock()
+
+# operation -> {'latency': LatencyHistogram, 'errors': int} (read by utils/metrics.py)
+_call_stats = {}
+_call_stats_lock = threading.Lock()
+
+def _storage_credentials():
     """
-    Create and return a Supabase client instance.
+    Read the Supabase URL and key from the environment.
     
     Returns:
-        Client: Supabase client instance
+        tuple: (url, key)
+        
+    Raises:
+        ValueError: If either is missing
     """
     url = os.environ.get("SUPABASE_URL")
     # Prefer Service Key for backend operations to bypass RLS, fall back to Anon Key
@@ -16,19 +59,410 @@ def get_supabase_client() -> Client:
     
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_KEY (or SUPABASE_SERVICE_KEY) must be set")
+    return url, key
+
+def storage_timeout():
+    """Return the (connect, read) timeout used for storage requests."""
+    return (STORAGE_CONNECT_TIMEOUT, STORAGE_READ_TIMEOUT)
+
+def get_supabase_client():
+    """
+    Return the process-wide Supabase client, creating it on first use.
+    
+    The supabase package is imported here rather than at module load: it is
+    slow to import and the application itself does not need it (all storage
+    calls go through get_http_session()); it is kept for scripts and
+    debugging.
+    
+    Returns:
+        Client: Supabase client instance
+    """
+    global _client
+    if _client is None:
+        url, key = _storage_credentials()
+        with _init_lock:
+            if _client is None:
+                from supabase import create_client
+                _client = create_client(url, key)
+    return _client
+
+def _storage_operation(method: str, url: str) -> str:
+    """Name the storage operation an HTTP request performs, for the call statistics."""
+    if "/object/upload/sign/" in url:
+        return "upload_url"
+    if "/object/sign/" in url:
+        return "sign"
+    if "/storage/v1/bucket/" in url:
+        return "probe"
+    if method.upper() == "GET":
+        return "download"
+    if method.upper() in ("POST", "PUT"):
+        return "upload"
+    return method.lower()
+
+def _record_storage_call(operation: str, seconds: float, failed: bool) -> None:
+    from utils.instrumentation import LatencyHistogram
+    with _call_stats_lock:
+        stats = _call_stats.get(operation)
+        if stats is None:
+            stats = _call_stats[operation] = {'latency': LatencyHistogram(), 'errors': 0}
+        stats['latency'].observe(seconds)
+        if failed:
+            stats['errors'] += 1
+
+def storage_call_stats() -> dict:
+    """
+    Latency and error counts of the storage calls made by this process.
+    
+    Returns:
+        dict: operation ('sign', 'upload', 'upload_url', 'download', 'delete', 'probe')
+        -> {'latency': histogram snapshot, 'errors': failed calls}. A call
+        failed if it raised or returned a 4xx/5xx status after retries.
+    """
+    with _call_stats_lock:
+        return {
+            operation: {'latency': stats['latency'].snapshot(), 'errors': stats['errors']}
+            for operation, stats in _call_stats.items()
+        }
+
+def storage_pool_size():
+    """
+    Number of keep-alive connections to keep per storage host.
+
+    Defaults to enough for every export download thread that may run at once
+    (EXPORT_MAX_WORKERS per export, EXPORT_MAX_CONCURRENT exports) plus
+    STORAGE_POOL_HEADROOM, so urllib3 never discards connections with
+    "Connection pool is full". STORAGE_POOL_SIZE overrides it.
+
+    Returns:
+        int: Pool size
+    """
+    if STORAGE_POOL_SIZE:
+        return STORAGE_POOL_SIZE
+    from utils.export import EXPORT_MAX_WORKERS, EXPORT_MAX_CONCURRENT
+    return EXPORT_MAX_WORKERS * EXPORT_MAX_CONCURRENT + STORAGE_POOL_HEADROOM
+
+
+def get_http_session():
+    """
+    Return the process-wide HTTP session used for direct storage requests.
+    
+    The session keeps connections to the storage host alive between calls
+    (so TLS is negotiated once per pooled connection, not per request) and
+    retries with backoff: connection errors for every method, read errors
+    and 429/5xx responses for idempotent methods (GET, PUT, DELETE...). Bucket
+    metadata requests (readiness probes, see probe_bucket) get their own
+    small pool without retries, so a failing probe reports promptly.
+    
+    Returns:
+        requests.Session: Shared session
+    """
+    global _session
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                
+                retry = Retry(
+                    total=STORAGE_MAX_RETRIES,
+                    backoff_factor=STORAGE_RETRY_BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    # Read errors and retry statuses only repeat idempotent methods;
+                    # a POST (signing, upload URLs, uploads) is retried only when
+                    # the connection failed before the request was sent
+                    allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                    raise_on_status=False
+                )
+                class TimedSession(requests.Session):
+                    # Every storage call (including its retries) is timed for storage_call_stats()
+                    def request(self, method, url, *args, **kwargs):
+                        started = time.perf_counter()
+                        failed = True
+                        try:
+                            response = super().request(method, url, *args, **kwargs)
+                            failed = response.status_code >= 400
+                            return response
+                        finally:
+                            _record_storage_call(_storage_operation(method, url), time.perf_counter() - started, failed)
+                
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=storage_pool_size(), max_retries=retry)
+                session = TimedSession()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                try:
+                    url, _ = _storage_credentials()
+                except ValueError:
+                    url = None
+                if url:
+                    # Longer prefixes win, so probes bypass the retrying adapter
+                    session.mount(f"{url}/storage/v1/bucket/", HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+                _session = session
+    return _session
+
+def probe_bucket(bucket: str = "opg-images", timeout=None) -> None:
+    """
+    Fetch a bucket's metadata through the shared session, without retries.
+    
+    Used by the readiness check. Reading bucket metadata needs a key that
+    can list buckets (the service key); an anon key is refused with 4xx.
+    
+    Args:
+        bucket (str): Storage bucket name
+        timeout: (connect, read) timeout; defaults to storage_timeout()
+        
+    Raises:
+        requests.RequestException: If the request fails or returns 4xx/5xx
+    """
+    url, key = _storage_credentials()
+    response = get_http_session().get(
+        f"{url}/storage/v1/bucket/{bucket}",
+        headers={"Authorization": f"Bearer {key}"},
+        timeout=timeout or storage_timeout()
+    )
+    response.raise_for_status()
+
+def put_object(path: str, content: bytes, content_type: str, bucket: str = "opg-images") -> None:
+    """
+    Upload raw bytes to Supabase storage, overwriting any existing object.
+    
+    Args:
+        path (str): Object path inside the bucket
+        content (bytes): Data to upload
+        content_type (str): MIME type sent with the object
+        bucket (str): Storage bucket name
+        
+    Raises:
+        Exception: If the upload fails
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    url, key = _storage_credentials()
+    storage_url = f"{url}/storage/v1/object/{bucket}/{path}"
+    
+    headers = {
+        "Authorization": f"Bearer {key}",
+        "Content-Type": content_type,
+        "x-upsert": "true"  # Force overwrite if file exists
+    }
+    
+    logger.info(f"Uploading via direct HTTP to: {storage_url.split('?')[0]}")
+    
+    # The session retries connection errors only: a POST is not idempotent
+    try:
+        response = get_http_session().post(
+            storage_url,
+            data=content,
+            headers=headers,
+            timeout=storage_timeout()
+        )
+    except Exception as e:
+        logger.error(f"HTTP Upload failed: {str(e)}")
+        raise
+    
+    if response.status_code in (200, 201):
+        logger.info(f"Upload successful. Status: {response.status_code}")
+        return
+    elif response.status_code == 409:
+        # If it exists, we can treat as success
+        logger.warning("File already exists (409). Treating as success/overwrite.")
+        return
+    
+    logger.error(f"Upload failed with status {response.status_code}: {response.text}")
+    raise Exception(f"Upload failed: {response.text}")
+
+def object_path_from_url(link: str, bucket: str = "opg-images"):
+    """
+    Extract the storage object path from a Supabase public or signed URL.
+    
+    Args:
+        link (str): URL stored in Patient.opg_link
+        bucket (str): Storage bucket name
+        
+    Returns:
+        str: Object path inside the bucket, or None if the link is not a
+        Supabase storage URL for this bucket
+    """
+    if not link:
+        return None
+    path_part = link.split('?')[0]
+    marker = f"/{bucket}/"
+    if '/storage/v1/object/' not in path_part or marker not in path_part:
+        return None
+    from urllib.parse import unquote
+    return unquote(path_part.split(marker, 1)[1])
+
+def is_local_opg(opg_link: str) -> bool:
+    """
+    Check whether a Patient.opg_link value points at a file on local disk.
+    
+    Args:
+        opg_link (str): Value of Patient.opg_link
+        
+    Returns:
+        bool: True for legacy local upload paths
+    """
+    return bool(opg_link) and not opg_link.startswith(('http://', 'https://')) and opg_link.startswith(LOCAL_OPG_PREFIXES)
+
+def opg_object_path(opg_link: str, bucket: str = "opg-images"):
+    """
+    Return the storage object path referenced by a Patient.opg_link value.
+    
+    New uploads store the bare object path; older rows hold a signed or
+    public Supabase URL, which is mapped back to its path.
+    
+    Args:
+        opg_link (str): Value of Patient.opg_link
+        bucket (str): Storage bucket name
+        
+    Returns:
+        str: Object path inside the bucket, or None for external URLs,
+        local files and empty values
+    """
+    if not opg_link:
+        return None
+    if opg_link.startswith(('http://', 'https://')):
+        return object_path_from_url(opg_link, bucket)
+    if is_local_opg(opg_link):
+        return None
+    return opg_link
+
+def _absolute_storage_url(base_url: str, url: str) -> str:
+    """Turn a storage API relative URL (/object/... or /storage/v1/...) into an absolute one."""
+    if url.startswith('/storage/v1'):
+        return f"{base_url}{url}"
+    if url.startswith('/object'):
+        return f"{base_url}/storage/v1{url}"
+    # If it's already absolute, leave it as-is
+    return url
+
+def _evict_signed_urls(now: float) -> None:
+    """Drop expired entries, then the oldest ones, until the cache fits. Caller holds the lock."""
+    if len(_signed_urls) <= SIGNED_URL_CACHE_SIZE:
+        return
+    for cache_key in [k for k, (_, expires_at) in _signed_urls.items() if expires_at - now <= SIGNED_URL_MIN_REMAINING]:
+        del _signed_urls[cache_key]
+    while len(_signed_urls) > SIGNED_URL_CACHE_SIZE:
+        _signed_urls.popitem(last=False)
+
+def create_signed_urls(paths, expires_in: int = SIGNED_URL_EXPIRES_IN, bucket: str = "opg-images") -> dict:
+    """
+    Create signed URLs for many objects with a single storage API call.
+    
+    URLs are cached in memory and reused until they are close to expiry,
+    so only paths without a usable cached URL are sent to the API.
+    
+    Args:
+        paths (iterable): Object paths inside the bucket
+        expires_in (int): Lifetime of newly signed URLs in seconds
+        bucket (str): Storage bucket name
+        
+    Returns:
+        dict: Mapping of object path -> signed URL (paths that could not be
+        signed are left out)
+        
+    Raises:
+        Exception: If the signing request fails
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    now = time.monotonic()
+    signed = {}
+    missing = []
+    with _signed_urls_lock:
+        for path in dict.fromkeys(paths):
+            cached = _signed_urls.get((bucket, path))
+            if cached and cached[1] - now > SIGNED_URL_MIN_REMAINING:
+                signed[path] = cached[0]
+            else:
+                missing.append(path)
+    
+    if not missing:
+        return signed
     
-    return create_client(url, key)
+    url, key = _storage_credentials()
+    headers = {
+        "Authorization": f"Bearer {key}",
+        "Content-Type": "application/json"
+    }
+    response = get_http_session().post(
+        f"{url}/storage/v1/object/sign/{bucket}",
+        headers=headers,
+        json={"expiresIn": expires_in, "paths": missing},
+        timeout=storage_timeout()
+    )
+    if not response.ok:
+        raise Exception(f"Signing failed with status {response.status_code}: {response.text}")
+    
+    expires_at = now + expires_in
+    with _signed_urls_lock:
+        for item in response.json():
+            signed_url = item.get("signedURL") or item.get("signedUrl")
+            if item.get("error") or not signed_url:
+                logger.warning(f"Could not sign {item.get('path')}: {item.get('error')}")
+                continue
+            signed_url = _absolute_storage_url(url, signed_url)
+            signed[item["path"]] = signed_url
+            _signed_urls[(bucket, item["path"])] = (signed_url, expires_at)
+            _signed_urls.move_to_end((bucket, item["path"]))
+        _evict_signed_urls(now)
+    
+    return signed
 
-def upload_image(file, filename: str) -> str:
+def opg_display_urls(opg_links, bucket: str = "opg-images") -> dict:
     """
-    Upload an OPG image to Supabase storage and return the public URL.
+    Resolve Patient.opg_link values to URLs a browser can load.
+    
+    Every stored object in the list is signed with one batched call;
+    external links and local paths are passed through unchanged.
+    
+    Args:
+        opg_links (iterable): Patient.opg_link values for a page of rows
+        bucket (str): Storage bucket name
+        
+    Returns:
+        dict: Mapping of opg_link -> URL
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    links = {link for link in opg_links if link}
+    urls = {link: link for link in links}
+    paths = {}
+    for link in links:
+        path = opg_object_path(link, bucket)
+        if path:
+            paths.setdefault(path, []).append(link)
+    
+    if paths:
+        try:
+            for path, signed_url in create_signed_urls(paths, bucket=bucket).items():
+                for link in paths.get(path, ()):
+                    urls[link] = signed_url
+        except Exception as e:
+            # Legacy rows still hold a (possibly valid) URL; bare paths will not load
+            logger.error(f"Failed to sign OPG URLs: {e}")
+    return urls
+
+def upload_image(file, filename: str, thumbnails=None) -> str:
+    """
+    Upload an OPG image to Supabase storage and return its object path.
+    
+    The path is what gets stored in Patient.opg_link; browser URLs are
+    signed on demand when a page is rendered (see opg_display_urls).
     
     Args:
         file: File object to upload
         filename (str): Name to give the file in storage
+        thumbnails (list): If given, the thumbnail entry is appended here for
+            the caller to record (utils.thumbnails.record_thumbnails) instead
+            of being indexed straight away
         
     Returns:
-        str: Public URL of the uploaded file
+        str: Object path of the uploaded file inside the bucket
         
     Raises:
         Exception: If upload fails
@@ -39,17 +473,7 @@ def upload_image(file, filename: str) -> str:
     try:
         logger.info(f"Starting upload for file: {filename}")
         
-        # Get Supabase client (only used for generating signed URL later if needed, or we can just use env vars)
-        # We need url and key for direct HTTP request
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("SUPABASE_KEY")
-        
-        if not url or not key:
-             raise ValueError("SUPABASE_URL and SUPABASE_KEY (or SUPABASE_SERVICE_KEY) must be set")
-
-        supabase = get_supabase_client()
         bucket = "opg-images"
-        logger.info(f"Supabase client initialized, bucket: {bucket}")
         
         # Reset file pointer to beginning
         file.seek(0)
@@ -58,103 +482,20 @@ def upload_image(file, filename: str) -> str:
         
         # Upload file to Supabase Storage using direct HTTP request to avoid SDK issues
         # The SDK (storage3) seems to have issues with file handling on Vercel (Errno 16 Busy)
-        import requests
-        
-        project_id = url.split("://")[1].split(".")[0]
-        storage_url = f"{url}/storage/v1/object/{bucket}/{filename}"
-        
-        headers = {
-            "Authorization": f"Bearer {key}",
-            "Content-Type": file.content_type,
-            "x-upsert": "true"  # Force overwrite if file exists
-        }
-        
-        logger.info(f"Uploading via direct HTTP to: {storage_url.split('?')[0]}")
+        put_object(filename, file_content, file.content_type, bucket=bucket)
         
-        # Retry logic for HTTP request
-        max_retries = 3
-        retry_delay = 1
-        
-        import time
-        
-        for attempt in range(max_retries):
+        # Keep a small derivative next to the original so list views and
+        # exports never have to download and decode the full-size OPG
+        if (file.content_type or '').startswith('image/'):
             try:
-                response = requests.post(
-                    storage_url,
-                    data=file_content,
-                    headers=headers,
-                    timeout=30 
-                )
-                
-                if response.status_code in (200, 201):
-                    logger.info(f"Upload successful. Status: {response.status_code}")
-                    break
-                elif response.status_code == 409:
-                    logger.warning("File already exists (409). Treating as success/overwrite.")
-                    # If we want to overwrite, we should use UPSERT or just accept it's there
-                    # Supabase storage default is often not upsert unless specified. 
-                    # But for now, if it exists, we can treat as success.
-                    # Or better: let's try to UPSERT by adding x-upsert header if needed, 
-                    # but simple upload is fine. If 409, it means it's there.
-                    break
-                else:
-                    logger.error(f"Upload failed with status {response.status_code}: {response.text}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        raise Exception(f"Upload failed: {response.text}")
-                        
-            except Exception as e:
-                logger.error(f"HTTP Upload attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    raise e
+                from utils.thumbnails import store_thumbnail
+                _, entry = store_thumbnail(filename, file_content, record=thumbnails is None)
+                if entry and thumbnails is not None:
+                    thumbnails.append(entry)
+            except Exception as thumb_error:
+                logger.warning(f"Thumbnail generation failed for {filename}: {thumb_error}")
         
-        # Generate signed URL that expires in 1 year (for permanent access)
-        # This is needed when RLS (Row Level Security) is enabled
-        try:
-            logger.info("Generating signed URL for uploaded file")
-            expiry_time = 365 * 24 * 60 * 60  # 1 year in seconds
-            signed_url_response = supabase.storage.from_(bucket).create_signed_url(filename, expiry_time)
-            logger.info(f"Signed URL response type: {type(signed_url_response)}")
-            logger.info(f"Signed URL response: {signed_url_response}")
-            
-            # Extract the signed URL from the response
-            signed_url = None
-            if isinstance(signed_url_response, dict):
-                # Try different possible keys
-                signed_url = (signed_url_response.get("signedURL") or 
-                             signed_url_response.get("signedUrl") or
-                             signed_url_response.get("signed_url") or
-                             signed_url_response.get("url"))
-                logger.info(f"Extracted signed URL from dict: {signed_url}")
-            elif isinstance(signed_url_response, str):
-                signed_url = signed_url_response
-                logger.info(f"Signed URL is string: {signed_url}")
-            
-            if signed_url:
-                logger.info(f"Successfully generated signed URL for {filename}")
-                return signed_url
-            else:
-                logger.warning(f"Could not extract signed URL from response, falling back to public URL")
-                # Fallback to public URL
-                public_url = supabase.storage.from_(bucket).get_public_url(filename)
-                logger.info(f"Generated public URL: {public_url}")
-                return public_url
-                
-        except Exception as url_error:
-            logger.error(f"Failed to generate signed URL: {str(url_error)}")
-            logger.error(f"Attempting fallback to public URL")
-            try:
-                public_url = supabase.storage.from_(bucket).get_public_url(filename)
-                logger.info(f"Fallback public URL generated: {public_url}")
-                return public_url
-            except Exception as public_url_error:
-                logger.error(f"Failed to generate public URL: {str(public_url_error)}")
-                raise Exception(f"Failed to generate URL for uploaded file: {str(url_error)}")
+        return filename
         
     except Exception as e:
         logger.error(f"Upload process failed: {str(e)}")
@@ -167,6 +508,9 @@ def delete_image(filename: str) -> bool:
     """
     Delete an OPG image from Supabase storage.
     
+    Goes through the shared session like every other storage call, so it
+    reuses pooled connections and is timed as 'delete' in storage_call_stats.
+    
     Args:
         filename (str): Name of the file to delete
         
@@ -176,32 +520,30 @@ def delete_image(filename: str) -> bool:
     Raises:
         Exception: If deletion fails
     """
+    bucket = "opg-images"
     try:
-        supabase = get_supabase_client()
-        bucket = "opg-images"
-        
-        # Delete file
-        res = supabase.storage.from_(bucket).remove([filename])
-        
-        # Check for errors
-        if hasattr(res, 'error') and res.error:
-            raise Exception(f"Deletion failed: {res.error}")
-            
+        url, key = _storage_credentials()
+        response = get_http_session().delete(
+            f"{url}/storage/v1/object/{bucket}",
+            headers={
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json"
+            },
+            json={"prefixes": [filename]},
+            timeout=storage_timeout()
+        )
+        if not response.ok:
+            raise Exception(f"Deletion failed with status {response.status_code}: {response.text}")
         return True
         
     except Exception as e:
         raise Exception(f"Failed to delete image from Supabase: {str(e)}")
 
 def generate_upload_url(filename: str) -> dict:
-    import requests
     import logging
     logger = logging.getLogger(__name__)
     
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("SUPABASE_KEY")
-    
-    if not url or not key:
-        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
+    url, key = _storage_credentials()
         
     # Appending a UUID to ensure unique temporary files
     secure_name = f"temp/{uuid.uuid4().hex}_{filename}"
@@ -215,7 +557,7 @@ def generate_upload_url(filename: str) -> dict:
     }
     
     try:
-        response = requests.post(api_url, headers=headers, json={})
+        response = get_http_session().post(api_url, headers=headers, json={}, timeout=storage_timeout())
         if not response.ok:
             error_msg = f"Supabase API returned {response.status_code}: {response.text}"
             logger.error(error_msg)
@@ -228,11 +570,7 @@ def generate_upload_url(filename: str) -> dict:
         # /storage/v1/object/upload/sign/... — normalize it to include /storage/v1/
         upload_url = data.get('url') or data.get('signedURL') or data.get('signed_url')
         if upload_url:
-            if upload_url.startswith('/storage/v1'):
-                upload_url = f"{url}{upload_url}"
-            elif upload_url.startswith('/object'):
-                upload_url = f"{url}/storage/v1{upload_url}"
-            # If it's already absolute, leave it as-is
+            upload_url = _absolute_storage_url(url, upload_url)
         
         # Also expose the token separately so the frontend can build its own URL if needed
         token = data.get('token')
@@ -249,15 +587,10 @@ def generate_upload_url(filename: str) -> dict:
         raise
 
 def download_file(path: str) -> bytes:
-    import requests
     import logging
     logger = logging.getLogger(__name__)
 
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("SUPABASE_KEY")
-
-    if not url or not key:
-         raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
+    url, key = _storage_credentials()
 
     bucket = "opg-images"
     # Using Service Key allows us to download from a private bucket directly
@@ -268,7 +601,7 @@ def download_file(path: str) -> bytes:
     }
 
     try:
-        response = requests.get(download_url, headers=headers)
+        response = get_http_session().get(download_url, headers=headers, timeout=storage_timeout())
         response.raise_for_status()
         return response.content
     except Exception as e:
@@ -0,0 +1,365 @@
+"""
+OPG thumbnail derivative store.
+
+Thumbnails are generated once per image, when the OPG is uploaded through
+utils.storage.upload_image (or lazily the first time an older image is
+requested), and kept in three places:
+
+- the storage bucket, under thumbnails/<object path>_<content hash>.jpg
+- the opg_thumbnail table, which maps an OPG object path to its thumbnail
+- a local disk cache keyed by content hash, so repeat reads on the same
+  instance never touch the network
+
+Exports and list templates read thumbnails from here instead of downloading
+and decoding the full-size image every time.
+"""
+
+import os
+import hashlib
+import logging
+import mimetypes
+import tempfile
+import threading
+from io import BytesIO
+from datetime import datetime
+
+from flask import has_app_context
+from sqlalchemy import select
+
+from models import db, OpgThumbnail
+
+logger = logging.getLogger(__name__)
+
+# Bounding box of generated thumbnails (matches the Excel export)
+THUMBNAIL_SIZE = (300, 300)
+THUMBNAIL_QUALITY = 85
+
+# Prefix for thumbnail objects inside the OPG bucket
+THUMBNAIL_PREFIX = 'thumbnails'
+
+# Local disk cache of thumbnail bytes, keyed by content hash
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'opg_thumbnails')
+
+
+def thumbnail_source_key(opg_link):
+    """
+    Return the key an OPG is indexed under in the derivative store.
+
+    Args:
+        opg_link (str): Value of Patient.opg_link.
+
+    Returns:
+        str: Storage object path for stored OPGs (bare paths and legacy
+        Supabase URLs), otherwise the link itself (external URLs), or None
+        if there is no link.
+    """
+    if not opg_link:
+        return None
+    from utils.storage import opg_object_path
+    return opg_object_path(opg_link) or opg_link
+
+
+def thumbnail_path_for(object_path, content_hash):
+    """
+    Build the storage path of the thumbnail for an original image.
+
+    Args:
+        object_path (str): Source key of the original OPG.
+        content_hash (str): SHA-256 hex digest of the original bytes.
+
+    Returns:
+        str: Object path of the thumbnail inside the bucket.
+    """
+    if '://' in object_path:
+        # External URL: use a digest so the key is a valid object path
+        stem = 'external/' + hashlib.sha1(object_path.encode('utf-8')).hexdigest()
+    else:
+        stem = object_path.rsplit('.', 1)[0]
+    return f"{THUMBNAIL_PREFIX}/{stem}_{content_hash[:16]}.jpg"
+
+
+def make_thumbnail(content):
+    """
+    Shrink an image to a JPEG thumbnail.
+
+    Args:
+        content (bytes): Original image bytes.
+
+    Returns:
+        tuple: (jpeg_bytes, width, height)
+    """
+    from PIL import Image as PILImage
+
+    with PILImage.open(BytesIO(content)) as pil_img:
+        if pil_img.mode in ('RGBA', 'P', 'LA', 'I;16', 'I', 'F'):
+            pil_img = pil_img.convert('RGB')
+        pil_img.thumbnail(THUMBNAIL_SIZE)
+
+        output = BytesIO()
+        pil_img.save(output, format='JPEG', quality=THUMBNAIL_QUALITY)
+        return output.getvalue(), pil_img.width, pil_img.height
+
+
+def _cache_file(content_hash):
+    return os.path.join(THUMBNAIL_CACHE_DIR, f"{content_hash}.jpg")
+
+
+def _read_cache(content_hash):
+    try:
+        with open(_cache_file(content_hash), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_cache(content_hash, data):
+    try:
+        os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+        path = _cache_file(content_hash)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write thumbnail cache for {content_hash[:12]}: {e}")
+
+
+def store_thumbnail(object_path, content, record=True):
+    """
+    Generate a thumbnail for an original image and persist it.
+
+    The thumbnail is uploaded to the bucket, written to the local cache and,
+    when record is True and an app context is available, indexed in the
+    opg_thumbnail table.
+
+    Args:
+        object_path (str): Source key of the original OPG.
+        content (bytes): Original image bytes.
+        record (bool): Whether to write the index row immediately.
+
+    Returns:
+        tuple: (thumbnail_bytes, entry) where entry is a dict describing the
+        stored derivative, or None if it could not be uploaded.
+    """
+    from utils.storage import put_object
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    thumb_bytes, width, height = make_thumbnail(content)
+    _write_cache(content_hash, thumb_bytes)
+
+    thumb_path = thumbnail_path_for(object_path, content_hash)
+    try:
+        put_object(thumb_path, thumb_bytes, 'image/jpeg')
+    except Exception as e:
+        logger.warning(f"Thumbnail upload failed for {object_path}: {e}")
+        return thumb_bytes, None
+
+    entry = {
+        'object_path': object_path,
+        'content_hash': content_hash,
+        'thumb_path': thumb_path,
+        'width': width,
+        'height': height,
+    }
+    if record and has_app_context():
+        record_thumbnail(entry)
+    return thumb_bytes, entry
+
+
+def record_thumbnail(entry):
+    """
+    Insert or replace the index row for a stored thumbnail.
+
+    Uses its own short transaction so it never commits (or rolls back) work
+    pending in the caller's session, and is safe to call from worker threads
+    that have pushed an app context.
+
+    Args:
+        entry (dict): Entry returned by store_thumbnail.
+    """
+    record_thumbnails([entry])
+
+
+def record_thumbnails(entries):
+    """
+    Insert or replace the index rows for many stored thumbnails in one transaction.
+
+    Args:
+        entries (list): Entries returned by store_thumbnail.
+    """
+    # Patients sharing an image yield the same entry more than once
+    entries = {entry['object_path']: entry for entry in entries}
+    if not entries:
+        return
+    table = OpgThumbnail.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.object_path.in_(list(entries))))
+        conn.execute(table.insert(), [dict(entry, created_at=now) for entry in entries.values()])
+
+
+def delete_thumbnail(object_path):
+    """
+    Remove the thumbnail of an original image that is being deleted or replaced.
+
+    Deletes the index row in the caller's transaction (the caller commits),
+    the thumbnail object in the bucket, and the local cache file unless
+    another indexed image has the same content.
+
+    Args:
+        object_path (str): Source key of the original OPG (see thumbnail_source_key).
+
+    Returns:
+        bool: True if a thumbnail was indexed for the image.
+    """
+    if not object_path:
+        return False
+    row = OpgThumbnail.query.filter_by(object_path=object_path).first()
+    if row is None:
+        return False
+    thumb_path, content_hash = row.thumb_path, row.content_hash
+    db.session.delete(row)
+    db.session.flush()
+
+    shared = db.session.execute(
+        select(OpgThumbnail.object_path).where(OpgThumbnail.content_hash == content_hash).limit(1)
+    ).first()
+    if shared is None:
+        try:
+            os.remove(_cache_file(content_hash))
+        except OSError:
+            pass
+
+    try:
+        from utils.storage import delete_image
+        delete_image(thumb_path)
+    except Exception as e:
+        logger.warning(f"Could not delete thumbnail {thumb_path}: {e}")
+    return True
+
+
+def thumbnail_entries(opg_links):
+    """
+    Look up the index rows for many OPG links with a single query.
+
+    Args:
+        opg_links (iterable): Patient.opg_link values.
+
+    Returns:
+        dict: Mapping of opg_link -> entry dict for links that have a thumbnail.
+    """
+    keys = {}
+    for link in opg_links:
+        key = thumbnail_source_key(link)
+        if key:
+            keys[key] = link
+    if not keys:
+        return {}
+
+    rows = OpgThumbnail.query.filter(OpgThumbnail.object_path.in_(list(keys))).all()
+    return {
+        keys[row.object_path]: {
+            'object_path': row.object_path,
+            'content_hash': row.content_hash,
+            'thumb_path': row.thumb_path,
+            'width': row.width,
+            'height': row.height,
+        }
+        for row in rows
+    }
+
+
+def _download_original(opg_link, object_path):
+    """Fetch the full-size OPG, through the storage API when it lives in our bucket."""
+    from utils.storage import download_file, opg_object_path
+
+    if opg_object_path(opg_link):
+        return download_file(object_path)
+
+    import urllib.request
+    import ssl
+
+    # Create unverified SSL context
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+
+    with urllib.request.urlopen(opg_link, context=ctx, timeout=5) as response:
+        return response.read()
+
+
+def _original_content_type(object_path):
+    """Guess the content type of an original image from its path or URL."""
+    content_type, _ = mimetypes.guess_type(object_path.split('?', 1)[0])
+    return content_type or 'application/octet-stream'
+
+
+def _fetch(opg_link, entry):
+    """fetch_thumbnail, also returning the content type of the bytes."""
+    if entry:
+        data = _read_cache(entry['content_hash'])
+        if data:
+            return data, None, 'image/jpeg'
+        try:
+            from utils.storage import download_file
+            data = download_file(entry['thumb_path'])
+            _write_cache(entry['content_hash'], data)
+            return data, None, 'image/jpeg'
+        except Exception as e:
+            logger.warning(f"Stored thumbnail missing for {entry['object_path']}, regenerating: {e}")
+
+    object_path = thumbnail_source_key(opg_link)
+    try:
+        content = _download_original(opg_link, object_path)
+    except Exception as e:
+        logger.error(f"Failed to download image for thumbnail {object_path[:60]}: {e}")
+        return None, None, None
+
+    try:
+        data, new_entry = store_thumbnail(object_path, content, record=False)
+        return data, new_entry, 'image/jpeg'
+    except Exception as e:
+        # Not a decodable image; hand back the original bytes as the old export did
+        logger.warning(f"Could not build thumbnail for {object_path[:60]}: {e}")
+        return content, None, _original_content_type(object_path)
+
+
+def fetch_thumbnail(opg_link, entry=None):
+    """
+    Return thumbnail bytes for an OPG, generating the derivative on a miss.
+
+    Does not touch the database, so it can run on worker threads; new
+    derivatives are returned to the caller to be recorded. If the original
+    cannot be decoded its bytes are returned instead of a thumbnail.
+
+    Args:
+        opg_link (str): Value of Patient.opg_link (object path or http link).
+        entry (dict): Index entry from thumbnail_entries, if one exists.
+
+    Returns:
+        tuple: (thumbnail_bytes or None, new_entry or None)
+    """
+    data, new_entry, _ = _fetch(opg_link, entry)
+    return data, new_entry
+
+
+def get_thumbnail(opg_link):
+    """
+    Return thumbnail bytes for a single OPG, recording any new derivative.
+
+    Must be called inside an application context.
+
+    Args:
+        opg_link (str): Value of Patient.opg_link.
+
+    Returns:
+        tuple: (bytes or None, content_hash or None, content_type or None);
+        content_type is image/jpeg for thumbnails and the original's type
+        when the image could not be thumbnailed.
+    """
+    entry = thumbnail_entries([opg_link]).get(opg_link)
+    data, new_entry, content_type = _fetch(opg_link, entry)
+    if new_entry:
+        record_thumbnail(new_entry)
+        entry = new_entry
+    return data, entry['content_hash'] if entry else None, content_type
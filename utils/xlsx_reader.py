@@ -0,0 +1,294 @@
+"""
+Single-pass xlsx reader for patient imports.
+
+openpyxl returns either formulas (data_only=False) or cached values
+(data_only=True) for a load, so reading both used to mean loading the
+workbook twice. Both live in the same <c> element of the sheet XML, so this
+reader streams the active worksheet once with iterparse and yields each row
+with its cached values and its formula view side by side. Embedded image
+anchors are resolved from the drawing part up front; image bytes are only
+read from the archive when requested.
+
+Shared formulas are stored once, on the first cell of the range, and the
+other cells only carry the group index; the reader keeps each group's
+master formula and translates it to the dependent cell, like openpyxl.
+"""
+
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+from openpyxl.formula.translate import Translator
+from openpyxl.utils.cell import column_index_from_string, get_column_letter, range_boundaries
+
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _local(tag):
+    """Strip the namespace from an element tag."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _rel_id(elem, name='id'):
+    """Read an r:id / r:embed attribute regardless of the relationship namespace."""
+    value = elem.get(f'{{{REL_NS}}}{name}')
+    if value is None:
+        for key, val in elem.attrib.items():
+            if _local(key) == name and key.startswith('{'):
+                return val
+    return value
+
+
+def _cast_number(value):
+    """Convert a numeric cell string the same way openpyxl does."""
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def _split_ref(ref):
+    """Return the column index (1-based) of a cell reference like 'E12'."""
+    letters = ''.join(ch for ch in ref if ch.isalpha())
+    return column_index_from_string(letters)
+
+
+class EmbeddedImage:
+    """An image anchored in the worksheet; bytes are read lazily from the archive."""
+
+    def __init__(self, archive, path):
+        self._archive = archive
+        self.path = path
+        ext = posixpath.splitext(path)[1].lstrip('.').lower()
+        self.format = 'jpeg' if ext == 'jpg' else (ext or 'jpeg')
+
+    def data(self):
+        return self._archive.read(self.path)
+
+
+class XlsxSheetReader:
+    """
+    Stream the active worksheet of an xlsx file in one pass.
+
+    Usage:
+        with XlsxSheetReader(path_or_file) as reader:
+            for row_number, values, formulas in reader.iter_rows():
+                image = reader.images.get(row_number)
+
+    values holds the cached cell values (what data_only=True returns) and
+    formulas holds the formula text for formula cells (what data_only=False
+    returns, e.g. '=HYPERLINK("...")') and the cached value elsewhere.
+    """
+
+    def __init__(self, source):
+        self._archive = zipfile.ZipFile(source)
+        self._names = set(self._archive.namelist())
+        self.sheet_path = self._active_sheet_path()
+        self.shared_strings = self._load_shared_strings()
+        self.images = self._load_images()
+        self._shared_formulas = {}  # si -> (master formula, master cell ref)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._archive.close()
+
+    # -- package structure -------------------------------------------------
+
+    def _read_rels(self, part_path):
+        """Return {rel_id: (type, absolute target path)} for a part."""
+        folder, name = posixpath.split(part_path)
+        rels_path = posixpath.join(folder, '_rels', f'{name}.rels')
+        if rels_path not in self._names:
+            return {}
+
+        rels = {}
+        root = ET.fromstring(self._archive.read(rels_path))
+        for rel in root:
+            target = rel.get('Target', '')
+            if rel.get('TargetMode') == 'External':
+                continue
+            if target.startswith('/'):
+                resolved = target.lstrip('/')
+            else:
+                resolved = posixpath.normpath(posixpath.join(folder, target))
+            rels[rel.get('Id')] = (rel.get('Type', ''), resolved)
+        return rels
+
+    def _active_sheet_path(self):
+        workbook_path = 'xl/workbook.xml'
+        root = ET.fromstring(self._archive.read(workbook_path))
+
+        active_tab = 0
+        sheet_ids = []
+        for elem in root.iter():
+            tag = _local(elem.tag)
+            if tag == 'workbookView' and elem.get('activeTab'):
+                active_tab = int(elem.get('activeTab'))
+            elif tag == 'sheet':
+                sheet_ids.append(_rel_id(elem))
+
+        if not sheet_ids:
+            raise ValueError('Workbook contains no worksheets')
+        if active_tab >= len(sheet_ids):
+            active_tab = 0
+
+        rels = self._read_rels(workbook_path)
+        return rels[sheet_ids[active_tab]][1]
+
+    def _load_shared_strings(self):
+        path = 'xl/sharedStrings.xml'
+        if path not in self._names:
+            return []
+
+        strings = []
+        with self._archive.open(path) as f:
+            for _, elem in ET.iterparse(f):
+                if _local(elem.tag) == 'si':
+                    strings.append(''.join(t.text or '' for t in elem.iter() if _local(t.tag) == 't'))
+                    elem.clear()
+        return strings
+
+    def _load_images(self):
+        """Map 1-based row numbers to the image anchored in that row."""
+        images = {}
+        for rel_type, drawing_path in self._read_rels(self.sheet_path).values():
+            if not rel_type.endswith('/drawing') or drawing_path not in self._names:
+                continue
+
+            drawing_rels = self._read_rels(drawing_path)
+            root = ET.fromstring(self._archive.read(drawing_path))
+            for anchor in root:
+                if _local(anchor.tag) not in ('twoCellAnchor', 'oneCellAnchor'):
+                    continue
+
+                row = None
+                embed = None
+                for elem in anchor.iter():
+                    tag = _local(elem.tag)
+                    if tag == 'from' and row is None:
+                        for child in elem:
+                            if _local(child.tag) == 'row':
+                                row = int(child.text)
+                    elif tag == 'blip':
+                        embed = _rel_id(elem, 'embed')
+
+                if row is None or embed not in drawing_rels:
+                    continue
+                images[row + 1] = EmbeddedImage(self._archive, drawing_rels[embed][1])
+        return images
+
+    # -- cell data ----------------------------------------------------------
+
+    def _formula(self, elem, ref):
+        """Return the formula of an <f> element, expanding shared formulas."""
+        text = elem.text
+        if elem.get('t') != 'shared' or elem.get('si') is None:
+            return '=' + text if text else None
+
+        si = elem.get('si')
+        if text:
+            # Master cell: remember it for the dependents of the group
+            formula = '=' + text
+            self._shared_formulas[si] = (formula, ref)
+            return formula
+
+        master = self._shared_formulas.get(si)
+        if master is None or not ref:
+            return None
+        formula, origin = master
+        return Translator(formula, origin=origin).translate_formula(ref)
+
+    def _cell_value(self, cell, ref=None):
+        cell_type = cell.get('t', 'n')
+        value = None
+        formula = None
+
+        for child in cell:
+            tag = _local(child.tag)
+            if tag == 'v':
+                value = child.text
+            elif tag == 'f':
+                formula = self._formula(child, ref)
+            elif tag == 'is':
+                value = ''.join(t.text or '' for t in child.iter() if _local(t.tag) == 't')
+
+        if value is not None:
+            if cell_type == 's':
+                value = self.shared_strings[int(value)]
+            elif cell_type == 'b':
+                value = bool(int(value))
+            elif cell_type == 'n':
+                value = _cast_number(value)
+
+        return value, formula
+
+    def iter_rows(self):
+        """
+        Yield the rows of the active sheet from the first to the last non-empty row.
+
+        Like openpyxl's iter_rows, empty rows in between are yielded as
+        all-None rows and every row is padded to the sheet width, so row
+        counts and column-count checks match a loaded workbook.
+
+        Yields:
+            tuple: (row_number, values, formulas)
+        """
+        width = 0
+        next_row = 1
+        last_yielded = None
+        sheet_data = None
+
+        with self._archive.open(self.sheet_path) as f:
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                tag = _local(elem.tag)
+
+                if event == 'start':
+                    if tag == 'sheetData':
+                        sheet_data = elem
+                    continue
+
+                if tag == 'dimension':
+                    ref = elem.get('ref', '')
+                    if ':' in ref:
+                        width = max(width, range_boundaries(ref)[2] or 0)
+                    continue
+
+                if tag != 'row':
+                    continue
+
+                row_number = int(elem.get('r') or next_row)
+                next_row = row_number + 1
+
+                cells = {}
+                col = 0
+                for cell in elem:
+                    if _local(cell.tag) != 'c':
+                        continue
+                    ref = cell.get('r')
+                    col = _split_ref(ref) if ref else col + 1
+                    if not ref:
+                        ref = f'{get_column_letter(col)}{row_number}'
+                    cells[col] = self._cell_value(cell, ref)
+                # Drop parsed rows so memory does not grow with the sheet
+                if sheet_data is not None:
+                    sheet_data.clear()
+
+                if not cells:
+                    continue
+
+                width = max(width, max(cells))
+                if last_yielded is not None:
+                    empty = (None,) * width
+                    for gap in range(last_yielded + 1, row_number):
+                        yield gap, empty, empty
+                last_yielded = row_number
+
+                values = tuple(cells[c][0] if c in cells else None for c in range(1, width + 1))
+                formulas = tuple(
+                    (cells[c][1] or cells[c][0]) if c in cells else None for c in range(1, width + 1)
+                )
+                yield row_number, values, formulas